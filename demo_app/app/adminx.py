@@ -1,4 +1,5 @@
 from __future__ import absolute_import
+from django.db.models import Count
 import xadmin
 from xadmin import views
 from .models import IDC, Host, MaintainLog, HostGroup, AccessRecord
@@ -48,7 +49,7 @@ class MaintainInline(object):
 
 @xadmin.sites.register(IDC)
 class IDCAdmin(object):
-    list_display = ("name", "description", "create_time", "contact", "telphone", "address", "customer_id")
+    list_display = ("name", "description", "create_time", "contact", "telphone", "address", "customer_id", "host_count")
     list_display_links = ("name",)
     wizard_form_list = [
         ("First's Form", ("name", "description")),
@@ -68,6 +69,11 @@ class IDCAdmin(object):
     actions = [BatchChangeAction, ]
     batch_fields = ("contact", "description", "address", "customer_id")
 
+    def host_count(self, instance):
+        return instance.host_count
+    host_count.short_description = "Hosts"
+    host_count.expression = Count("host", distinct=True)
+
 
 @xadmin.sites.register(Host)
 class HostAdmin(object):
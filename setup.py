@@ -14,7 +14,7 @@ setup(
     license=open('LICENSE', encoding='utf-8').read(),
     url='http://www.xadmin.io',
     download_url='http://github.com/sshwsfc/django-xadmin/archive/master.zip',
-    packages=['xadmin', 'xadmin.migrations', 'xadmin.plugins', 'xadmin.templatetags', 'xadmin.views'],
+    packages=['xadmin', 'xadmin.management', 'xadmin.management.commands', 'xadmin.migrations', 'xadmin.plugins', 'xadmin.templatetags', 'xadmin.views'],
     include_package_data=True,
     install_requires=[
         'setuptools',
@@ -30,6 +30,8 @@ setup(
     extras_require={
         'Excel': ['xlwt', 'xlsxwriter'],
         'Reversion': ['django-reversion>=2.0.0'],
+        'Parquet': ['pyarrow'],
+        'Zstd': ['zstandard'],
     },
     zip_safe=False,
     keywords=['admin', 'django', 'xadmin', 'bootstrap'],
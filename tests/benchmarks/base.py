@@ -0,0 +1,59 @@
+"""
+Helpers for the standalone xadmin benchmarks, run them from the tests folder::
+
+    python -m benchmarks.result_items
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+
+TEST_ROOT = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+def setup_django(**options):
+    sys.path.insert(0, os.path.join(TEST_ROOT, os.pardir))
+
+    from django.conf import settings
+    if not settings.configured:
+        conf = {
+            'DEBUG': False,
+            'SECRET_KEY': 'abc123',
+            'DATABASES': {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+            'INSTALLED_APPS': [
+                'django.contrib.auth',
+                'django.contrib.contenttypes',
+                'django.contrib.sessions',
+                'django.contrib.messages',
+                'django.contrib.staticfiles',
+                'xadmin',
+                'crispy_forms',
+            ],
+            'STATIC_URL': '/static/',
+            # optional dependencies
+            'XADMIN_EXCLUDE_PLUGINS': ['importexport', 'xversion', 'themes'],
+            'TEMPLATES': [{
+                'BACKEND': 'django.template.backends.django.DjangoTemplates',
+                'APP_DIRS': True,
+            }],
+        }
+        conf.update(options)
+        settings.configure(**conf)
+
+    import django
+    django.setup()
+
+
+def timeit(func, number=1):
+    start = time.time()
+    for i in range(number):
+        func()
+    return (time.time() - start) / number
+
+
+def report(title, rows):
+    print(title)
+    print('-' * len(title))
+    for name, value in rows:
+        print('  %-40s %s' % (name, value))
+    print('')
@@ -0,0 +1,126 @@
+"""
+Time and peak memory of the change list exports of the users, by the number of
+exported rows. The streamed csv and the xlsx written in the constant memory
+mode of xlsxwriter stay flat while the json document grows with the rows,
+unlike the streamed ndjson and xml. The size of the exported files is the
+last column.
+
+The parallel exports are timed by the number of processes, on the largest
+size, the rows per second grow with the cores of the machine. They are run as
+the export jobs of the worker command, the only ones which fork.
+"""
+from __future__ import print_function
+import os
+import tempfile
+import tracemalloc
+
+from .base import setup_django, timeit, report
+
+SIZES = (1000, 4000)
+WORKERS = (1, 2, 4)
+
+urlpatterns = []
+
+
+def create_users(count):
+    from django.contrib.auth.models import User
+
+    User.objects.filter(is_superuser=False).delete()
+    User.objects.bulk_create([
+        User(username='user%d' % i, email='user%d@example.com' % i, first_name='First %d' % i,
+             last_name='Last %d' % i, is_staff=bool(i % 2))
+        for i in range(count)])
+
+
+def export(client, export_type):
+    # 'csv+gzip' is a compressed csv
+    export_type, _, compression = export_type.partition('+')
+    response = client.get('/xadmin/auth/user/', {'_do_': 'export', 'export_type': export_type, 'all': 'on',
+                                                 'export_compress': compression})
+    assert response.status_code == 200, response.status_code
+    length = 0
+    if response.streaming:
+        for chunk in response.streaming_content:
+            length += len(chunk)
+    else:
+        length = len(response.content)
+    response.close()
+    return length
+
+
+def export_job(user, export_type):
+    from xadmin.models import ExportJob
+    from xadmin.plugins.exportjob import export_to_file
+
+    job = ExportJob.objects.create(user=user, model='auth.user', file_type=export_type,
+                                   query='_do_=export&export_type=%s&all=on' % export_type)
+    try:
+        export_to_file(job, fork=True).close()
+    finally:
+        job.delete()
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    # the processes of the parallel exports read the same database
+    database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+    setup_django(ROOT_URLCONF=__name__, ALLOWED_HOSTS=['*'], MIDDLEWARE=[
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+    ], DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': database}})
+    try:
+        run()
+    finally:
+        os.remove(database)
+
+
+def run():
+    from django.conf.urls import include, url
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.test import Client
+    import xadmin
+    from xadmin.plugins.export import ExportPlugin, has_pyarrow, has_xlsxwriter, has_xlwt
+
+    xadmin.autodiscover()
+    urlpatterns.append(url(r'^xadmin/', include(xadmin.site.urls)))
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+    client = Client()
+    client.force_login(admin)
+
+    rows = []
+    for size in SIZES:
+        create_users(size)
+        export_types = ['csv', 'csv+gzip', 'json', 'ndjson', 'ndjson+gzip', 'xml'] + \
+            ['xlsx'] * has_xlsxwriter + ['xls'] * has_xlwt + ['parquet'] * has_pyarrow
+        for export_type in export_types:
+            seconds = timeit(lambda: export(client, export_type))
+            peak = peak_memory(lambda: export(client, export_type))
+            length = export(client, export_type)
+            rows.append(('%s, %d rows' % (export_type, size),
+                         '%8.0f rows/s %8.1f MB peak %8.0f KB' % (size / seconds, peak / 1024.0 / 1024,
+                                                                  length / 1024.0)))
+    report('export all', rows)
+
+    rows = []
+    ExportPlugin.export_parallel_rows = 0
+    for workers in WORKERS:
+        ExportPlugin.export_workers = workers
+        for export_type in ['csv', 'ndjson'] + ['xlsx'] * has_xlsxwriter + ['parquet'] * has_pyarrow:
+            seconds = timeit(lambda: export_job(admin, export_type))
+            rows.append(('%s, %d processes' % (export_type, workers), '%8.0f rows/s' % (SIZES[-1] / seconds)))
+    report('parallel export of %d rows' % SIZES[-1], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Time of the imports of the importexport plugin, by the number of rows, for
+new rows, changed rows and rows which didn't change. A batch size of 0 is the
+import row by row of django-import-export, the batches read the existing rows
+at once and write the rows with ``bulk_create`` and ``bulk_update``.
+
+The peak memory of the import of a csv file read in a dataset grows with the
+file, the rows of the file imported as they are read keep it flat.
+"""
+from __future__ import print_function
+import io
+import os
+import tempfile
+import tracemalloc
+
+from .base import setup_django, timeit, report
+
+SIZES = (1000, 4000)
+BATCH_SIZES = (0, 100, 500)
+FILE_SIZES = (10000, 40000)
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    setup_django(XADMIN_EXCLUDE_PLUGINS=['xversion', 'themes'],
+                 INSTALLED_APPS=['django.contrib.admin', 'django.contrib.auth', 'django.contrib.contenttypes',
+                                 'django.contrib.sessions', 'django.contrib.messages', 'django.contrib.staticfiles',
+                                 'xadmin', 'crispy_forms', 'import_export'])
+    from django.contrib.auth.models import Group
+    from django.core.management import call_command
+    import tablib
+    from import_export import resources
+    from import_export.formats.base_formats import CSV
+    from xadmin.plugins.importexport import BulkImport, iter_csv_rows
+
+    class GroupResource(resources.ModelResource):
+        class Meta:
+            model = Group
+            fields = ('id', 'name')
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+    def import_rows(batch_size, dataset):
+        resource = GroupResource()
+        if batch_size:
+            result = BulkImport(resource, batch_size).import_data(dataset, raise_errors=True)
+        else:
+            result = resource.import_data(dataset, raise_errors=True)
+        assert not result.has_errors()
+
+    rows = []
+    for size in SIZES:
+        new = tablib.Dataset(*[(i + 1, 'group %d' % i) for i in range(size)], headers=['id', 'name'])
+        changed = tablib.Dataset(*[(i + 1, 'changed %d' % i) for i in range(size)], headers=['id', 'name'])
+        for batch_size in BATCH_SIZES:
+            for name, dataset in (('new', new), ('changed', changed), ('unchanged', changed)):
+                if name == 'new':
+                    Group.objects.all().delete()
+                seconds = timeit(lambda: import_rows(batch_size, dataset))
+                rows.append(('%s, %d rows, batch %d' % (name, size, batch_size), '%8.0f rows/s' % (size / seconds)))
+    report('import', rows)
+
+    def import_file(path, stream):
+        resource = GroupResource()
+        with io.open(path, encoding='utf-8', newline='') as f:
+            if stream:
+                lines = iter_csv_rows(f)
+                headers = next(lines)
+                result = BulkImport(resource, 500).import_data(
+                    tablib.Dataset(headers=headers), rows=(dict(zip(headers, row)) for row in lines),
+                    raise_errors=True, on_batch=lambda row_results: None)
+            else:
+                result = BulkImport(resource, 500).import_data(CSV().create_dataset(f.read()), raise_errors=True)
+        assert not result.has_errors()
+
+    rows = []
+    path = tempfile.NamedTemporaryFile(suffix='.csv', delete=False).name
+    try:
+        for size in FILE_SIZES:
+            with io.open(path, 'w', encoding='utf-8') as f:
+                f.write(u'id,name\n')
+                for i in range(size):
+                    f.write(u'%d,group %d\n' % (i + 1, i))
+            for stream in (False, True):
+                Group.objects.all().delete()
+                peak = peak_memory(lambda: import_file(path, stream))
+                rows.append(('%s, %d rows' % ('streamed' if stream else 'dataset', size),
+                             '%8.1f MB peak' % (peak / 1024.0 / 1024)))
+    finally:
+        os.remove(path)
+    report('import of a csv file', rows)
+
+
+if __name__ == '__main__':
+    main()
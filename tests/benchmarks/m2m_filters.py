@@ -0,0 +1,62 @@
+"""
+Change list queries over a many to many heavy table: users which are each in
+several of many groups, filtered and searched by the group names.
+
+Compares the joins made unique by ``DISTINCT``, as the filter plugin used to
+do, with the ``pk__in`` subqueries it uses now.
+"""
+from __future__ import print_function
+import random
+
+from .base import setup_django, timeit, report
+
+USERS = 20000
+GROUPS = 200
+GROUPS_PER_USER = 8
+PAGE = 50
+
+
+def create_data():
+    from django.contrib.auth.models import Group, User
+    from django.core.management import call_command
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    rnd = random.Random(0)
+    Group.objects.bulk_create([Group(name='group%d' % i) for i in range(GROUPS)])
+    User.objects.bulk_create([User(username='user%d' % i) for i in range(USERS)])
+    group_ids = list(Group.objects.values_list('pk', flat=True))
+    Through = User.groups.through
+    Through.objects.bulk_create([
+        Through(user_id=user_id, group_id=group_id)
+        for user_id in User.objects.values_list('pk', flat=True)
+        for group_id in rnd.sample(group_ids, GROUPS_PER_USER)])
+
+
+def page(queryset):
+    # a change list page runs a count and the first page of rows
+    queryset.count()
+    list(queryset.order_by('-pk')[:PAGE])
+
+
+def main():
+    setup_django()
+    from django.contrib.auth.models import User
+    from xadmin.util import pk_in_subquery
+
+    create_data()
+    cases = [
+        ('filter groups__name__in', {'groups__name__in': ['group1', 'group2', 'group3']}),
+        ('search groups__name__icontains', {'groups__name__icontains': 'group1'}),
+    ]
+    number = 10
+    rows = []
+    for name, lookups in cases:
+        old = timeit(lambda: page(User.objects.filter(**lookups).distinct()), number)
+        new = timeit(lambda: page(User.objects.filter(pk_in_subquery(User, **lookups))), number)
+        rows.append(('%s, DISTINCT' % name, '%8.1f ms' % (old * 1000)))
+        rows.append(('%s, pk__in' % name, '%8.1f ms' % (new * 1000)))
+    report('%d users in %d of %d groups' % (USERS, GROUPS_PER_USER, GROUPS), rows)
+
+
+if __name__ == '__main__':
+    main()
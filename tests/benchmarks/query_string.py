@@ -0,0 +1,70 @@
+"""
+Query strings per second of the links of a change list page with a 500
+choices related filter, built by copying ``request.GET`` on each call as
+``get_query_string`` used to and by ``QueryParams``.
+"""
+from __future__ import print_function
+
+from .base import setup_django, timeit, report
+
+CHOICES = 500
+GET = [
+    ('_p_status__exact', '1'),
+    ('_p_created__gte', '2017-01-01'),
+    ('_p_created__lt', '2017-02-01'),
+    ('_q_', 'web server'),
+    ('o', '-created.name'),
+    ('_cols', 'name.idc.status.created'),
+    ('p', '2'),
+]
+
+
+def dict_query_string(GET, new_params=None, remove=None):
+    from django.utils.http import urlencode
+
+    if new_params is None:
+        new_params = {}
+    if remove is None:
+        remove = []
+    p = dict(GET).copy()
+    arr_keys = list(p.keys())
+    for r in remove:
+        for k in arr_keys:
+            if k.startswith(r):
+                del p[k]
+    for k, v in new_params.items():
+        if v is None:
+            if k in p:
+                del p[k]
+        else:
+            p[k] = v
+    return '?%s' % urlencode(p)
+
+
+def page_links(query_string):
+    # related filter choices
+    for i in range(CHOICES):
+        query_string({'_p_idc__id__exact': i}, ['_p_idc__id__'])
+    # sort menus, pagination and refresh links
+    for i in range(20):
+        query_string({'o': 'name.-created'})
+        query_string({'p': i})
+        query_string()
+
+
+def main():
+    setup_django()
+    from xadmin.util import QueryParams
+
+    number = 20
+    calls = CHOICES + 60
+    old = timeit(lambda: page_links(lambda *args: dict_query_string(GET, *args)), number)
+    new = timeit(lambda: page_links(QueryParams(GET).query_string), number)
+    report('%d query strings per page' % calls, [
+        ('copy request.GET', '%8.0f calls/s' % (calls / old)),
+        ('QueryParams', '%8.0f calls/s' % (calls / new)),
+    ])
+
+
+if __name__ == '__main__':
+    main()
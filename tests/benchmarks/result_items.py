@@ -0,0 +1,79 @@
+"""
+Memory used by the result rows of a big change list (show all or export).
+
+Compares the slots based ResultRow/ResultItem with the previous ``__dict__``
+layout, which created five empty lists for every cell.
+"""
+from __future__ import print_function
+import tracemalloc
+
+from .base import setup_django, report
+
+ROWS = 50000
+COLUMNS = 15
+
+
+class DictResultRow(dict):
+    pass
+
+
+class DictResultItem(object):
+
+    def __init__(self, field_name, row):
+        self.classes = []
+        self.text = '&nbsp;'
+        self.wraps = []
+        self.tag = 'td'
+        self.tag_attrs = []
+        self.allow_tags = False
+        self.btns = []
+        self.menus = []
+        self.is_display_link = False
+        self.row = row
+        self.field_name = field_name
+        self.field = None
+        self.attr = None
+        self.value = None
+
+
+def build(row_class, item_class, rows=ROWS, columns=COLUMNS):
+    field_names = ['field_%d' % i for i in range(columns)]
+    results = []
+    for i in range(rows):
+        row = row_class()
+        row['is_display_first'] = True
+        row['object'] = i
+        row.cells = []
+        for field_name in field_names:
+            item = item_class(field_name, row)
+            item.text = field_name
+            item.value = i
+            row.cells.append(item)
+        results.append(row)
+    return results
+
+
+def measure(row_class, item_class):
+    tracemalloc.start()
+    results = build(row_class, item_class)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return size, peak
+
+
+def main():
+    setup_django()
+    from xadmin.views.list import ResultRow, ResultItem
+
+    cells = ROWS * COLUMNS
+    rows = []
+    for name, row_class, item_class in (('__dict__ items', DictResultRow, DictResultItem),
+                                        ('__slots__ items', ResultRow, ResultItem)):
+        size, peak = measure(row_class, item_class)
+        rows.append((name, '%8.1f MB  %5d bytes/cell' % (size / 1048576.0, size // cells)))
+    report('%d rows x %d columns' % (ROWS, COLUMNS), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Rows per second of the change list table body, rendered by the
+``results_grid_body`` template block and by ``render_result_body``.
+"""
+from __future__ import print_function
+
+from .base import setup_django, timeit, report
+
+ROWS = 500
+COLUMNS = 10
+
+TEMPLATE = """{% load xadmin_tags %}<tbody>
+    {% for row in results %}
+      <tr class="grid-item{% if row.css_class %} {{row.css_class}}{%endif%}" {{ row.tagattrs }}>{% for o in row.cells %}
+        <td {{o.tagattrs}}>
+          {% if o.btns %}
+            <div class="btn-group pull-right">
+              {% for b in o.btns %}
+                {{b|safe}}
+              {% endfor %}
+            </div>
+          {% endif %}
+          {% if o.menus %}
+            <div class="dropdown">
+              <a class="dropdown-toggle" data-toggle="dropdown" href="#">
+                {{ o.label }}
+              </a>
+              <ul class="dropdown-menu">
+                {% for m in o.menus %}
+                  {{m|safe}}
+                {% endfor %}
+              </ul>
+            </div>
+          {% else %}
+            {{ o.label }}
+          {% endif %}
+        </td>
+      {% endfor %}</tr>
+      {% view_block 'result_row' row %}
+    {% endfor %}
+    </tbody>"""
+
+
+def build_results():
+    from xadmin.views.list import ResultRow, ResultItem
+
+    results = []
+    for i in range(ROWS):
+        row = ResultRow()
+        row['is_display_first'] = True
+        for c in range(COLUMNS):
+            item = ResultItem('field_%d' % c, row)
+            item.text = u'value <%d, %d>' % (i, c)
+            if c == 0:
+                item.wraps.append(u'<a href="/host/%d/update/">%%s</a>' % i)
+            if c == 1:
+                item.classes.append('nowrap')
+                item.btns.append(u'<a class="details-handler"><i class="fa fa-info-circle"></i></a>')
+            row.cells.append(item)
+        results.append(row)
+    return results
+
+
+def main():
+    setup_django()
+    from django.template import Context, Template
+    from xadmin.views.list import render_result_body
+
+    results = build_results()
+    template = Template(TEMPLATE)
+    context = Context({'results': results})
+
+    number = 10
+    dtl = timeit(lambda: template.render(context), number)
+    fast = timeit(lambda: render_result_body(results), number)
+    report('%d rows x %d columns' % (ROWS, COLUMNS), [
+        ('template block', '%8.0f rows/s' % (ROWS / dtl)),
+        ('render_result_body', '%8.0f rows/s' % (ROWS / fast)),
+    ])
+
+
+if __name__ == '__main__':
+    main()
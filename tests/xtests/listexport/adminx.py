@@ -0,0 +1,22 @@
+from __future__ import absolute_import
+import xadmin
+from .models import Product, LimitedProduct
+
+
+class ProductAdmin(object):
+    list_display = ('name', 'price', 'quantity')
+    list_export = ('csv', 'json')
+    list_per_page = 5
+    list_export_background = True
+    # parallel in the worker command only
+    export_workers = 2
+    export_parallel_rows = 10
+
+
+class LimitedProductAdmin(ProductAdmin):
+    admission_limits = {'export': 1}
+    admission_wait = 0
+
+
+xadmin.site.register(Product, ProductAdmin)
+xadmin.site.register(LimitedProduct, LimitedProductAdmin)
@@ -0,0 +1,169 @@
+from __future__ import absolute_import
+import decimal
+import json
+
+from django.contrib.auth.models import Permission, User
+from django.contrib.messages import get_messages
+from django.test.utils import override_settings
+from django.utils.encoding import force_text
+
+from base import BaseTest
+from xadmin.models import ExportJob
+from xadmin.plugins.admission import AdmissionSlots, get_admission_cache
+from xadmin.plugins import exportjob
+from xadmin.plugins.exportjob import get_export_storage, run_export_job
+
+from .models import Product
+
+EXPORT_QUERY = '_do_=export&export_type=csv&all=on&export_csv_header=on'
+
+
+@override_settings(ROOT_URLCONF='listexport.urls')
+class ExportTestBase(BaseTest):
+
+    def setUp(self):
+        super(ExportTestBase, self).setUp()
+        self.user = User.objects.create_superuser('admin', 'admin@xadmin.io', 'admin')
+        self.client.force_login(self.user)
+        for i in range(12):
+            Product.objects.create(name='product%02d' % i, price=decimal.Decimal('%d.10' % i), quantity=i)
+
+
+class CSVExportTest(ExportTestBase):
+
+    def get_csv_lines(self, query=EXPORT_QUERY):
+        response = self.client.get('/xadmin/listexport/product/?' + query)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8').splitlines()
+
+    def test_streamed_rows(self):
+        Product.objects.filter(name='product11').update(name='Fish & "Chips"')
+        lines = self.get_csv_lines()
+
+        self.assertEqual(len(lines), 13)
+        self.assertEqual(lines[0], 'name,price,quantity')
+        # the values aren't html, the quotes are the ones of csv
+        self.assertEqual(lines[1], '"Fish & ""Chips""",11.10,11')
+        self.assertEqual(lines[-1], 'product00,0.10,0')
+
+    def test_page_rows(self):
+        lines = self.get_csv_lines('_do_=export&export_type=csv&p=1')
+
+        self.assertEqual(lines, ['product%02d,%d.10,%d' % (i, i, i) for i in (6, 5, 4, 3, 2)])
+
+
+class JSONExportTest(ExportTestBase):
+
+    def test_typed_values(self):
+        response = self.client.get('/xadmin/listexport/product/?_do_=export&export_type=json&all=on')
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        objects = json.loads(content.decode('utf-8'))['objects']
+
+        self.assertEqual(len(objects), 12)
+        # the decimals keep their digits
+        self.assertEqual(objects[0], {'name': 'product11', 'price': '11.10', 'quantity': 11})
+
+
+class ExportJobTest(ExportTestBase):
+
+    def run_job(self, model, query=EXPORT_QUERY):
+        job = ExportJob.objects.create(user=self.user, model=model, query=query, file_type='csv')
+        run_export_job(job.pk)
+        job = ExportJob.objects.get(pk=job.pk)
+        self.addCleanup(job.delete)
+        return job
+
+    def read_job_file(self, job):
+        with get_export_storage().open(job.file) as f:
+            return f.read().decode('utf-8')
+
+    def test_export_job(self):
+        job = self.run_job('listexport.product')
+
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.progress, 12)
+        lines = self.read_job_file(job).splitlines()
+        self.assertEqual(len(lines), 13)
+        self.assertEqual(lines[1], 'product11,11.10,11')
+
+    def test_export_job_not_admitted(self):
+        # the slot of the exports is held by a running export
+        slots = AdmissionSlots(get_admission_cache(), 60)
+        self.assertTrue(slots.acquire('export', 1))
+        self.addCleanup(slots.release)
+
+        response = self.client.get('/xadmin/listexport/limitedproduct/?' + EXPORT_QUERY)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.run_job('listexport.limitedproduct').status, 'done')
+
+
+class ExportJobAdminTest(ExportTestBase):
+
+    def setUp(self):
+        super(ExportJobAdminTest, self).setUp()
+        self.staff = User.objects.create_user('staff', 'staff@xadmin.io', 'staff', is_staff=True)
+        self.staff.user_permissions.add(Permission.objects.get(codename='change_product'))
+
+    def test_background_export(self):
+        response = self.client.get('/xadmin/listexport/product/?%s&export_background=on' % EXPORT_QUERY)
+
+        self.assertRedirects(response, '/xadmin/xadmin/exportjob/', fetch_redirect_response=False)
+        job = ExportJob.objects.get()
+        self.assertEqual((job.user, job.status, job.file_type), (self.user, 'pending', 'csv'))
+        self.assertNotIn('export_background', job.query)
+
+    def test_background_export_without_job_list(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/xadmin/listexport/product/?%s&export_background=on&p=1' % EXPORT_QUERY)
+
+        # the list of the exports isn't allowed, the job has its own pages
+        self.assertRedirects(response, '/xadmin/listexport/product/?p=1', fetch_redirect_response=False)
+        job = ExportJob.objects.get()
+        self.assertEqual(job.user, self.staff)
+        message = [force_text(m) for m in get_messages(response.wsgi_request)][0]
+        self.assertIn('href="/xadmin/export_jobs/%d/download/"' % job.pk, message)
+        self.assertIn('href="/xadmin/export_jobs/%d/"' % job.pk, message)
+        progress = json.loads(self.client.get('/xadmin/export_jobs/%d/' % job.pk).content.decode('utf-8'))
+        self.assertEqual(progress['status'], 'pending')
+
+    def test_jobs_of_the_user(self):
+        ExportJob.objects.create(user=self.user, model='listexport.product', query=EXPORT_QUERY, file_type='csv')
+        job = ExportJob.objects.create(user=self.staff, model='listexport.product', query=EXPORT_QUERY,
+                                       file_type='csv')
+        self.client.force_login(self.staff)
+
+        # the list of the exports needs the permission of the model
+        self.assertEqual(self.client.get('/xadmin/xadmin/exportjob/').status_code, 403)
+
+        self.staff.user_permissions.add(Permission.objects.get(codename='view_exportjob'))
+        response = self.client.get('/xadmin/xadmin/exportjob/')
+        self.assertEqual(list(response.context_data['cl'].result_list), [job])
+
+
+class ParallelExportTest(ExportJobTest):
+
+    def setUp(self):
+        super(ParallelExportTest, self).setUp()
+        runner = exportjob.EXPORT_JOB_RUNNER
+        exportjob.EXPORT_JOB_RUNNER = 'command'
+        self.addCleanup(setattr, exportjob, 'EXPORT_JOB_RUNNER', runner)
+
+    def test_export_sent_to_worker(self):
+        response = self.client.get('/xadmin/listexport/product/?' + EXPORT_QUERY)
+
+        self.assertRedirects(response, '/xadmin/xadmin/exportjob/', fetch_redirect_response=False)
+        job = ExportJob.objects.get()
+        self.assertEqual(job.query, EXPORT_QUERY)
+        # the job doesn't fork out of the worker command
+        run_export_job(job.pk)
+        job = ExportJob.objects.get(pk=job.pk)
+        self.addCleanup(job.delete)
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(len(self.read_job_file(job).splitlines()), 13)
+
+    def test_small_export_not_sent(self):
+        Product.objects.filter(quantity__gte=5).delete()
+        response = self.client.get('/xadmin/listexport/product/?' + EXPORT_QUERY)
+
+        self.assertTrue(response.streaming)
+        self.assertFalse(ExportJob.objects.exists())
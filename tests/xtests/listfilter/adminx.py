@@ -0,0 +1,19 @@
+from __future__ import absolute_import
+import xadmin
+from xadmin.filters import MultiSelectFieldListFilter
+from .models import Vendor, Tag, Item
+
+
+class CachedMultiSelectFieldListFilter(MultiSelectFieldListFilter):
+    cache_config = dict(MultiSelectFieldListFilter.cache_config, enabled=True)
+
+
+class ItemAdmin(object):
+    list_display = ('name', 'vendor', 'color', 'state', 'created')
+    list_filter = ('vendor', 'tags', ('color', CachedMultiSelectFieldListFilter), 'state', 'created')
+    search_fields = ('name',)
+
+
+xadmin.site.register(Vendor)
+xadmin.site.register(Tag)
+xadmin.site.register(Item, ItemAdmin)
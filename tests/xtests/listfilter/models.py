@@ -0,0 +1,38 @@
+from django.db import models
+
+
+class Vendor(models.Model):
+    name = models.CharField(max_length=64)
+
+    def __str__(self):
+        return self.name
+
+
+class SpecialVendor(Vendor):
+
+    class Meta:
+        proxy = True
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=64)
+
+    def __str__(self):
+        return self.name
+
+
+class Item(models.Model):
+    name = models.CharField(max_length=64)
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE)
+    tags = models.ManyToManyField(Tag, blank=True)
+    color = models.CharField(max_length=16, blank=True)
+    state = models.IntegerField(choices=((0, 'New'), (1, 'Used')), default=0)
+    created = models.DateTimeField(null=True)
+
+
+class Note(models.Model):
+    text = models.CharField(max_length=64)
+
+
+class Notebook(models.Model):
+    notes = models.ManyToManyField(Note)
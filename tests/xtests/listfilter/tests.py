@@ -0,0 +1,202 @@
+from __future__ import absolute_import
+import datetime
+import json
+
+from django.contrib.auth.models import User
+from django.contrib.messages.storage import default_storage
+from django.contrib.sessions.backends.base import SessionBase
+from django.test.utils import override_settings
+
+import xadmin
+from base import BaseTest
+from xadmin.filters import MultiSelectFieldListFilter, RelatedFieldListFilter, get_filter_cache, get_distinct_values, get_path_models, \
+    _generation_key
+
+from xadmin.views import ListAdminView
+
+from .adminx import ItemAdmin
+from .models import Vendor, SpecialVendor, Tag, Item, Note, Notebook
+
+
+@override_settings(ROOT_URLCONF='listfilter.urls')
+class ListFilterTestBase(BaseTest):
+
+    def setUp(self):
+        super(ListFilterTestBase, self).setUp()
+        get_filter_cache().clear()
+        self.user = User.objects.create_superuser('admin', 'admin@xadmin.io', 'admin')
+        self.client.force_login(self.user)
+        self.vendors = [Vendor.objects.create(name='vendor%d' % i) for i in range(3)]
+        self.tags = [Tag.objects.create(name='tag%d' % i) for i in range(2)]
+        for i in range(6):
+            item = Item.objects.create(name='item%d' % i, vendor=self.vendors[i % 3], color=('red', 'blue')[i % 2],
+                                       state=i % 2)
+            item.tags.add(self.tags[i % 2])
+
+    def get_filter_specs(self, params=None):
+        response = self.client.get('/xadmin/listfilter/item/', params or {})
+        return dict((spec.field_path, spec) for spec in response.context_data['cl'].filter_specs)
+
+    def get_list_view(self, option_class, url='/'):
+        view_class = xadmin.site.get_view_class(ListAdminView, option_class)
+        request = self._mocked_request(url, self.user)
+        request.session = SessionBase()
+        request._messages = default_storage(request)
+        return view_class.as_view()(request).render()
+
+
+class RelatedFilterChoicesTest(ListFilterTestBase):
+
+    def test_choices_cached_until_saved(self):
+        self.assertEqual([label for value, label in self.get_filter_specs()['vendor'].lookup_choices],
+                         ['vendor0', 'vendor1', 'vendor2'])
+
+        SpecialVendor.objects.create(name='special')
+        self.assertEqual([label for value, label in self.get_filter_specs()['vendor'].lookup_choices],
+                         ['vendor0', 'vendor1', 'vendor2', 'special'])
+
+    def test_generation_bumped_without_read(self):
+        # the generation was read by another process only
+        key = _generation_key(Note)
+        get_filter_cache().set(key, 5, None)
+        Note.objects.create(text='note')
+
+        self.assertEqual(get_filter_cache().get(key), 6)
+
+    def test_search_choices(self):
+        Vendor.objects.bulk_create([Vendor(name='bulk%02d' % i) for i in range(30)])
+        threshold = RelatedFieldListFilter.choices_threshold
+        RelatedFieldListFilter.choices_threshold = 10
+        try:
+            spec = self.get_filter_specs()['vendor']
+        finally:
+            RelatedFieldListFilter.choices_threshold = threshold
+
+        self.assertTrue(spec.search_choices)
+        self.assertEqual(spec.lookup_choices, [])
+        self.assertEqual(spec.search_url, '/xadmin/listfilter/item/filter/vendor/')
+
+        first = json.loads(self.client.get(spec.search_url).content.decode('utf-8'))
+        second = json.loads(self.client.get(spec.search_url, {'p': 1}).content.decode('utf-8'))
+        self.assertEqual(len(first['objects']), 20)
+        self.assertTrue(first['has_more'])
+        self.assertEqual(len(second['objects']), 13)
+        self.assertFalse(second['has_more'])
+        self.assertEqual(first['objects'][0], {'id': self.vendors[0].pk, '__str__': 'vendor0'})
+
+        found = json.loads(self.client.get(spec.search_url, {'_q_': 'bulk1'}).content.decode('utf-8'))
+        self.assertEqual([obj['__str__'] for obj in found['objects']], ['bulk%d' % i for i in range(10, 20)])
+
+    def test_search_choices_of_unlisted_field(self):
+        self.assertEqual(self.client.get('/xadmin/listfilter/item/filter/name/').status_code, 404)
+
+
+@override_settings(XADMIN_FILTER_BACKGROUND_REFRESH=False)
+class DistinctValuesTest(ListFilterTestBase):
+
+    def test_values_cached_until_saved(self):
+        self.assertEqual(sorted(self.get_filter_specs()['color'].lookup_choices), ['blue', 'red'])
+
+        Item.objects.filter(color='red').update(color='green')
+        self.assertEqual(sorted(self.get_filter_specs()['color'].lookup_choices), ['blue', 'red'])
+
+        Item.objects.create(name='item6', vendor=self.vendors[0], color='white')
+        self.assertEqual(sorted(self.get_filter_specs()['color'].lookup_choices), ['blue', 'green', 'white'])
+
+    def test_multi_select_values_not_cached(self):
+        # the values are only cached with the cache_config of the filter
+        option = type('ItemColorAdmin', (ItemAdmin,), {
+            'model': Item, 'list_filter': (('color', MultiSelectFieldListFilter),)})
+        Item.objects.bulk_create([Item(name='bulk', vendor=self.vendors[0], color='color%03d' % i)
+                                  for i in range(250)])
+        spec = self.get_list_view(option).context_data['cl'].filter_specs[0]
+        self.assertEqual(len(spec.lookup_choices), 252)
+        self.assertEqual(spec.more_count, 0)
+
+        Item.objects.filter(color='red').update(color='green')
+        spec = self.get_list_view(option).context_data['cl'].filter_specs[0]
+        self.assertIn('green', spec.lookup_choices)
+        self.assertNotIn('red', spec.lookup_choices)
+
+    def test_values_cached_until_m2m_changed(self):
+        def get_values():
+            return get_distinct_values(
+                Item.objects.values_list('tags__name', flat=True).distinct().order_by('tags__name'),
+                get_path_models(Item, 'tags__name'))
+        self.assertEqual(get_values(), (['tag0', 'tag1'], 0))
+
+        Tag.objects.filter(name='tag1').update(name='tag3')
+        self.assertEqual(get_values(), (['tag0', 'tag1'], 0))
+
+        Item.objects.get(name='item0').tags.add(Tag.objects.create(name='tag2'))
+        self.assertEqual(get_values(), (['tag0', 'tag2', 'tag3'], 0))
+
+    def test_m2m_generation_bumped_without_read(self):
+        notebook = Notebook.objects.create()
+        note = Note.objects.create(text='note')
+        # the generations were read by another process only
+        cache = get_filter_cache()
+        cache.set_many({_generation_key(Notebook): 1, _generation_key(Note): 1}, None)
+        notebook.notes.add(note)
+
+        self.assertEqual(cache.get_many([_generation_key(Notebook), _generation_key(Note)]),
+                         {_generation_key(Notebook): 2, _generation_key(Note): 2})
+
+
+class FacetCountTest(ListFilterTestBase):
+
+    def get_counted_specs(self, url='/'):
+        option = type('ItemCountAdmin', (ItemAdmin,), {'model': Item, 'list_filter_counts': True})
+        cl = self.get_list_view(option, url).context_data['cl']
+        return dict((spec.field_path, spec) for spec in cl.filter_specs)
+
+    def test_choice_counts(self):
+        specs = self.get_counted_specs()
+
+        self.assertEqual([(choice['display'], choice.get('count')) for choice in specs['vendor'].choices()],
+                         [('All', None), ('vendor0', 2), ('vendor1', 2), ('vendor2', 2)])
+        self.assertEqual([(choice['display'], choice.get('count')) for choice in specs['state'].choices()],
+                         [('All', None), ('New', 3), ('Used', 3)])
+
+    def test_used_filter_counts(self):
+        specs = self.get_counted_specs('/?_p_state__exact=1&_p_vendor__id__exact=%d' % self.vendors[0].pk)
+
+        # a used filter counts the rows of its choices with the other filters
+        self.assertEqual(specs['state'].facet_counts, {'0': 1, '1': 1})
+        self.assertEqual(specs['vendor'].facet_counts, {str(v.pk): 1 for v in self.vendors})
+
+    def test_date_filter_not_counted(self):
+        for i, item in enumerate(Item.objects.all()):
+            item.created = datetime.datetime(2020, 1, 1, 10, i)
+            item.save()
+
+        self.assertIsNone(self.get_counted_specs()['created'].facet_counts)
+
+
+class ResolvedListFilterTest(ListFilterTestBase):
+
+    def test_list_filter_changed_by_request(self):
+        class Filter(object):
+            def init_request(self, *args, **kwargs):
+                self.list_filter = ('vendor', 'state') if 'state' in self.request.GET else ('vendor',)
+                return super(Filter, self).init_request(*args, **kwargs)
+
+        option = type('ItemDynamicFilterAdmin', (ItemAdmin,), {'model': Item, 'Filter': Filter})
+        for url, field_paths in (('/', ['vendor']), ('/?state=1', ['vendor', 'state']), ('/', ['vendor'])):
+            cl = self.get_list_view(option, url).context_data['cl']
+            self.assertEqual([spec.field_path for spec in cl.filter_specs], field_paths)
+
+
+class QuickFilterCountTest(ListFilterTestBase):
+
+    def test_used_quick_filter_counts(self):
+        option = type('ItemQuickFilterAdmin', (ItemAdmin,), {
+            'model': Item, 'list_filter': ('vendor',), 'list_quick_filter': ('color', 'state'),
+            'list_filter_counts': True})
+        response = self.get_list_view(option, '/?_p_color__in=red&_p_vendor__id__exact=%d' % self.vendors[0].pk)
+        specs = dict((spec.field_path, spec) for spec in response.context_data['cl'].quickfilter['filter_specs'])
+
+        # the used quick filter counts its choices with the other filters only
+        self.assertEqual(specs['color'].facet_counts, {'red': 1, 'blue': 1})
+        self.assertEqual(specs['state'].facet_counts, {'0': 1})
+
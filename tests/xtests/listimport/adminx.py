@@ -0,0 +1,25 @@
+from __future__ import absolute_import
+from import_export import fields, resources, widgets
+
+import xadmin
+from .models import Author, Book
+
+
+class BookResource(resources.ModelResource):
+    author = fields.Field(attribute='author', column_name='author', widget=widgets.ForeignKeyWidget(Author, 'name'))
+
+    class Meta:
+        model = Book
+        import_id_fields = ('isbn',)
+        fields = ('isbn', 'title', 'copies', 'author')
+
+
+class BookAdmin(object):
+    list_display = ('isbn', 'title', 'copies', 'author')
+    import_export_args = {'import_resource_class': BookResource}
+    import_preview_rows = 2
+    import_background_rows = 4
+    import_workers = 2
+
+
+xadmin.site.register(Book, BookAdmin)
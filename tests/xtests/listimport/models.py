@@ -0,0 +1,12 @@
+from django.db import models
+
+
+class Author(models.Model):
+    name = models.CharField(max_length=64, unique=True)
+
+
+class Book(models.Model):
+    isbn = models.CharField(max_length=20, unique=True)
+    title = models.CharField(max_length=128)
+    copies = models.IntegerField(default=0)
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, null=True, blank=True)
@@ -0,0 +1,213 @@
+from __future__ import absolute_import
+import json
+from collections import OrderedDict
+
+import tablib
+from django.contrib.auth.models import Permission, User
+from django.contrib.messages import get_messages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import override_settings
+from django.utils.encoding import force_text
+
+from base import BaseTest
+from xadmin.filters import model_generation
+from xadmin.models import ImportJob
+from xadmin.plugins import importexport
+from xadmin.plugins.importexport import BulkImport, ImportBaseView, run_import_job, _check_rows
+
+from .adminx import BookResource
+from .models import Author, Book
+
+HEADERS = ['isbn', 'title', 'copies']
+
+
+class BulkImportTest(BaseTest):
+
+    def import_rows(self, rows, bulk=True, resource=None, on_batch=None, **kwargs):
+        bulk_import = BulkImport(resource or BookResource(), 10, **kwargs)
+        self.assertTrue(bulk_import.bulk)
+        bulk_import.bulk = bulk
+        return bulk_import.import_data(tablib.Dataset(*rows, headers=HEADERS), on_batch=on_batch)
+
+    def test_bulk_write(self):
+        Book.objects.create(isbn='1', title='a', copies=1)
+        generation = model_generation(Book)
+        result = self.import_rows([('1', 'a', '2'), ('2', 'b', '1'), ('3', 'c', '1')])
+
+        self.assertEqual(result.totals['new'], 2)
+        self.assertEqual(result.totals['update'], 1)
+        self.assertEqual(list(Book.objects.order_by('isbn').values_list('isbn', 'copies')),
+                         [('1', 2), ('2', 1), ('3', 1)])
+        # the bulk writes send no signals
+        self.assertNotEqual(model_generation(Book), generation)
+
+    def test_repeated_key(self):
+        rows = [('1', 'a', '1'), ('2', 'b', '1'), ('1', 'c', '2')]
+        for bulk in (True, False):
+            Book.objects.all().delete()
+            result = self.import_rows(rows, bulk)
+
+            self.assertEqual([row.import_type for row in result.rows], ['new', 'new', 'update'])
+            self.assertEqual(list(Book.objects.order_by('isbn').values_list('isbn', 'title', 'copies')),
+                             [('1', 'c', 2), ('2', 'b', 1)])
+
+    def test_ids_of_new_rows(self):
+        result = self.import_rows([('1', 'a', '1')])
+        self.assertEqual(result.rows[0].object_id, Book.objects.get(isbn='1').pk)
+
+        result = self.import_rows([('2', 'b', '1')], need_ids=False)
+        self.assertTrue(Book.objects.filter(isbn='2').exists())
+        # sqlite doesn't return the keys of a bulk insert
+        self.assertIsNone(result.rows[0].object_id)
+
+    def test_batch_results(self):
+        class RecordingResource(BookResource):
+            def after_import(self, dataset, result, using_transactions, dry_run, **kwargs):
+                # the new rows reset the sequences of the table
+                self.import_types = [row.import_type for row in result.rows]
+
+        Book.objects.create(isbn='1', title='a', copies=1)
+        resource = RecordingResource()
+        batches = []
+        result = self.import_rows([('1', 'a', '2'), ('2', 'b', '1'), ('3', 'c', 'x')], resource=resource,
+                                  on_batch=batches.append)
+
+        self.assertEqual([[row.import_type for row in batch] for batch in batches], [['update', 'new', 'error']])
+        self.assertEqual(resource.import_types, ['update', 'new', 'error'])
+        # the rows are only kept with errors
+        self.assertEqual([len(row.errors) for row in result.rows], [0, 0, 1])
+
+
+class CheckRowsTest(BaseTest):
+
+    def setUp(self):
+        super(CheckRowsTest, self).setUp()
+        # the connections of the test process are kept as if it was forked
+        self.addCleanup(setattr, importexport, '_parent_connections', importexport._parent_connections)
+        importexport._parent_connections = []
+        importexport._import_checks['token'] = BookResource()
+        self.addCleanup(importexport._import_checks.pop, 'token')
+
+    def test_errors_of_rows(self):
+        author = Author.objects.create(name='ann')
+        rows = [(line, OrderedDict(zip(HEADERS + ['author'], row))) for line, row in (
+            (2, ('1', 'a', '1', 'ann')), (3, ('2', 'b', 'x', 'ann')), (4, ('3', 'c', '1', 'bob')), (5, ('4', 'd', '1', '')))]
+        # the authors are only their preloaded keys
+        with self.assertNumQueries(0):
+            errors = _check_rows('token', rows, {'author': {'ann': author.pk}})
+
+        self.assertEqual([(line, row['isbn']) for line, row, error, tb_info in errors], [(3, '2'), (4, '3')])
+        self.assertIsInstance(errors[0][2], ValueError)
+        self.assertIsInstance(errors[1][2], Author.DoesNotExist)
+        self.assertFalse(Book.objects.exists())
+
+
+@override_settings(ROOT_URLCONF='listimport.urls')
+class ImportViewTest(BaseTest):
+
+    def setUp(self):
+        super(ImportViewTest, self).setUp()
+        self.user = User.objects.create_superuser('admin', 'admin@xadmin.io', 'admin')
+        self.client.force_login(self.user)
+        self.author = Author.objects.create(name='ann')
+
+    def get_csv(self, rows):
+        lines = [','.join(HEADERS + ['author'])] + [','.join(row) for row in rows]
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def import_file(self, rows):
+        input_format = [f for f in ImportBaseView.formats if f().can_import()].index(importexport.CSV)
+        response = self.client.post('/xadmin/listimport/book/import/', {
+            'input_format': input_format, 'import_file': SimpleUploadedFile('books.csv', self.get_csv(rows))})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def confirm_import(self, response):
+        return self.client.post('/xadmin/listimport/book/process_import/', response.context_data['confirm_form'].initial)
+
+    def test_small_file(self):
+        response = self.import_file([('1', 'a', '1', 'ann'), ('2', 'b', '2', '')])
+        self.assertFalse(response.context_data.get('preview_partial'))
+        self.assertFalse(Book.objects.exists())
+
+        response = self.confirm_import(response)
+        self.assertRedirects(response, '/xadmin/listimport/book/', fetch_redirect_response=False)
+        self.assertEqual(list(Book.objects.order_by('isbn').values_list('isbn', 'copies', 'author')),
+                         [('1', 1, self.author.pk), ('2', 2, None)])
+
+    def test_rows_after_preview_not_checked(self):
+        response = self.import_file([('1', 'a', '1', 'ann'), ('2', 'b', '1', 'ann'), ('3', 'c', 'x', 'ann')])
+
+        self.assertTrue(response.context_data['preview_partial'])
+        self.assertEqual(response.context_data['result'].total_rows, 2)
+        self.assertIn('Only the first 2 of the 3 rows of the file are previewed.', response.rendered_content)
+        self.assertIn('confirm_form', response.context_data)
+
+        response = self.confirm_import(response)
+        self.assertContains(response, 'Line number')
+        self.assertFalse(Book.objects.exists())
+
+    def test_import_job(self):
+        rows = [(str(i), 'book%d' % i, '1', 'ann') for i in range(5)]
+        response = self.confirm_import(self.import_file(rows))
+
+        self.assertRedirects(response, '/xadmin/xadmin/importjob/', fetch_redirect_response=False)
+        job = ImportJob.objects.get()
+        self.assertEqual((job.user, job.status, job.total), (self.user, 'pending', 5))
+
+        # the rows are checked in processes of the worker command
+        run_import_job(job.pk, fork=True)
+        job = ImportJob.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.progress), ('done', 5))
+        self.assertEqual(Book.objects.filter(author=self.author).count(), 5)
+
+    def test_import_job_checked_rows(self):
+        rows = [(str(i), 'book%d' % i, '1', 'ann') for i in range(4)] + [('4', 'book4', '1', 'bob')]
+        self.confirm_import(self.import_file(rows))
+        job = ImportJob.objects.get()
+
+        def import_file_rows(*args, **kwargs):
+            raise AssertionError('The rows were imported.')
+        self.addCleanup(setattr, ImportBaseView, 'import_file_rows', ImportBaseView.import_file_rows)
+        ImportBaseView.import_file_rows = import_file_rows
+        # the rows are checked before the import
+        run_import_job(job.pk, fork=True)
+        job = ImportJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, 'failed')
+        self.assertTrue(job.error.startswith('Line number 6: '))
+        self.assertFalse(Book.objects.exists())
+
+    def test_import_job_without_job_list(self):
+        staff = User.objects.create_user('staff', 'staff@xadmin.io', 'staff', is_staff=True)
+        staff.user_permissions.add(*Permission.objects.filter(codename__in=('add_book', 'change_book')))
+        self.client.force_login(staff)
+        rows = [(str(i), 'book%d' % i, '1', 'ann') for i in range(5)]
+        response = self.confirm_import(self.import_file(rows))
+
+        # the list of the imports isn't allowed, the job has its own page
+        self.assertRedirects(response, '/xadmin/listimport/book/', fetch_redirect_response=False)
+        job = ImportJob.objects.get()
+        url = '/xadmin/import_jobs/%d/' % job.pk
+        self.assertIn('href="%s"' % url, [force_text(m) for m in get_messages(response.wsgi_request)][0])
+        self.assertEqual(json.loads(self.client.get(url).content.decode('utf-8'))['status'], 'pending')
+
+        run_import_job(job.pk)
+        progress = json.loads(self.client.get(url).content.decode('utf-8'))
+        self.assertEqual((progress['status'], progress['progress'], progress['percent']), ('done', 5, 100))
+        self.client.force_login(User.objects.create_user('other', 'other@xadmin.io', 'other', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_jobs_of_the_user(self):
+        staff = User.objects.create_user('staff', 'staff@xadmin.io', 'staff', is_staff=True)
+        ImportJob.objects.create(user=self.user, model='listimport.book', file='a', file_name='a.csv',
+                                 input_format='0', status='done')
+        job = ImportJob.objects.create(user=staff, model='listimport.book', file='b', file_name='b.csv',
+                                       input_format='0', status='done')
+        self.client.force_login(staff)
+
+        # the list of the imports needs the permission of the model
+        self.assertEqual(self.client.get('/xadmin/xadmin/importjob/').status_code, 403)
+
+        staff.user_permissions.add(Permission.objects.get(codename='view_importjob'))
+        response = self.client.get('/xadmin/xadmin/importjob/')
+        self.assertEqual(list(response.context_data['cl'].result_list), [job])
@@ -0,0 +1,6 @@
+from django.conf.urls import include, url
+import xadmin
+
+urlpatterns = [
+    url(r'^xadmin/', include(xadmin.site.urls)),
+]
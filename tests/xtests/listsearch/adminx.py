@@ -0,0 +1,12 @@
+from __future__ import absolute_import
+import xadmin
+from .models import Book
+
+
+class BookAdmin(object):
+    list_display = ('title', 'author')
+    search_fields = ('title', 'summary', 'author__name')
+    search_backend = 'xadmin.search.SQLiteFTS5SearchBackend'
+
+
+xadmin.site.register(Book, BookAdmin)
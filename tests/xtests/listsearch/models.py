@@ -0,0 +1,12 @@
+from django.db import models
+
+
+class Author(models.Model):
+    name = models.CharField(max_length=64)
+
+
+class Book(models.Model):
+    title = models.CharField(max_length=128)
+    summary = models.TextField(blank=True)
+    author = models.ForeignKey(Author, on_delete=models.CASCADE)
+    pages = models.IntegerField(default=0)
@@ -0,0 +1,73 @@
+from __future__ import absolute_import
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import override_settings
+
+from base import BaseTest
+from xadmin.search import PostgresSearchBackend, SQLiteFTS5SearchBackend
+
+from .adminx import BookAdmin
+from .models import Author, Book
+
+
+@override_settings(ROOT_URLCONF='listsearch.urls')
+class SearchBackendTestBase(BaseTest):
+
+    def setUp(self):
+        super(SearchBackendTestBase, self).setUp()
+        self.user = User.objects.create_superuser('admin', 'admin@xadmin.io', 'admin')
+        tolkien = Author.objects.create(name='Tolkien')
+        herbert = Author.objects.create(name='Herbert')
+        Book.objects.create(title='The Hobbit', summary='A dragon and a ring', author=tolkien)
+        Book.objects.create(title='The Silmarillion', summary='Elves and rings', author=tolkien)
+        Book.objects.create(title='Dune', summary='A desert planet and a ring of spice', author=herbert)
+
+    def search(self, backend_class, query, rank=False):
+        backend = backend_class(Book, BookAdmin.search_fields)
+        return sorted(book.title for book in backend.search(Book.objects.all(), query, rank))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+class SQLiteFTS5SearchBackendTest(SearchBackendTestBase):
+
+    def test_search_without_index(self):
+        self.assertFalse(SQLiteFTS5SearchBackend(Book, BookAdmin.search_fields).has_index('default'))
+        self.assertEqual(self.search(SQLiteFTS5SearchBackend, 'ring tolkien'), ['The Hobbit', 'The Silmarillion'])
+
+        self.client.force_login(self.user)
+        response = self.client.get('/xadmin/listsearch/book/', {'_q_': 'dune'})
+        self.assertEqual([book.title for book in response.context_data['cl'].result_list], ['Dune'])
+
+    def test_search_with_index(self):
+        backend = SQLiteFTS5SearchBackend(Book, BookAdmin.search_fields)
+        self.assertTrue(backend.build_index('default'))
+        self.assertTrue(backend.has_index('default'))
+
+        # words are prefixes, the author is matched through the relation
+        self.assertEqual(self.search(SQLiteFTS5SearchBackend, 'ring tolkien'), ['The Hobbit', 'The Silmarillion'])
+        self.assertEqual(self.search(SQLiteFTS5SearchBackend, 'desert'), ['Dune'])
+        # the triggers keep the index up to date
+        Book.objects.filter(title='Dune').update(summary='Sandworms')
+        self.assertEqual(self.search(SQLiteFTS5SearchBackend, 'desert'), [])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class PostgresSearchBackendTest(SearchBackendTestBase):
+
+    def test_search(self):
+        self.assertEqual(self.search(PostgresSearchBackend, 'hobbit tolkien'), ['The Hobbit'])
+        self.assertEqual(self.search(PostgresSearchBackend, 'herbert'), ['Dune'])
+
+    def test_search_uses_index(self):
+        backend = PostgresSearchBackend(Book, BookAdmin.search_fields)
+        backend.trigram = False
+        backend.build_index('default')
+        queryset = backend.search(Book.objects.all(), 'dune')
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn(backend.get_index_name('fts'), plan)
@@ -0,0 +1,29 @@
+from __future__ import absolute_import
+from django.db.models import Count, F
+import xadmin
+from .models import IDC, Host
+
+
+class IDCAdmin(object):
+    list_display = ('name', 'host_count')
+
+    def host_count(self, obj):
+        return obj.host_count
+    host_count.short_description = 'Hosts'
+    host_count.expression = Count('host')
+
+
+class HostAdmin(object):
+    list_display = ('name', 'memory', 'memory_kb')
+    list_per_page = 50
+    list_streaming = True
+    list_stream_chunk_size = 5
+    list_export = ()
+
+    def memory_kb(self, obj):
+        return obj.memory_kb
+    memory_kb.expression = F('memory') * 1024
+
+
+xadmin.site.register(IDC, IDCAdmin)
+xadmin.site.register(Host, HostAdmin)
@@ -0,0 +1,11 @@
+from django.db import models
+
+
+class IDC(models.Model):
+    name = models.CharField(max_length=64)
+
+
+class Host(models.Model):
+    name = models.CharField(max_length=64)
+    idc = models.ForeignKey(IDC, on_delete=models.CASCADE)
+    memory = models.IntegerField(default=0)
@@ -0,0 +1,251 @@
+from __future__ import absolute_import
+import threading
+
+from django.contrib.auth.models import User
+from django.contrib.messages.storage import default_storage
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.exceptions import ImproperlyConfigured
+from django.core.paginator import Paginator
+from django.test.utils import override_settings
+from django.utils.functional import cached_property
+
+import xadmin
+from base import BaseTest
+from xadmin.plugins.admission import AdmissionSlots, get_admission_cache, get_admission_stats, request_queued, \
+    request_rejected
+from xadmin.util import QueryTimeout
+from xadmin.views import ListAdminView
+
+from .adminx import IDCAdmin, HostAdmin
+from .models import IDC, Host
+
+# A filter which keeps every row, but takes long enough on each row for any
+# query timeout to cancel the query
+SLOW_WHERE = ('(WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 100000) '
+              'SELECT count(*) FROM c) > 0')
+
+
+class CountTimeoutPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        raise QueryTimeout('count')
+
+
+@override_settings(ROOT_URLCONF='listview.urls')
+class ListViewTestBase(BaseTest):
+
+    def setUp(self):
+        super(ListViewTestBase, self).setUp()
+        self.user = User.objects.create_superuser('admin', 'admin@xadmin.io', 'admin')
+        self.idcs = [IDC.objects.create(name='idc%d' % i) for i in range(3)]
+        for i in range(12):
+            Host.objects.create(name='host%02d' % i, idc=self.idcs[i % 3], memory=i)
+
+    def get_list_view(self, option_class, url='/', **opts):
+        view_class = xadmin.site.get_view_class(ListAdminView, option_class)
+        request = self._mocked_request(url, self.user)
+        request.session = SessionBase()
+        request._messages = default_storage(request)
+        self.request = request
+        response = view_class.as_view(**opts)(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def get_content(self, response):
+        if response.streaming:
+            return b''.join(response.streaming_content).decode('utf-8')
+        return response.content.decode('utf-8')
+
+
+class ExpressionColumnTest(ListViewTestBase):
+
+    def setUp(self):
+        super(ExpressionColumnTest, self).setUp()
+        Host.objects.create(name='host12', idc=self.idcs[0])
+
+    def test_annotated_column(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/xadmin/listview/idc/', {'o': '-host_count'})
+        cl = response.context_data['cl']
+
+        self.assertEqual(cl.list_expressions, {'host_count': IDCAdmin.host_count.expression})
+        self.assertEqual([(obj.name, obj.host_count) for obj in cl.result_list],
+                         [('idc0', 5), ('idc2', 4), ('idc1', 4)])
+
+    def test_aggregated_column(self):
+        option = type('HostMemoryAdmin', (HostAdmin,), {'model': Host, 'aggregate_fields': {'memory_kb': 'sum'}})
+        content = self.get_content(self.get_list_view(option))
+
+        self.assertIn('class="aggregate sum">%d<span class="aggregate_title label label-info">Sum</span>'
+                      % (sum(range(12)) * 1024), content)
+
+    def test_aggregate_of_aggregate_column(self):
+        option = type('IDCHostCountAdmin', (IDCAdmin,), {'model': IDC, 'aggregate_fields': {'host_count': 'sum'}})
+        content = self.get_content(self.get_list_view(option))
+
+        self.assertIn('class="aggregate sum">13<span class="aggregate_title label label-info">Sum</span>', content)
+
+    def test_aggregate_of_method_column(self):
+        option = type('IDCUpperAdmin', (IDCAdmin,), {
+            'model': IDC, 'list_display': ('name', 'upper_name'), 'aggregate_fields': {'upper_name': 'max'},
+            'upper_name': lambda self, obj: obj.name.upper()})
+
+        self.assertRaises(ImproperlyConfigured, self.get_list_view, option)
+
+
+class StreamingTest(ListViewTestBase):
+
+    def test_streamed_page(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/xadmin/listview/host/')
+        content = self.get_content(response)
+
+        self.assertTrue(response.streaming)
+        positions = [content.index('>host%02d<' % i) for i in reversed(range(12))]
+        self.assertEqual(positions, sorted(positions))
+        self.assertTrue(content.rstrip().endswith('</html>'))
+
+    def test_small_page_not_streamed(self):
+        Host.objects.filter(memory__gte=5).delete()
+        self.client.force_login(self.user)
+        response = self.client.get('/xadmin/listview/host/')
+
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(response.context_data['cl'].result_list), 5)
+
+
+class QueryTimeoutTest(ListViewTestBase):
+
+    def test_count_timeout(self):
+        option = type('HostCountTimeoutAdmin', (HostAdmin,), {
+            'model': Host, 'list_per_page': 5, 'list_streaming': False, 'paginator_class': CountTimeoutPaginator})
+        response = self.get_list_view(option)
+        cl = response.context_data['cl']
+        content = self.get_content(response)
+
+        self.assertIsNone(cl.result_count)
+        self.assertIsNone(cl.paginator.count)
+        self.assertTrue(cl.has_more)
+        self.assertEqual([obj.name for obj in cl.result_list], ['host11', 'host10', 'host09', 'host08', 'host07'])
+        self.assertIn('<span class="text-success">?</span>', content)
+        # the actions don't need the count
+        self.assertIn('id="action"', content)
+        self.assertIn('All ? selected', content)
+
+    def test_last_page_without_count(self):
+        option = type('HostLastPageAdmin', (HostAdmin,), {
+            'model': Host, 'list_per_page': 5, 'list_streaming': False, 'paginator_class': CountTimeoutPaginator})
+        cl = self.get_list_view(option, '/?p=2').context_data['cl']
+
+        self.assertFalse(cl.has_more)
+        self.assertEqual([obj.name for obj in cl.result_list], ['host01', 'host00'])
+
+    def test_page_timeout(self):
+        option = type('HostSlowAdmin', (HostAdmin,), {
+            'model': Host, 'query_timeout': 0.000001,
+            'queryset': lambda self: Host.objects.extra(where=[SLOW_WHERE])})
+        cl = self.get_list_view(option).context_data['cl']
+
+        self.assertIsNone(cl.result_count)
+        self.assertTrue(cl.result_timeout)
+        self.assertEqual(list(cl.result_list), [])
+        self.assertEqual([m.message for m in self.request._messages],
+                         ['The list took too long to load, narrow it with the filters or the search.'])
+
+
+class SlowQueryLogTest(ListViewTestBase):
+
+    def test_streamed_page_queries_logged(self):
+        option = type('HostSlowQueryAdmin', (HostAdmin,), {'model': Host, 'slow_query_threshold': 0})
+        with self.assertLogs('xadmin.queries', 'WARNING') as logs:
+            response = self.get_list_view(option)
+            self.assertTrue(response.streaming)
+            self.get_content(response)
+
+        # the rows are queried while the page is sent, after the page head
+        self.assertIn('"listview_host"."name"', logs.records[-1].sql)
+
+
+class FastRenderTest(ListViewTestBase):
+
+    def test_row_tagattrs(self):
+        def result_row(self, obj):
+            # like the sortable list, the attributes are a key of the row
+            row = ListAdminView.result_row(self, obj)
+            row.update({'tagattrs': 'order-key=order_%s' % obj.pk})
+            return row
+
+        option = type('HostOrderAdmin', (HostAdmin,), {'model': Host, 'list_streaming': False,
+                                                       'result_row': result_row})
+        content = self.get_content(self.get_list_view(option))
+
+        for host in Host.objects.all():
+            self.assertIn('<tr class="grid-item" order-key=order_%s>' % host.pk, content)
+
+
+class AdmissionTest(ListViewTestBase):
+
+    def setUp(self):
+        super(AdmissionTest, self).setUp()
+        self.cache = get_admission_cache()
+        self.cache.clear()
+        self.signals = []
+        for signal in (request_queued, request_rejected):
+            signal.connect(self.receive)
+            self.addCleanup(signal.disconnect, self.receive)
+
+    def receive(self, signal, sender, endpoint, request, **kwargs):
+        self.signals.append((signal, endpoint, kwargs.get('scope')))
+
+    def get_show_all(self, name, wait=0, **opts):
+        option = type(name, (HostAdmin,), dict(
+            {'model': Host, 'admission_limits': {'show_all': 1}, 'admission_wait': wait}, **opts))
+        return self.get_list_view(option, '/?all=')
+
+    def is_slot_taken(self):
+        return self.cache.get('xadmin_admission_show_all_0') is not None
+
+    def test_rejected(self):
+        slots = AdmissionSlots(self.cache, 60)
+        self.assertTrue(slots.acquire('show_all', 1))
+        response = self.get_show_all('HostRejectedAdmin')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('xadmin/views/too_many_requests.html', response.template_name)
+        self.assertEqual(self.signals, [(request_rejected, 'show_all', 'site')])
+        self.assertEqual(get_admission_stats()['show_all'], {'admitted': 0, 'queued': 0, 'rejected': 1})
+
+    def test_queued(self):
+        slots = AdmissionSlots(self.cache, 60)
+        self.assertTrue(slots.acquire('show_all', 1))
+        timer = threading.Timer(0.1, slots.release)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        response = self.get_show_all('HostQueuedAdmin', wait=5, list_streaming=False)
+        response.close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.signals, [(request_queued, 'show_all', None)])
+        self.assertEqual(get_admission_stats()['show_all'], {'admitted': 1, 'queued': 1, 'rejected': 0})
+
+    def test_slot_released_with_response(self):
+        response = self.get_show_all('HostAdmittedAdmin', list_streaming=False)
+        self.assertFalse(response.streaming)
+        self.assertTrue(self.is_slot_taken())
+
+        response.close()
+        self.assertFalse(self.is_slot_taken())
+        self.assertEqual(get_admission_stats()['show_all'], {'admitted': 1, 'queued': 0, 'rejected': 0})
+
+    def test_slot_released_with_streamed_response(self):
+        response = self.get_show_all('HostStreamedAdmin')
+        self.assertTrue(response.streaming)
+        # the rows are queried while the page is sent
+        self.get_content(response)
+        self.assertTrue(self.is_slot_taken())
+
+        response.close()
+        self.assertFalse(self.is_slot_taken())
+        self.assertEqual(self.get_show_all('HostAdmittedAdmin', list_streaming=False).status_code, 200)
@@ -1,8 +1,11 @@
 from __future__ import absolute_import
 import xadmin
-from .models import UserSettings, Log
+from .models import UserSettings, Log, ExportJob, ImportJob
 from xadmin.layout import *
 
+from django.apps import apps
+from django.utils.html import escape
+from django.utils.text import capfirst
 from django.utils.translation import ugettext_lazy as _, ugettext
 
 class UserSettingsAdmin(object):
@@ -30,3 +33,105 @@ class LogAdmin(object):
     model_icon = 'fa fa-cog'
 
 xadmin.site.register(Log, LogAdmin)
+
+class ExportJobAdmin(object):
+
+    def exported_model(self, instance):
+        try:
+            return capfirst(apps.get_model(instance.model)._meta.verbose_name_plural)
+        except LookupError:
+            return instance.model
+    exported_model.short_description = _('Model')
+
+    def progress_display(self, instance):
+        if instance.total and instance.status == 'running':
+            return '%d / %d (%d%%)' % (instance.progress, instance.total,
+                                       min(100, instance.progress * 100 // instance.total))
+        return instance.progress
+    progress_display.short_description = _('Exported rows')
+
+    def download(self, instance):
+        if instance.status == 'done' and instance.file:
+            return "<a href='%s'><i class='fa fa-download'></i> %s</a>" % (
+                self.get_admin_url('export_job_download', instance.pk), _('Download'))
+        if instance.status == 'failed':
+            return "<span class='text-danger'>%s</span>" % escape(instance.error)
+        return ''
+    download.short_description = ""
+    download.allow_tags = True
+    download.is_column = False
+
+    list_display = ('created', 'exported_model', 'file_type', 'status', 'progress_display', 'expires', 'download')
+    list_display_links = ('created',)
+    list_filter = ['status', 'file_type', 'created']
+    refresh_times = (3, 5, 10)
+    model_icon = 'fa fa-download'
+    remove_permissions = ('add', 'change')
+
+    def queryset(self):
+        # the exports of the user
+        qs = super(ExportJobAdmin, self).queryset()
+        if not self.user.is_superuser:
+            qs = qs.filter(user=self.user)
+        return qs
+
+    def has_view_permission(self, obj=None):
+        # the users only see their own exports
+        if obj is not None and obj.user_id != self.user.pk and not self.user.is_superuser:
+            return False
+        return super(ExportJobAdmin, self).has_view_permission(obj)
+
+    def has_delete_permission(self, obj=None):
+        return self.has_view_permission(obj)
+
+xadmin.site.register(ExportJob, ExportJobAdmin)
+
+
+class ImportJobAdmin(object):
+
+    def imported_model(self, instance):
+        try:
+            return capfirst(apps.get_model(instance.model)._meta.verbose_name_plural)
+        except LookupError:
+            return instance.model
+    imported_model.short_description = _('Model')
+
+    def progress_display(self, instance):
+        progress = instance.get_progress()
+        if instance.total and instance.status == 'running':
+            return '%d / %d (%d%%)' % (progress, instance.total, min(100, progress * 100 // instance.total))
+        return progress
+    progress_display.short_description = _('Imported rows')
+
+    def outcome(self, instance):
+        if instance.status == 'failed':
+            return "<span class='text-danger'>%s</span>" % escape(instance.error)
+        return escape(instance.result)
+    outcome.short_description = _('Result')
+    outcome.allow_tags = True
+    outcome.is_column = False
+
+    list_display = ('created', 'imported_model', 'file_name', 'status', 'progress_display', 'outcome')
+    list_display_links = ('created',)
+    list_filter = ['status', 'created']
+    refresh_times = (3, 5, 10)
+    model_icon = 'fa fa-upload'
+    remove_permissions = ('add', 'change')
+
+    def queryset(self):
+        # the imports of the user
+        qs = super(ImportJobAdmin, self).queryset()
+        if not self.user.is_superuser:
+            qs = qs.filter(user=self.user)
+        return qs
+
+    def has_view_permission(self, obj=None):
+        # the users only see their own imports
+        if obj is not None and obj.user_id != self.user.pk and not self.user.is_superuser:
+            return False
+        return super(ImportJobAdmin, self).has_view_permission(obj)
+
+    def has_delete_permission(self, obj=None):
+        return self.has_view_permission(obj)
+
+xadmin.site.register(ImportJob, ImportJobAdmin)
@@ -13,3 +13,7 @@ class XAdminConfig(AppConfig):
     def ready(self):
         self.module.autodiscover()
         setattr(xadmin,'site',xadmin.site)
+
+        from xadmin.filters import connect_model_generations, register_date_rollups
+        connect_model_generations()
+        register_date_rollups(xadmin.site)
@@ -10,19 +10,354 @@ from django.utils import six
 from django.utils.safestring import mark_safe
 from django.utils.html import escape,format_html
 from django.utils.text import Truncator
-from django.core.cache import cache, caches
+from django.core.cache import caches
+from django.conf import settings
+from django.db import connections, transaction, IntegrityError
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.utils.encoding import force_bytes
+from django.utils.formats import date_format
+from django.utils.text import capfirst
 
 from xadmin.views.list import EMPTY_CHANGELIST_VALUE
-from xadmin.util import is_related_field,is_related_field2
+from xadmin.util import is_related_field,is_related_field2,lookup_needs_distinct
 import datetime
+import hashlib
+import threading
+import time
+from collections import Counter
+
+try:
+    from django.db.models.functions import Trunc
+except ImportError:  # Django < 1.10
+    Trunc = None
 
 FILTER_PREFIX = '_p_'
 SEARCH_VAR = '_q_'
 
-from .util import (get_model_from_relation,
+from .util import (get_model_from_relation, get_fields_from_path,
     reverse_field_path, get_limit_choices_to_from_path, prepare_lookup_value)
 
 
+def get_filter_cache():
+    return caches[getattr(settings, 'XADMIN_FILTER_CACHE', 'default')]
+
+
+def _generation_key(model):
+    return 'xadmin_generation_%s' % model._meta.label_lower
+
+
+def bump_model_generation(sender, **kwargs):
+    """
+    Change the cache generation of the model ``sender``. It is connected to the
+    save and delete signals, call it after ``update()`` or ``bulk_create()``
+    which don't send them.
+    """
+    key = _generation_key(sender._meta.concrete_model)
+    try:
+        get_filter_cache().incr(key)
+    except ValueError:
+        # no generation yet, nothing is cached for the model
+        pass
+
+
+def _bump_m2m_generation(sender, instance, model, action, **kwargs):
+    if action.startswith('post_'):
+        bump_model_generation(instance.__class__)
+        bump_model_generation(model)
+
+
+def connect_model_generations():
+    """
+    Bump the cache generations on the save, delete and many to many signals
+    of every model. It is connected when the app is ready, so that a process
+    which never read a generation still bumps it.
+    """
+    post_save.connect(bump_model_generation, dispatch_uid='xadmin_generation_save')
+    post_delete.connect(bump_model_generation, dispatch_uid='xadmin_generation_delete')
+    m2m_changed.connect(_bump_m2m_generation, dispatch_uid='xadmin_generation_m2m')
+
+
+def model_generation(model):
+    """
+    Return the cache generation of ``model``, it changes each time an object of
+    the model is saved or deleted, or a many to many relation of it changes.
+    Cache keys built with it don't need to be deleted, they are just no longer
+    used.
+    """
+    key = _generation_key(model._meta.concrete_model)
+    generation = get_filter_cache().get(key)
+    if generation is None:
+        generation = int(time.time() * 1000)
+        if not get_filter_cache().add(key, generation, None):
+            generation = get_filter_cache().get(key, generation)
+    return generation
+
+
+def _load_distinct_values(values_queryset, limit):
+    values = list(values_queryset[:limit + 1] if limit is not None else values_queryset)
+    more = 0
+    if limit is not None and len(values) > limit:
+        values = values[:limit]
+        more = values_queryset.count() - limit
+    return values, more
+
+
+def _refresh_distinct_values(cache, key, values_queryset, limit, generation, timeout):
+    try:
+        values, more = _load_distinct_values(values_queryset, limit)
+        cache.set(key, {'generation': generation, 'values': values, 'more': more}, timeout)
+    finally:
+        cache.delete(key + '_lock')
+        connections.close_all()
+
+
+def get_distinct_values(values_queryset, path_models, limit=None, cache=None, timeout=None):
+    """
+    Return the first ``limit`` values of ``values_queryset``, a distinct
+    ``values_list`` query, and how many values are left out.
+
+    The values are cached until an object of one of ``path_models`` changes, so
+    the distinct scan runs once per data change instead of once per request. When
+    the data has changed and ``XADMIN_FILTER_BACKGROUND_REFRESH`` is on, the
+    old values are returned while a thread loads the new ones.
+    """
+    cache = cache or get_filter_cache()
+    if timeout is None:
+        timeout = getattr(settings, 'XADMIN_FILTER_CACHE_TIMEOUT', 86400)
+    generation = tuple(model_generation(model) for model in path_models)
+    key = 'xadmin_distinct_%s' % hashlib.md5(
+        force_bytes('%s|%s|%s' % (values_queryset.model._meta.label_lower, values_queryset.query, limit))).hexdigest()
+
+    entry = cache.get(key)
+    if entry is not None:
+        if entry['generation'] == generation:
+            return entry['values'], entry['more']
+        if getattr(settings, 'XADMIN_FILTER_BACKGROUND_REFRESH', True):
+            if cache.add(key + '_lock', 1, 60):
+                thread = threading.Thread(target=_refresh_distinct_values,
+                                          args=(cache, key, values_queryset, limit, generation, timeout))
+                # doesn't hold the exit of the process
+                thread.daemon = True
+                thread.start()
+            return entry['values'], entry['more']
+
+    values, more = _load_distinct_values(values_queryset, limit)
+    cache.set(key, {'generation': generation, 'values': values, 'more': more}, timeout)
+    return values, more
+
+
+def get_facet_counts(queryset, field_path, path_models, timeout=None):
+    """
+    Return a dict of the number of ``queryset`` rows for each value of
+    ``field_path``, keyed by the text of the value, with one grouped query.
+    The counts are cached for each state of the filters, that is each sql of
+    ``queryset``, until an object of one of ``path_models`` changes.
+    """
+    cache = get_filter_cache()
+    if timeout is None:
+        timeout = getattr(settings, 'XADMIN_FILTER_CACHE_TIMEOUT', 86400)
+    model = queryset.model
+    generation = tuple(model_generation(m) for m in path_models)
+    key = 'xadmin_facets_%s' % hashlib.md5(
+        force_bytes('%s|%s|%s' % (model._meta.label_lower, field_path, queryset.query))).hexdigest()
+
+    entry = cache.get(key)
+    if entry is not None and entry['generation'] == generation:
+        return entry['counts']
+
+    # group the rows of the plain model, the list queryset may be annotated
+    facet_queryset = model._base_manager.filter(pk__in=queryset.order_by().values('pk'))
+    count = models.Count('pk', distinct=lookup_needs_distinct(model._meta, field_path))
+    counts = {}
+    for row in facet_queryset.values(field_path).annotate(facet_count=count).order_by():
+        value = row[field_path]
+        counts[value if value is None else smart_text(value)] = row['facet_count']
+    cache.set(key, {'generation': generation, 'counts': counts}, timeout)
+    return counts
+
+
+def _to_day(value):
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.date()
+    return value
+
+
+def get_date_histogram(queryset, field_path, kind, path_models, timeout=None):
+    """
+    Return the ``(date, count)`` of each ``kind`` period, year, month or day,
+    of ``field_path`` in ``queryset`` with one grouped query. Like the facet
+    counts they are cached for each sql of ``queryset``.
+    """
+    if Trunc is None:
+        dates = queryset.datetimes(field_path, kind) if isinstance(
+            get_fields_from_path(queryset.model, field_path)[-1], models.DateTimeField) \
+            else queryset.dates(field_path, kind)
+        return [(_to_day(date), None) for date in dates]
+
+    cache = get_filter_cache()
+    if timeout is None:
+        timeout = getattr(settings, 'XADMIN_FILTER_CACHE_TIMEOUT', 86400)
+    model = queryset.model
+    generation = tuple(model_generation(m) for m in path_models)
+    key = 'xadmin_dates_%s' % hashlib.md5(force_bytes('%s|%s|%s|%s' % (
+        model._meta.label_lower, field_path, kind, queryset.query))).hexdigest()
+
+    entry = cache.get(key)
+    if entry is not None and entry['generation'] == generation:
+        return entry['histogram']
+
+    histogram_queryset = model._base_manager.filter(pk__in=queryset.order_by().values('pk')) \
+        .exclude(**{'%s__isnull' % field_path: True})
+    rows = histogram_queryset.annotate(xadmin_period=Trunc(field_path, kind)).values('xadmin_period') \
+        .annotate(xadmin_count=models.Count('pk')).order_by('xadmin_period')
+    histogram = [(_to_day(row['xadmin_period']), row['xadmin_count']) for row in rows]
+    cache.set(key, {'generation': generation, 'histogram': histogram}, timeout)
+    return histogram
+
+
+_rollup_fields = {}
+
+
+def register_date_rollup(model, field_name):
+    """
+    Keep the ``DateRollup`` day counts of the date field ``field_name`` of
+    ``model`` up to date when its objects are saved or deleted. ``update()``
+    and ``bulk_create()`` don't send the signals, run the
+    ``xadmin_date_rollup`` command after them.
+    """
+    model = model._meta.concrete_model
+    if model not in _rollup_fields:
+        _rollup_fields[model] = set()
+        pre_save.connect(_rollup_pre_save, sender=model)
+        post_save.connect(_rollup_post_save, sender=model)
+        post_delete.connect(_rollup_post_delete, sender=model)
+    _rollup_fields[model].add(field_name)
+
+
+def register_date_rollups(admin_site):
+    """
+    Register the rollups of the date hierarchy filters of ``admin_site``, so
+    the counts are kept by every process, not only the ones showing lists.
+    """
+    for model, admin_class in admin_site._registry.items():
+        for list_filter in getattr(admin_class, 'list_filter', ()):
+            if not isinstance(list_filter, (tuple, list)):
+                continue
+            field_path, filter_class = list_filter
+            if isinstance(filter_class, type) and issubclass(filter_class, DateHierarchyListFilter) \
+                    and filter_class.rollup and isinstance(field_path, six.string_types) \
+                    and LOOKUP_SEP not in field_path:
+                register_date_rollup(model, field_path)
+
+
+def add_date_rollup(model, field_name, day, delta):
+    from xadmin.models import DateRollup
+
+    rows = DateRollup.objects.filter(model=model._meta.label_lower, field=field_name, day=day)
+    if not rows.update(count=models.F('count') + delta):
+        try:
+            with transaction.atomic():
+                DateRollup.objects.create(model=model._meta.label_lower, field=field_name, day=day, count=delta)
+        except IntegrityError:
+            rows.update(count=models.F('count') + delta)
+
+
+def rebuild_date_rollup(model, field_name):
+    """
+    Count the rows of ``model`` for each day of ``field_name`` again.
+    """
+    from xadmin.models import DateRollup
+
+    if Trunc is None:
+        counts = Counter(_to_day(value) for value in
+                         model._base_manager.values_list(field_name, flat=True).iterator())
+    else:
+        rows = model._base_manager.annotate(xadmin_day=Trunc(field_name, 'day')).values('xadmin_day') \
+            .annotate(xadmin_count=models.Count('pk')).order_by()
+        counts = Counter()
+        for row in rows:
+            counts[_to_day(row['xadmin_day'])] += row['xadmin_count']
+    with transaction.atomic():
+        DateRollup.objects.filter(model=model._meta.label_lower, field=field_name).delete()
+        DateRollup.objects.bulk_create([
+            DateRollup(model=model._meta.label_lower, field=field_name, day=day, count=count)
+            for day, count in counts.items()])
+
+
+def _rollup_pre_save(sender, instance, **kwargs):
+    old_days = None
+    if instance.pk is not None:
+        old_values = sender._base_manager.filter(pk=instance.pk).values(*_rollup_fields[sender]).first()
+        if old_values is not None:
+            old_days = dict((name, _to_day(value)) for name, value in old_values.items())
+    instance._xadmin_rollup_days = old_days
+
+
+def _rollup_post_save(sender, instance, **kwargs):
+    old_days = getattr(instance, '_xadmin_rollup_days', None)
+    for name in _rollup_fields[sender]:
+        day = _to_day(getattr(instance, name))
+        if old_days is None:
+            add_date_rollup(sender, name, day, 1)
+        elif old_days[name] != day:
+            add_date_rollup(sender, name, old_days[name], -1)
+            add_date_rollup(sender, name, day, 1)
+    instance._xadmin_rollup_days = None
+
+
+def _rollup_post_delete(sender, instance, **kwargs):
+    for name in _rollup_fields[sender]:
+        add_date_rollup(sender, name, _to_day(getattr(instance, name)), -1)
+
+
+def get_rollup_histogram(model, field_name, kind, lookups):
+    """
+    Return the ``(date, count)`` of each ``kind`` period of the ``DateRollup``
+    counts of ``field_name``, ``lookups`` filter the ``day`` of the counts.
+    """
+    from xadmin.models import DateRollup
+
+    rows = DateRollup.objects.filter(model=model._meta.label_lower, field=field_name, day__isnull=False, **lookups)
+    if Trunc is None:
+        return [(date, None) for date in rows.dates('day', kind)]
+    rows = rows.annotate(xadmin_period=Trunc('day', kind)).values('xadmin_period') \
+        .annotate(xadmin_count=models.Sum('count')).order_by('xadmin_period')
+    return [(_to_day(row['xadmin_period']), row['xadmin_count']) for row in rows if row['xadmin_count'] > 0]
+
+
+def get_path_models(model, field_path):
+    """
+    Return ``model`` and the models the relations of ``field_path`` go through.
+    """
+    path_models = [model]
+    for field in get_fields_from_path(model, field_path):
+        if is_related_field2(field):
+            path_models.append(get_model_from_relation(field))
+    return path_models
+
+
+def get_related_choices_queryset(field):
+    """
+    Return the queryset of the objects ``field`` can point to.
+    """
+    queryset = get_model_from_relation(field)._default_manager.all()
+    if hasattr(field, 'get_limit_choices_to'):
+        queryset = queryset.complex_filter(field.get_limit_choices_to())
+    return queryset
+
+
+def get_related_value_attname(field):
+    """
+    Return the attribute of the related objects stored by ``field``.
+    """
+    if hasattr(field, 'rel'):
+        return field.rel.get_related_field().attname
+    return get_model_from_relation(field)._meta.pk.attname
+
+
 class BaseFilter(object):
     title = None
     template = 'xadmin/filters/list.html'
@@ -92,10 +427,14 @@ class FieldFilterManager(object):
             self._field_list_filters.append(list_filter_class)
         return list_filter_class
 
-    def create(self, field, request, params, model, admin_view, field_path):
+    def get_filter_class(self, field, request, params, model, admin_view, field_path):
         for list_filter_class in self._field_list_filters:
-            if not list_filter_class.test(field, request, params, model, admin_view, field_path):
-                continue
+            if list_filter_class.test(field, request, params, model, admin_view, field_path):
+                return list_filter_class
+
+    def create(self, field, request, params, model, admin_view, field_path):
+        list_filter_class = self.get_filter_class(field, request, params, model, admin_view, field_path)
+        if list_filter_class:
             return list_filter_class(field, request, params,
                                      model, admin_view, field_path=field_path)
 
@@ -149,6 +488,23 @@ class FieldFilter(BaseFilter):
 
 class ListFieldFilter(FieldFilter):
     template = 'xadmin/filters/list.html'
+    facet_counts = None
+
+    def get_facet_field(self):
+        return self.field_path
+
+    def load_facet_counts(self, queryset):
+        """
+        Count the rows of ``queryset`` for each choice, the counts are shown
+        next to the choices.
+        """
+        self.facet_counts = get_facet_counts(
+            queryset, self.get_facet_field(), get_path_models(self.model, self.field_path))
+
+    def facet_count(self, value):
+        if self.facet_counts is None:
+            return None
+        return self.facet_counts.get(value if value is None else smart_text(value), 0)
 
     def get_context(self):
         context = super(ListFieldFilter, self).get_context()
@@ -180,6 +536,7 @@ class BooleanFieldListFilter(ListFieldFilter):
                             [self.lookup_isnull_name],
                             ),
                     'display': title,
+                    'count': self.facet_count(lookup == '1') if lookup else None,
                     }
         if isinstance(self.field, models.NullBooleanField):
             yield {
@@ -189,6 +546,7 @@ class BooleanFieldListFilter(ListFieldFilter):
                                 [self.lookup_exact_name],
                                 ),
                     'display': _('Unknown'),
+                    'count': self.facet_count(None),
                     }
 
 
@@ -211,6 +569,7 @@ class ChoicesFieldListFilter(ListFieldFilter):
                 'selected': smart_text(lookup) == self.lookup_exact_val,
                 'query_string': self.query_string({self.lookup_exact_name: lookup}),
                 'display': title,
+                'count': self.facet_count(lookup),
             }
 
 
@@ -309,6 +668,11 @@ class DateFieldListFilter(ListFieldFilter):
             }),
         )
 
+    def load_facet_counts(self, queryset):
+        # the choices are date ranges, grouping by the dates would count each
+        # distinct value
+        pass
+
     def get_context(self):
         context = super(DateFieldListFilter, self).get_context()
         context['choice_selected'] = bool(self.lookup_year_val) or bool(self.lookup_month_val) \
@@ -325,6 +689,109 @@ class DateFieldListFilter(ListFieldFilter):
             }
 
 
+class DateHierarchyListFilter(ListFieldFilter):
+    """
+    Drill down filter of a date field, by year, then month, then day, with the
+    number of rows of each period::
+
+        list_filter = (('created', DateHierarchyListFilter),)
+
+    The periods of the current level are counted by one grouped query, cached
+    until the model changes. A subclass with ``rollup = True`` reads the
+    counts of the unfiltered list from the ``DateRollup`` table, kept up to
+    date on save and delete, build it with the ``xadmin_date_rollup`` command.
+    """
+    lookup_formats = {'year': '%s__year', 'month': '%s__month', 'day': '%s__day'}
+    # The filter plugin loads the counts of the list rows
+    always_count = True
+    rollup = False
+    histogram = None
+
+    @classmethod
+    def test(cls, field, request, params, model, admin_view, field_path):
+        return isinstance(field, models.DateField)
+
+    def __init__(self, field, request, params, model, admin_view, field_path):
+        super(DateHierarchyListFilter, self).__init__(
+            field, request, params, model, admin_view, field_path)
+        self.field_generic = '%s__' % field_path
+        self.year = self.get_int_value(self.lookup_year_val)
+        self.month = self.year and self.get_int_value(self.lookup_month_val)
+        self.day = self.month and self.get_int_value(self.lookup_day_val)
+        if self.year is None:
+            self.kind = 'year'
+        elif self.month is None:
+            self.kind = 'month'
+        else:
+            self.kind = 'day'
+
+    def get_int_value(self, value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def get_level_lookups(self, field_path):
+        lookups = {}
+        if self.year is not None:
+            lookups['%s__year' % field_path] = self.year
+        if self.month is not None:
+            lookups['%s__month' % field_path] = self.month
+        return lookups
+
+    def do_filte(self, queryset):
+        lookups = self.get_level_lookups(self.field_path)
+        if self.day is not None:
+            lookups['%s__day' % self.field_path] = self.day
+        return queryset.filter(**lookups)
+
+    def get_histogram(self, queryset):
+        if self.rollup and LOOKUP_SEP not in self.field_path and not queryset.query.has_filters():
+            return get_rollup_histogram(self.model, self.field_path, self.kind, self.get_level_lookups('day'))
+        return get_date_histogram(queryset.filter(**self.get_level_lookups(self.field_path)),
+                                  self.field_path, self.kind, get_path_models(self.model, self.field_path))
+
+    def load_facet_counts(self, queryset):
+        self.histogram = self.get_histogram(queryset)
+
+    def get_period_display(self, date):
+        if self.kind == 'year':
+            return str(date.year)
+        elif self.kind == 'month':
+            return capfirst(date_format(date, 'YEAR_MONTH_FORMAT'))
+        return capfirst(date_format(date, 'MONTH_DAY_FORMAT'))
+
+    def choices(self):
+        if self.histogram is None:
+            self.histogram = self.get_histogram(self.admin_view.queryset())
+        remove = [FILTER_PREFIX + self.field_generic]
+        yield {
+            'selected': self.year is None,
+            'query_string': self.query_string({}, remove),
+            'display': _('All dates'),
+            'count': None,
+        }
+        if self.month is not None:
+            yield {
+                'selected': False,
+                'query_string': self.query_string({self.lookup_year_name: self.year}, remove),
+                'display': str(self.year),
+                'count': None,
+            }
+        for date, count in self.histogram:
+            params = {self.lookup_year_name: date.year}
+            if self.kind != 'year':
+                params[self.lookup_month_name] = date.month
+            if self.kind == 'day':
+                params[self.lookup_day_name] = date.day
+            yield {
+                'selected': self.kind == 'day' and date.day == self.day,
+                'query_string': self.query_string(params, remove),
+                'display': self.get_period_display(date),
+                'count': count,
+            }
+
+
 @manager.register
 class RelatedFieldSearchFilter(FieldFilter):
     template = 'xadmin/filters/fk_search.html'
@@ -383,6 +850,9 @@ class RelatedFieldSearchFilter(FieldFilter):
 
 @manager.register
 class RelatedFieldListFilter(ListFieldFilter):
+    # Related tables with more rows are filtered with a search box
+    choices_threshold = getattr(settings, 'XADMIN_FILTER_CHOICES_THRESHOLD', 200)
+    choices_cache_timeout = 3600
 
     @classmethod
     def test(cls, field, request, params, model, admin_view, field_path):
@@ -397,7 +867,6 @@ class RelatedFieldListFilter(ListFieldFilter):
 
         self.lookup_formats = {'in': '%%s__%s__in' % rel_name,'exact': '%%s__%s__exact' %
                                rel_name, 'isnull': '%s__isnull'}
-        self.lookup_choices = field.get_choices(include_blank=False)
         super(RelatedFieldListFilter, self).__init__(
             field, request, params, model, model_admin, field_path)
 
@@ -407,7 +876,63 @@ class RelatedFieldListFilter(ListFieldFilter):
             self.lookup_title = other_model._meta.verbose_name
         self.title = self.lookup_title
 
+        self.rel_name = rel_name
+        self.lookup_choices, self.search_choices = self.get_lookup_choices()
+        if self.search_choices:
+            self.template = 'xadmin/filters/fk_search.html'
+            self.search_url = model_admin.model_admin_url('filter_choices', field_path)
+            self.label = self.label_for_value(other_model, rel_name, self.lookup_exact_val) \
+                if self.lookup_exact_val else ""
+
+    def get_lookup_choices(self):
+        """
+        Return the ``(value, label)`` choices and whether the related table has
+        more than ``choices_threshold`` rows, in that case no choices are
+        loaded and the filter searches the table instead. The result is cached
+        until an object of the related model is saved or deleted.
+        """
+        other_model = get_model_from_relation(self.field)
+        key = 'xadmin_filter_choices_%s_%s_%s' % (
+            self.model._meta.label_lower, self.field_path, model_generation(other_model))
+        cache = get_filter_cache()
+        result = cache.get(key)
+        if result is None:
+            attname = get_related_value_attname(self.field)
+            objs = list(get_related_choices_queryset(self.field)[:self.choices_threshold + 1])
+            if len(objs) > self.choices_threshold:
+                result = ([], True)
+            else:
+                result = ([(getattr(obj, attname), smart_text(obj)) for obj in objs], False)
+            cache.set(key, result, self.choices_cache_timeout)
+        return result
+
+    def get_facet_field(self):
+        return '%s__%s' % (self.field_path, self.rel_name)
+
+    def load_facet_counts(self, queryset):
+        # the search box has no choices to count
+        if not self.search_choices:
+            super(RelatedFieldListFilter, self).load_facet_counts(queryset)
+
+    def label_for_value(self, other_model, rel_name, value):
+        try:
+            obj = other_model._default_manager.get(**{rel_name: value})
+            return Truncator(obj).words(14, truncate='...')
+        except (ValueError, other_model.DoesNotExist):
+            return ""
+
+    def get_context(self):
+        context = super(RelatedFieldListFilter, self).get_context()
+        if self.search_choices:
+            context['search_url'] = self.search_url
+            context['label'] = self.label
+            context['choices'] = '?'
+            context['relfield_style'] = 'fk-ajax'
+        return context
+
     def has_output(self):
+        if self.search_choices:
+            return True
         if (is_related_field(self.field)
                 and self.field.field.null or hasattr(self.field, 'rel')
                 and self.field.null):
@@ -433,6 +958,7 @@ class RelatedFieldListFilter(ListFieldFilter):
                     self.lookup_exact_name: pk_val,
                 }, [self.lookup_isnull_name]),
                 'display': val,
+                'count': self.facet_count(pk_val),
             }
         if (is_related_field(self.field)
                 and self.field.field.null or hasattr(self.field, 'rel')
@@ -443,6 +969,7 @@ class RelatedFieldListFilter(ListFieldFilter):
                     self.lookup_isnull_name: 'True',
                 }, [self.lookup_exact_name]),
                 'display': EMPTY_CHANGELIST_VALUE,
+                'count': self.facet_count(None),
             }
 
 @manager.register
@@ -455,55 +982,44 @@ class MultiSelectFieldListFilter(ListFieldFilter):
     """
     template = 'xadmin/filters/checklist.html'
     lookup_formats = {'in': '%s__in'}
-    cache_config = {'enabled':False,'key':'quickfilter_%s','timeout':3600,'cache':'default'}
- 
+    cache_config = {'enabled': False, 'timeout': 3600, 'cache': 'default'}
+    # all the values, unless the quick filter has a 'limit'
+    values_limit = None
+
     @classmethod
     def test(cls, field, request, params, model, admin_view, field_path):
         return True
- 
-    def get_cached_choices(self):
-        if not self.cache_config['enabled']:
-            return None
-        c = caches(self.cache_config['cache'])
-        return c.get(self.cache_config['key']%self.field_path)
-    
-    def set_cached_choices(self,choices):
-        if not self.cache_config['enabled']:
-            return
-        c = caches(self.cache_config['cache'])
-        return c.set(self.cache_config['key']%self.field_path,choices)
-    
+
     def __init__(self, field, request, params, model, model_admin, field_path,field_order_by=None,field_limit=None,sort_key=None,cache_config=None):
         super(MultiSelectFieldListFilter,self).__init__(field, request, params, model, model_admin, field_path)
-        
-        # Check for it in the cachce
+
         if cache_config is not None and type(cache_config)==dict:
-            self.cache_config.update(cache_config)
-        
-        if self.cache_config['enabled']:
-            self.field_path = field_path
-            choices = self.get_cached_choices()
-            if choices:
-                self.lookup_choices = choices
-                return
-            
-        # Else rebuild it
-        queryset = self.admin_view.queryset().exclude(**{"%s__isnull"%field_path:True}).values_list(field_path, flat=True).distinct() 
-        #queryset = self.admin_view.queryset().distinct(field_path).exclude(**{"%s__isnull"%field_path:True})
-        
+            self.cache_config = dict(self.cache_config, **cache_config)
+
+        queryset = self.admin_view.queryset().exclude(**{"%s__isnull"%field_path:True}).values_list(field_path, flat=True).distinct()
         if field_order_by is not None:
             # Do a subquery to order the distinct set
-            queryset = self.admin_view.queryset().filter(id__in=queryset).order_by(field_order_by)
-            
-        if field_limit is not None and type(field_limit)==int and queryset.count()>field_limit:
-            queryset = queryset[:field_limit]
-        
-        self.lookup_choices = [str(it) for it in queryset.values_list(field_path,flat=True) if str(it).strip()!=""]
+            queryset = self.admin_view.queryset().filter(id__in=queryset).order_by(field_order_by) \
+                .values_list(field_path, flat=True)
+
+        if field_limit is None or type(field_limit) != int:
+            field_limit = self.values_limit
+
+        if self.cache_config['enabled']:
+            cache = self.cache_config['cache'] and caches[self.cache_config['cache']]
+            values, self.more_count = get_distinct_values(
+                queryset, get_path_models(model, field_path), field_limit, cache, self.cache_config['timeout'])
+        else:
+            values, self.more_count = _load_distinct_values(queryset, field_limit)
+
+        self.lookup_choices = [str(it) for it in values if str(it).strip()!=""]
         if sort_key is not None:
             self.lookup_choices = sorted(self.lookup_choices,key=sort_key)
-        
-        if self.cache_config['enabled']:
-            self.set_cached_choices(self.lookup_choices) 
+
+    def get_context(self):
+        context = super(MultiSelectFieldListFilter, self).get_context()
+        context['more_count'] = self.more_count
+        return context
 
     def choices(self):
         self.lookup_in_val = (type(self.lookup_in_val) in (tuple,list)) and self.lookup_in_val or list(self.lookup_in_val)
@@ -518,6 +1034,7 @@ class MultiSelectFieldListFilter(ListFieldFilter):
                 'query_string': self.query_string({self.lookup_in_name: ",".join([val]+self.lookup_in_val),}),
                 'remove_query_string': self.query_string({self.lookup_in_name: ",".join([v for v in self.lookup_in_val if v != val]),}),
                 'display': val,
+                'count': self.facet_count(val),
             }
 
 @manager.register
@@ -528,6 +1045,8 @@ class AllValuesFieldListFilter(ListFieldFilter):
     def test(cls, field, request, params, model, admin_view, field_path):
         return True
 
+    values_limit = getattr(settings, 'XADMIN_FILTER_VALUES_LIMIT', 200)
+
     def __init__(self, field, request, params, model, admin_view, field_path):
         parent_model, reverse_path = reverse_field_path(model, field_path)
         queryset = parent_model._default_manager.all()
@@ -537,13 +1056,17 @@ class AllValuesFieldListFilter(ListFieldFilter):
         limit_choices_to = get_limit_choices_to_from_path(model, field_path)
         queryset = queryset.filter(limit_choices_to)
 
-        self.lookup_choices = (queryset
-                               .distinct()
-                               .order_by(field.name)
-                               .values_list(field.name, flat=True))
+        self.lookup_choices, self.more_count = get_distinct_values(
+            queryset.distinct().order_by(field.name).values_list(field.name, flat=True),
+            get_path_models(model, field_path), self.values_limit)
         super(AllValuesFieldListFilter, self).__init__(
             field, request, params, model, admin_view, field_path)
 
+    def get_context(self):
+        context = super(AllValuesFieldListFilter, self).get_context()
+        context['more_count'] = self.more_count
+        return context
+
     def choices(self):
         yield {
             'selected': (self.lookup_exact_val is '' and self.lookup_isnull_val is ''),
@@ -561,6 +1084,7 @@ class AllValuesFieldListFilter(ListFieldFilter):
                 'query_string': self.query_string({self.lookup_exact_name: val},
                                                   [self.lookup_isnull_name]),
                 'display': val,
+                'count': self.facet_count(val),
             }
         if include_none:
             yield {
@@ -568,4 +1092,5 @@ class AllValuesFieldListFilter(ListFieldFilter):
                 'query_string': self.query_string({self.lookup_isnull_name: 'True'},
                                                   [self.lookup_exact_name]),
                 'display': EMPTY_CHANGELIST_VALUE,
+                'count': self.facet_count(None),
             }
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from xadmin.filters import _rollup_fields, rebuild_date_rollup
+
+
+class Command(BaseCommand):
+    help = "Count again the rows of each day of the date hierarchy filters with a rollup."
+
+    def add_arguments(self, parser):
+        parser.add_argument('fields', nargs='*', metavar='app_label.ModelName.field',
+                            help='Only rebuild the counts of these fields.')
+
+    def handle(self, *args, **options):
+        labels = set(label.lower() for label in options['fields'])
+        found = set()
+        for model, field_names in _rollup_fields.items():
+            for field_name in sorted(field_names):
+                label = '%s.%s' % (model._meta.label_lower, field_name.lower())
+                if labels and label not in labels:
+                    continue
+                found.add(label)
+                rebuild_date_rollup(model, field_name)
+                self.stdout.write('Rebuilt the date rollup of %s' % label)
+
+        missing = labels - found
+        if missing:
+            raise CommandError('Unknown fields or fields without a rollup: %s' % ', '.join(sorted(missing)))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from xadmin.plugins.exportjob import delete_expired_export_jobs, run_pending_export_jobs
+
+
+class Command(BaseCommand):
+    help = "Run the background exports of the change lists, with XADMIN_EXPORT_JOB_RUNNER = 'command'."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', dest='once', default=False,
+                            help='Run the pending exports and exit.')
+        parser.add_argument('--interval', type=float, dest='interval', default=5,
+                            help='Seconds between the polls of the pending exports.')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            # the parallel exports fork the processes of the command
+            count = run_pending_export_jobs(fork=True)
+            delete_expired_export_jobs()
+            if count:
+                self.stdout.write('Ran %d exports' % count)
+            if options['once']:
+                break
+            time.sleep(options['interval'])
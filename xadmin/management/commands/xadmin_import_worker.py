@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from xadmin.plugins.importexport import run_pending_import_jobs
+
+
+class Command(BaseCommand):
+    help = "Run the background imports, with XADMIN_IMPORT_JOB_RUNNER = 'command'."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', dest='once', default=False,
+                            help='Run the pending imports and exit.')
+        parser.add_argument('--interval', type=float, dest='interval', default=5,
+                            help='Seconds between the polls of the pending imports.')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            # the checks of the rows fork the processes of the command
+            count = run_pending_import_jobs(fork=True)
+            if count:
+                self.stdout.write('Ran %d imports' % count)
+            if options['once']:
+                break
+            time.sleep(options['interval'])
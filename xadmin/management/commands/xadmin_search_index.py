@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+import xadmin
+from xadmin.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Build or refresh the indexes of the search backends of the xadmin models."
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', metavar='app_label.ModelName',
+                            help='Only index these models.')
+        parser.add_argument('--refresh', action='store_true', dest='refresh', default=False,
+                            help='Refresh the content of existing indexes instead of creating them.')
+        parser.add_argument('--database', dest='database', default=DEFAULT_DB_ALIAS,
+                            help='Nominates a database. Defaults to the "default" database.')
+
+    def handle(self, *args, **options):
+        labels = set(label.lower() for label in options['models'])
+        found = set()
+        for model, admin_class in xadmin.site._registry.items():
+            label = model._meta.label_lower
+            if labels and label not in labels:
+                continue
+            found.add(label)
+            search_fields = getattr(admin_class, 'search_fields', None)
+            if not search_fields:
+                continue
+            backend = get_search_backend(getattr(admin_class, 'search_backend', None))(model, search_fields)
+            if backend.build_index(options['database'], refresh=options['refresh']):
+                self.stdout.write('%s %s index of %s' % (
+                    options['refresh'] and 'Refreshed' or 'Built', backend.__class__.__name__, label))
+
+        missing = labels - found
+        if missing:
+            raise CommandError('Unknown or unregistered models: %s' % ', '.join(sorted(missing)))
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xadmin', '0003_auto_20160715_0100'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DateRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, verbose_name='Model')),
+                ('field', models.CharField(max_length=100, verbose_name='Field')),
+                ('day', models.DateField(blank=True, null=True, verbose_name='Day')),
+                ('count', models.IntegerField(default=0, verbose_name='Count')),
+            ],
+            options={
+                'verbose_name': 'Date Rollup',
+                'verbose_name_plural': 'Date Rollups',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='daterollup',
+            unique_together=set([('model', 'field', 'day')]),
+        ),
+    ]
@@ -3,6 +3,7 @@ import django
 from django.db import models
 from django.utils import timezone
 from django.conf import settings
+from django.core.cache import caches
 from django.contrib.contenttypes.models import ContentType
 from django.utils.translation import ugettext_lazy as _, ugettext
 from django.core.urlresolvers import NoReverseMatch, reverse
@@ -187,3 +188,106 @@ class Log(models.Model):
         "Returns the edited object represented by this log entry"
         return self.content_type.get_object_for_this_type(pk=self.object_id)
 
+
+
+@python_2_unicode_compatible
+class DateRollup(models.Model):
+    """
+    Number of rows of a model for each day of a date field, read by the date
+    hierarchy filter with ``rollup`` enabled.
+    """
+    model = models.CharField(_(u'Model'), max_length=100)
+    field = models.CharField(_(u'Field'), max_length=100)
+    day = models.DateField(_(u'Day'), blank=True, null=True)
+    count = models.IntegerField(_(u'Count'), default=0)
+
+    class Meta:
+        verbose_name = _(u'Date Rollup')
+        verbose_name_plural = _('Date Rollups')
+        unique_together = ('model', 'field', 'day')
+
+    def __str__(self):
+        return "%s.%s %s: %s" % (self.model, self.field, self.day, self.count)
+
+
+@python_2_unicode_compatible
+class ExportJob(models.Model):
+    """
+    An export of a change list run in the background, the list is exported
+    again from its query string.
+    """
+    STATUS_CHOICES = (
+        ('pending', _(u'Pending')),
+        ('running', _(u'Running')),
+        ('done', _(u'Done')),
+        ('failed', _(u'Failed')),
+    )
+
+    user = models.ForeignKey(AUTH_USER_MODEL, verbose_name=_(u"user"), on_delete=models.CASCADE)
+    model = models.CharField(_(u'Model'), max_length=100)
+    query = models.TextField(_(u'Query String'), blank=True)
+    file_type = models.CharField(_(u'Format'), max_length=16)
+    status = models.CharField(_(u'Status'), max_length=16, choices=STATUS_CHOICES, default='pending')
+    progress = models.IntegerField(_(u'Exported rows'), default=0)
+    total = models.IntegerField(_(u'Rows'), blank=True, null=True)
+    file = models.CharField(_(u'File'), max_length=255, blank=True)
+    error = models.TextField(_(u'Error'), blank=True)
+    created = models.DateTimeField(_(u'Created'), default=timezone.now)
+    started = models.DateTimeField(_(u'Started'), blank=True, null=True)
+    finished = models.DateTimeField(_(u'Finished'), blank=True, null=True)
+    expires = models.DateTimeField(_(u'Expires'), blank=True, null=True)
+
+    class Meta:
+        verbose_name = _(u'Export')
+        verbose_name_plural = _('Exports')
+        ordering = ('-created',)
+
+    def get_file_name(self):
+        return '%s/%s_%s.%s' % (self.user_id, self.model.replace('.', '_'), self.pk, self.file_type)
+
+    def __str__(self):
+        return "%s %s (%s)" % (self.model, self.file_type, self.status)
+
+
+@python_2_unicode_compatible
+class ImportJob(models.Model):
+    """
+    A confirmed import of a file run in the background, the file is kept in
+    the temporary storage of the import until the job is done.
+    """
+    STATUS_CHOICES = ExportJob.STATUS_CHOICES
+
+    user = models.ForeignKey(AUTH_USER_MODEL, verbose_name=_(u"user"), on_delete=models.CASCADE)
+    model = models.CharField(_(u'Model'), max_length=100)
+    file = models.CharField(_(u'File'), max_length=255)
+    file_name = models.CharField(_(u'File name'), max_length=255)
+    input_format = models.CharField(_(u'Format'), max_length=16)
+    status = models.CharField(_(u'Status'), max_length=16, choices=STATUS_CHOICES, default='pending')
+    progress = models.IntegerField(_(u'Imported rows'), default=0)
+    total = models.IntegerField(_(u'Rows'), blank=True, null=True)
+    result = models.TextField(_(u'Result'), blank=True)
+    error = models.TextField(_(u'Error'), blank=True)
+    created = models.DateTimeField(_(u'Created'), default=timezone.now)
+    started = models.DateTimeField(_(u'Started'), blank=True, null=True)
+    finished = models.DateTimeField(_(u'Finished'), blank=True, null=True)
+
+    class Meta:
+        verbose_name = _(u'Import')
+        verbose_name_plural = _('Imports')
+        ordering = ('-created',)
+
+    def get_progress_cache_key(self):
+        return 'xadmin_import_job_%s' % self.pk
+
+    def get_progress(self):
+        """
+        The rows imported by the running job are only in the cache, the
+        import is committed at once.
+        """
+        if self.status == 'running':
+            cache = caches[getattr(settings, 'XADMIN_IMPORT_CACHE', 'default')]
+            return cache.get(self.get_progress_cache_key(), self.progress)
+        return self.progress
+
+    def __str__(self):
+        return "%s %s (%s)" % (self.model, self.file_name, self.status)
@@ -28,6 +28,9 @@ PLUGINS = (
     'language', 
     'quickfilter',
     'sortablelist',
+    'explain',
+    'admission',
+    'exportjob',
 	'importexport'
 )
 
@@ -153,15 +153,23 @@ class ActionPlugin(BaseAdminPlugin):
                 return list(self.admin_view.list_display[1:2])
         return list_display_links
 
+    def _has_results(self):
+        # The count is None when it timed out, the rows of the page tell then
+        av = self.admin_view
+        if av.result_count is None:
+            return bool(av.result_list)
+        return av.result_count > 0
+
     def get_context(self, context):
-        if self.actions and self.admin_view.result_count:
+        if self.actions and self._has_results():
             av = self.admin_view
             selection_note_all = ungettext('%(total_count)s selected',
-                                           'All %(total_count)s selected', av.result_count)
+                                           'All %(total_count)s selected', av.result_count or 0)
 
             new_context = {
                 'selection_note': _('0 of %(cnt)s selected') % {'cnt': len(av.result_list)},
-                'selection_note_all': selection_note_all % {'total_count': av.result_count},
+                'selection_note_all': selection_note_all % {
+                    'total_count': av.result_count if av.result_count is not None else '?'},
                 'action_choices': self.get_action_choices(),
                 'actions_selection_counter': self.actions_selection_counter,
             }
@@ -286,13 +294,13 @@ class ActionPlugin(BaseAdminPlugin):
 
     # Media
     def get_media(self, media):
-        if self.actions and self.admin_view.result_count:
+        if self.actions and self._has_results():
             media = media + self.vendor('xadmin.plugin.actions.js', 'xadmin.plugins.css')
         return media
 
     # Block Views
     def block_results_bottom(self, context, nodes):
-        if self.actions and self.admin_view.result_count:
+        if self.actions and self._has_results():
             nodes.append(loader.render_to_string('xadmin/blocks/model_list.results_bottom.actions.html',
                                                  context=get_context_dict(context)))
 
@@ -0,0 +1,226 @@
+"""
+Concurrency limits of the expensive requests of the change list.
+
+Exports, charts, actions on all the rows of the list and "show all" pages are
+admitted by their endpoint, with a limit of requests run at once by all the
+users and a limit for each user::
+
+    class HostAdmin(object):
+        admission_limits = {'export': 4, 'chart': 8, 'action': 2, 'show_all': 4}
+        admission_user_limits = {'export': 1}
+
+The default limits are the ``XADMIN_ADMISSION_LIMITS`` and
+``XADMIN_ADMISSION_USER_LIMITS`` settings, the limits of an endpoint count the
+requests of every model. The running requests hold slots in the
+``XADMIN_ADMISSION_CACHE`` cache, so the limits are shared by the processes
+and the nodes using the same cache server. A request over a limit waits
+``admission_wait`` seconds for a slot, then gets a "429 Too Many Requests" page.
+
+The ``request_queued`` and ``request_rejected`` signals are sent for the
+requests which waited or were refused, and ``get_admission_stats()`` returns
+the counts of the admitted, queued and rejected requests of each endpoint.
+
+The requests replayed by the background export and import jobs aren't
+admitted, the jobs are already run by their own workers one at a time.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import Signal
+from django.template.response import TemplateResponse
+from django.utils.translation import ugettext as _
+
+from xadmin.plugins.chart import ChartsView
+from xadmin.sites import site
+from xadmin.views import BaseAdminPlugin, ListAdminView
+from xadmin.views.list import ALL_VAR
+
+ENDPOINTS = ('export', 'chart', 'action', 'show_all')
+COUNTERS = ('admitted', 'queued', 'rejected')
+
+# a request waited ``waited`` seconds for its slots
+request_queued = Signal(providing_args=['endpoint', 'request', 'waited'])
+# a request was refused by the limit of ``scope``, 'site' or 'user'
+request_rejected = Signal(providing_args=['endpoint', 'request', 'scope'])
+
+
+def get_admission_cache():
+    return caches[getattr(settings, 'XADMIN_ADMISSION_CACHE', 'default')]
+
+
+def _stats_key(endpoint, counter):
+    return 'xadmin_admission_stats_%s_%s' % (endpoint, counter)
+
+
+def count_admission(endpoint, counter, cache=None):
+    cache = cache or get_admission_cache()
+    key = _stats_key(endpoint, counter)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted since the add
+        cache.add(key, 1, None)
+
+
+def get_admission_stats(cache=None):
+    """
+    Return the counters of the endpoints as ``{endpoint: {counter: count}}``,
+    counted since the cache was cleared.
+    """
+    cache = cache or get_admission_cache()
+    values = cache.get_many([_stats_key(e, c) for e in ENDPOINTS for c in COUNTERS])
+    return dict((e, dict((c, values.get(_stats_key(e, c), 0)) for c in COUNTERS)) for e in ENDPOINTS)
+
+
+class AdmissionSlots(object):
+    """
+    The slots held by a request, the cache keys of a scope are its numbered
+    slots and ``cache.add`` takes one atomically. A slot expires after
+    ``timeout`` seconds, in case its process dies before the release.
+    """
+
+    def __init__(self, cache, timeout):
+        self.cache = cache
+        self.timeout = timeout
+        self.token = uuid.uuid4().hex
+        self.keys = []
+
+    def acquire(self, scope, limit):
+        for i in range(limit):
+            key = 'xadmin_admission_%s_%d' % (scope, i)
+            if self.cache.add(key, self.token, self.timeout):
+                self.keys.append(key)
+                return True
+        return False
+
+    def acquire_all(self, scopes):
+        """
+        Take a slot of each of ``scopes``, or none of them. Returns the name
+        of the scope which is full, None when the slots are taken.
+        """
+        for scope, limit, name in scopes:
+            if not self.acquire(scope, limit):
+                self.release()
+                return name
+        return None
+
+    def release(self):
+        for key in self.keys:
+            # an expired slot may be held by another request
+            if self.cache.get(key) == self.token:
+                self.cache.delete(key)
+        self.keys = []
+
+    # released with the response
+    close = release
+
+
+class AdmissionPlugin(BaseAdminPlugin):
+    # Requests of an endpoint run at once by all the users, as {endpoint: limit}
+    admission_limits = getattr(settings, 'XADMIN_ADMISSION_LIMITS', {})
+    # Requests of an endpoint run at once by each user
+    admission_user_limits = getattr(settings, 'XADMIN_ADMISSION_USER_LIMITS', {})
+    # Seconds a request over a limit waits for a slot before it's refused
+    admission_wait = getattr(settings, 'XADMIN_ADMISSION_WAIT', 2)
+    # Seconds after which the slots of a request which didn't end are freed
+    admission_timeout = getattr(settings, 'XADMIN_ADMISSION_TIMEOUT', 600)
+
+    def init_request(self, *args, **kwargs):
+        if getattr(self.request, 'xadmin_job', None) is not None:
+            return False
+        self.endpoint = self.get_endpoint()
+        self.slots = None
+        return self.endpoint in self.admission_limits or self.endpoint in self.admission_user_limits
+
+    def get_endpoint(self):
+        request = self.request
+        if isinstance(self.admin_view, ChartsView):
+            return 'chart'
+        if request.GET.get('_do_') == 'export' or request.GET.get('_action_') == 'export':
+            return 'export'
+        if request.method == 'POST' and request.POST.get('select_across') == '1':
+            return 'action'
+        if ALL_VAR in request.GET:
+            return 'show_all'
+        return None
+
+    def get_scopes(self):
+        scopes = []
+        if self.endpoint in self.admission_user_limits:
+            scopes.append(('%s_user_%s' % (self.endpoint, self.user.pk),
+                           self.admission_user_limits[self.endpoint], 'user'))
+        if self.endpoint in self.admission_limits:
+            scopes.append((self.endpoint, self.admission_limits[self.endpoint], 'site'))
+        return scopes
+
+    def acquire(self):
+        """
+        Wait for the slots of the request, polling the cache with a growing
+        delay. Returns the slots, or None and the name of the full scope.
+        """
+        cache = get_admission_cache()
+        slots = AdmissionSlots(cache, self.admission_timeout)
+        scopes = self.get_scopes()
+        start = time.time()
+        delay = 0.05
+        refused = slots.acquire_all(scopes)
+        while refused is not None:
+            if time.time() - start + delay > self.admission_wait:
+                count_admission(self.endpoint, 'rejected', cache)
+                request_rejected.send(sender=self.__class__, endpoint=self.endpoint,
+                                      request=self.request, scope=refused)
+                return None, refused
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+            refused = slots.acquire_all(scopes)
+            if refused is None:
+                count_admission(self.endpoint, 'queued', cache)
+                request_queued.send(sender=self.__class__, endpoint=self.endpoint,
+                                    request=self.request, waited=time.time() - start)
+        count_admission(self.endpoint, 'admitted', cache)
+        return slots, None
+
+    def admit(self, __):
+        if self.slots is not None:
+            # the post of the list renders it with get
+            return __()
+
+        self.slots, refused = self.acquire()
+        if self.slots is None:
+            return self.get_rejected_response(refused)
+        try:
+            response = __()
+        except Exception:
+            self.slots.release()
+            raise
+        # the template and streaming responses query the rows while they are
+        # sent, the slots are released when the response is closed
+        response._closable_objects.append(self.slots)
+        return response
+
+    def get(self, __, request, *args, **kwargs):
+        return self.admit(__)
+    get.priority = 0
+
+    def post(self, __, request, *args, **kwargs):
+        return self.admit(__)
+    post.priority = 0
+
+    def get_rejected_response(self, scope):
+        list_url = self.admin_view.model_admin_url('changelist')
+        context = {
+            'base_template': 'xadmin/base.html',
+            'title': _('Too many requests'),
+            'endpoint': self.endpoint,
+            'scope': scope,
+            'retry_url': self.request.get_full_path() if self.request.method == 'GET' else list_url,
+            'back_url': list_url,
+        }
+        return TemplateResponse(self.request, self.admin_view.get_template_list('views/too_many_requests.html'),
+                                context, status=429)
+
+
+site.register_plugin(AdmissionPlugin, ListAdminView)
@@ -1,3 +1,4 @@
+from django.core.exceptions import FieldError, ImproperlyConfigured
 from django.db.models import FieldDoesNotExist, Avg, Max, Min, Count, Sum
 from django.utils.translation import ugettext as _
 
@@ -5,7 +6,7 @@ from xadmin.sites import site
 from xadmin.views import BaseAdminPlugin, ListAdminView
 
 from xadmin.views.list import ResultRow, ResultItem
-from xadmin.util import display_for_field
+from xadmin.util import display_for_field, display_for_value
 
 AGGREGATE_METHODS = {
     'min': Min, 'max': Max, 'avg': Avg, 'sum': Sum, 'count': Count
@@ -29,13 +30,15 @@ class AggregationPlugin(BaseAdminPlugin):
             item.text = ""
         else:
             try:
-                f = self.opts.get_field(field_name)
                 agg_method = self.aggregate_fields[field_name]
                 key = '%s__%s' % (field_name, agg_method)
                 if key not in obj:
                     item.text = ""
                 else:
-                    item.text = display_for_field(obj[key], f)
+                    if field_name in self.admin_view.list_expressions:
+                        item.text = display_for_value(obj[key])
+                    else:
+                        item.text = display_for_field(obj[key], self.opts.get_field(field_name))
                     item.wraps.append('%%s<span class="aggregate_title label label-info">%s</span>' % AGGREGATE_TITLE[agg_method])
                     item.classes.append(agg_method)
             except FieldDoesNotExist:
@@ -45,8 +48,13 @@ class AggregationPlugin(BaseAdminPlugin):
 
     def _get_aggregate_row(self):
         queryset = self.admin_view.list_queryset._clone()
-        obj = queryset.aggregate(*[AGGREGATE_METHODS[method](field_name) for field_name, method in
-                                   self.aggregate_fields.items() if method in AGGREGATE_METHODS])
+        try:
+            obj = queryset.aggregate(*[AGGREGATE_METHODS[method](field_name) for field_name, method in
+                                       self.aggregate_fields.items() if method in AGGREGATE_METHODS])
+        except FieldError as e:
+            # A column which is neither a field nor an expression column
+            raise ImproperlyConfigured('%s. Check aggregate_fields of class %s.'
+                                       % (e, self.admin_view.__class__.__name__))
 
         row = ResultRow()
         row['is_display_first'] = False
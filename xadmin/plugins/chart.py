@@ -13,7 +13,7 @@ from django.utils.translation import ugettext_lazy as _, ugettext
 
 from xadmin.plugins.utils import get_context_dict
 from xadmin.sites import site
-from xadmin.views import BaseAdminPlugin, ListAdminView
+from xadmin.views import BaseAdminPlugin, ListAdminView, filter_hook
 from xadmin.views.dashboard import ModelBaseWidget, widget_manager
 from xadmin.util import lookup_field, label_for_field, json
 
@@ -112,6 +112,7 @@ class ChartsView(ListAdminView):
         else:
             return super(ChartsView, self).get_ordering()
 
+    @filter_hook
     def get(self, request, name):
         if name not in self.data_charts:
             return HttpResponseNotFound()
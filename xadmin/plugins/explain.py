@@ -0,0 +1,215 @@
+"""
+Query plans of the change list, and logging of its slow queries.
+
+A superuser opens the queries of a list page, with their plans, by the
+"Explain" button of the list or the ``_explain`` parameter, ``_explain=analyze``
+runs them with ``EXPLAIN ANALYZE`` on PostgreSQL. The list queries slower than
+``slow_query_threshold`` seconds (or the ``XADMIN_SLOW_QUERY_THRESHOLD``
+setting) are logged with their plan by the ``xadmin.queries`` logger.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections, router, transaction
+from django.db.backends.utils import CursorWrapper, CursorDebugWrapper
+from django.template import loader
+from django.template.response import SimpleTemplateResponse, TemplateResponse
+from django.utils.translation import ugettext as _
+
+from xadmin.plugins.utils import get_context_dict
+from xadmin.sites import site
+from xadmin.views import BaseAdminPlugin, ListAdminView
+
+EXPLAIN_VAR = '_explain'
+
+logger = logging.getLogger('xadmin.queries')
+
+
+class QueryRecorderMixin(object):
+
+    def __init__(self, cursor, db, queries):
+        super(QueryRecorderMixin, self).__init__(cursor, db)
+        self.queries = queries
+
+    def execute(self, sql, params=None):
+        start = time.time()
+        try:
+            return super(QueryRecorderMixin, self).execute(sql, params)
+        finally:
+            self.queries.append({'sql': sql, 'params': params, 'time': time.time() - start})
+
+
+class RecordingCursorWrapper(QueryRecorderMixin, CursorWrapper):
+    pass
+
+
+class RecordingCursorDebugWrapper(QueryRecorderMixin, CursorDebugWrapper):
+    pass
+
+
+class QueryRecorder(object):
+    """
+    Records the sql, parameters and duration of the queries run on
+    ``connection`` in the block, the plans need the parameters which the
+    debug cursor only keeps interpolated in the sql.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.queries = []
+
+    def make_cursor(self, cursor):
+        if settings.DEBUG:
+            return RecordingCursorDebugWrapper(cursor, self.connection, self.queries)
+        return RecordingCursorWrapper(cursor, self.connection, self.queries)
+
+    def __enter__(self):
+        self.force_debug_cursor = self.connection.force_debug_cursor
+        self.connection.force_debug_cursor = True
+        self.connection.make_debug_cursor = self.make_cursor
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.force_debug_cursor = self.force_debug_cursor
+        del self.connection.make_debug_cursor
+
+
+def explain_query(connection, sql, params, analyze=False):
+    """
+    Return the plan of the select ``sql`` in the format of the database, only
+    PostgreSQL runs the query for ``analyze``.
+    """
+    if connection.vendor == 'postgresql':
+        prefix = analyze and 'EXPLAIN (ANALYZE, BUFFERS) ' or 'EXPLAIN '
+    elif connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif connection.vendor == 'mysql':
+        prefix = 'EXPLAIN '
+    else:
+        return None
+
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                rows = cursor.fetchall()
+    except DatabaseError as e:
+        return _('The plan of this query is not available: %s') % e
+
+    if connection.vendor == 'postgresql':
+        return '\n'.join(row[0] for row in rows)
+    elif connection.vendor == 'sqlite':
+        # rows of (id, parent, notused, detail), indented by their parent
+        depths = {}
+        lines = []
+        for row in rows:
+            depth = depths[row[0]] = depths.get(row[1], -1) + 1
+            lines.append('%s%s' % ('  ' * depth, row[-1]))
+        return '\n'.join(lines)
+    return '\n'.join('\t'.join(str(value) for value in row) for row in rows)
+
+
+def is_select(sql):
+    return sql.lstrip().upper().startswith(('SELECT', 'WITH'))
+
+
+class ExplainPlugin(BaseAdminPlugin):
+    # Log the list queries slower than this number of seconds with their plan
+    slow_query_threshold = getattr(settings, 'XADMIN_SLOW_QUERY_THRESHOLD', None)
+
+    def init_request(self, *args, **kwargs):
+        self.explain = self.user.is_superuser and EXPLAIN_VAR in self.request.GET
+        self.analyze = self.explain and self.request.GET.get(EXPLAIN_VAR) == 'analyze'
+        return self.explain or self.slow_query_threshold is not None or self.user.is_superuser
+
+    def get_connection(self):
+        return connections[router.db_for_read(self.model)]
+
+    def use_streaming(self, streaming):
+        # the explained page is rendered at once
+        return streaming and not self.explain
+
+    def get(self, __, request, *args, **kwargs):
+        if not (self.explain or self.slow_query_threshold is not None):
+            return __()
+
+        connection = self.get_connection()
+        recorder = QueryRecorder(connection)
+        with recorder:
+            response = __()
+            if isinstance(response, SimpleTemplateResponse):
+                # the filters and the rows run queries while rendering
+                response.render()
+
+        if response.streaming:
+            # the rows of a streamed page are queried while it is sent
+            response.streaming_content = self.record_stream(connection, recorder, response.streaming_content)
+            return response
+        if self.slow_query_threshold is not None:
+            self.log_slow_queries(connection, recorder.queries)
+        if self.explain and isinstance(response, SimpleTemplateResponse):
+            return self.get_explain_response(connection, recorder.queries, response.context_data)
+        return response
+    # wraps the get of the other plugins, to record their queries too
+    get.priority = 1
+
+    def record_stream(self, connection, recorder, content):
+        content = iter(content)
+        while True:
+            with recorder:
+                try:
+                    chunk = next(content)
+                except StopIteration:
+                    break
+            yield chunk
+        self.log_slow_queries(connection, recorder.queries)
+
+    def log_slow_queries(self, connection, queries):
+        for query in queries:
+            if query['time'] < self.slow_query_threshold:
+                continue
+            plan = explain_query(connection, query['sql'], query['params']) if is_select(query['sql']) else None
+            logger.warning('Slow query of %s list (%.3fs), parameters %s:\n%s\n%s',
+                           self.opts.label_lower, query['time'], self.request.GET.urlencode(),
+                           query['sql'], plan or '', extra={
+                               'model_admin': self.admin_view.__class__.__name__,
+                               'params': dict(self.request.GET.items()),
+                               'sql': query['sql'],
+                               'duration': query['time'],
+                               'plan': plan,
+                           })
+
+    def get_explain_response(self, connection, queries, context):
+        context = dict(context or {})
+        context.update({
+            'title': _('Queries of %s') % context.get('title', self.opts.verbose_name_plural),
+            'analyze': self.analyze,
+            'vendor': connection.vendor,
+            'total_time': sum(query['time'] for query in queries),
+            'queries': [{
+                'sql': query['sql'],
+                'params': query['params'],
+                'time': query['time'],
+                'plan': explain_query(connection, query['sql'], query['params'], self.analyze)
+                if is_select(query['sql']) else None,
+            } for query in queries],
+            'list_url': self.admin_view.get_query_string(remove=[EXPLAIN_VAR]),
+            'explain_url': self.admin_view.get_query_string({EXPLAIN_VAR: ''}),
+            'analyze_url': self.admin_view.get_query_string({EXPLAIN_VAR: 'analyze'}),
+        })
+        return TemplateResponse(self.request, self.admin_view.get_template_list('views/model_list.explain.html'),
+                                context)
+
+    # Block Views
+    def block_top_toolbar(self, context, nodes):
+        if self.user.is_superuser:
+            context.update({
+                'explain_url': self.admin_view.get_query_string({EXPLAIN_VAR: ''}),
+                'analyze_url': self.admin_view.get_query_string({EXPLAIN_VAR: 'analyze'}),
+            })
+            nodes.append(loader.render_to_string('xadmin/blocks/model_list.top_toolbar.explain.html',
+                                                 get_context_dict(context)))
+
+
+site.register_plugin(ExplainPlugin, ListAdminView)
@@ -1,22 +1,36 @@
+import csv
 import io
 import datetime
-import sys
-from future.utils import iteritems
-
-from django.http import HttpResponse
+import decimal
+import multiprocessing
+import os
+import shutil
+import tempfile
+import uuid
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.template import loader
-from django.utils import six
-from django.utils.encoding import force_text, smart_text
-from django.utils.html import escape
+from django.db import connections
+from django.utils.encoding import force_bytes, force_str, force_text, smart_text
+from django.utils import six, timezone
+from django.utils.six.moves import cPickle as pickle
 from django.utils.translation import ugettext as _
 from django.utils.xmlutils import SimplerXMLGenerator
-from django.db.models import BooleanField, NullBooleanField
+from django.db.models import (BooleanField, NullBooleanField, DateField, DateTimeField, TimeField, Max,
+                              BigIntegerField, DecimalField, DurationField, FloatField, IntegerField,
+                              SmallIntegerField, PositiveSmallIntegerField, AutoField)
 
 from xadmin.plugins.utils import get_context_dict
 from xadmin.sites import site
 from xadmin.views import BaseAdminPlugin, ListAdminView
-from xadmin.util import json
-from xadmin.views.list import ALL_VAR
+from xadmin.util import (json, queryset_iterator, get_fields_from_path, NotRelationField, display_for_field,
+                         display_for_value, QueryTimeout)
+from xadmin.views.list import ALL_VAR, EMPTY_CHANGELIST_VALUE, ResultRow
 
 try:
     import xlwt
@@ -30,24 +44,118 @@ try:
 except:
     has_xlsxwriter = False
 
+try:
+    import pyarrow
+    import pyarrow.parquet
+    has_pyarrow = True
+except ImportError:
+    has_pyarrow = False
+
+try:
+    import zstandard
+    has_zstd = True
+except ImportError:
+    has_zstd = False
+
+try:
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+except ImportError:
+    ProcessPoolExecutor = None
+
+# rows of a sheet of the xls format
+XLS_MAX_ROWS = 65536
+
+# the formats which can be compressed
+EXPORT_TEXT_TYPES = ('csv', 'xml', 'json', 'ndjson')
+# the compressions of the text formats, as their file extension and mime type
+EXPORT_COMPRESSIONS = {'gzip': ('gz', 'application/gzip'), 'zstd': ('zst', 'application/zstd')}
+
+# the parallel exports running in this process, read by the forked processes
+_parallel_exports = {}
+
+
+def _process_pool(workers):
+    try:
+        # the processes inherit the export, they must be forked
+        return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+    except (AttributeError, TypeError):
+        return ProcessPoolExecutor(workers)
+
+
+def get_export_compressions():
+    return ['gzip'] + ['zstd'] * has_zstd
+
+
+def get_compressor(compression):
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor().compressobj()
+    # the gzip header and trailer
+    return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def compress_chunks(chunks, compressor):
+    for chunk in chunks:
+        data = compressor.compress(force_bytes(chunk))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _export_shard(token, filters, path):
+    plugin, queryset = _parallel_exports[token]
+    plugin.export_progress = None
+    with open(path, 'wb') as output:
+        return getattr(plugin, 'write_%s_shard' % plugin.file_type)(queryset.filter(**filters), output)
+
+
+class Echo(object):
+    """
+    File like object of the csv writer, which returns the lines it writes.
+    """
+
+    def write(self, value):
+        return value
+
+
+class ExportColumn(object):
+    """
+    A column of the export. The value of a column with a ``path`` is read by
+    ``values_list``, the others are rendered on the objects by the list.
+    """
+
+    def __init__(self, name, header, path=None, field=None, attr=None):
+        self.name = name
+        self.header = header
+        self.path = path
+        self.field = field
+        self.boolean = isinstance(field, (BooleanField, NullBooleanField)) or getattr(attr, 'boolean', False)
+        self.choices = dict(field.flatchoices) if field is not None and field.flatchoices else None
+
 
 class ExportMenuPlugin(BaseAdminPlugin):
 
-    list_export = ('xlsx', 'xls', 'csv', 'xml', 'json')
+    list_export = ('xlsx', 'xls', 'csv', 'xml', 'json', 'ndjson', 'parquet')
     export_names = {'xlsx': 'Excel 2007', 'xls': 'Excel', 'csv': 'CSV',
-                    'xml': 'XML', 'json': 'JSON'}
+                    'xml': 'XML', 'json': 'JSON', 'ndjson': 'NDJSON', 'parquet': 'Parquet'}
+    # Offer to run the exports in the background, see the exportjob plugin
+    list_export_background = getattr(settings, 'XADMIN_EXPORT_BACKGROUND', False)
 
     def init_request(self, *args, **kwargs):
         self.list_export = [
             f for f in self.list_export
-            if (f != 'xlsx' or has_xlsxwriter) and (f != 'xls' or has_xlwt)]
+            if (f != 'xlsx' or has_xlsxwriter) and (f != 'xls' or has_xlwt) and (f != 'parquet' or has_pyarrow)]
 
     def block_top_toolbar(self, context, nodes):
         if self.list_export:
             context.update({
-                'show_export_all': self.admin_view.paginator.count > self.admin_view.list_per_page and not ALL_VAR in self.admin_view.request.GET,
+                'show_export_all': (self.admin_view.result_count is None or
+                                    self.admin_view.result_count > self.admin_view.list_per_page) and
+                                   not ALL_VAR in self.admin_view.request.GET,
                 'form_params': self.admin_view.get_form_params({'_do_': 'export'}, ('export_type',)),
-                'export_types': [{'type': et, 'name': self.export_names[et]} for et in self.list_export],
+                'export_types': [{'type': et, 'name': self.export_names[et], 'text': et in EXPORT_TEXT_TYPES}
+                                 for et in self.list_export],
+                'export_compressions': get_export_compressions(),
+                'export_background': self.list_export_background,
             })
             nodes.append(loader.render_to_string('xadmin/blocks/model_list.top_toolbar.exports.html',
                                                  context=get_context_dict(context)))
@@ -57,79 +165,314 @@ class ExportPlugin(BaseAdminPlugin):
 
     export_mimes = {'xlsx': 'application/vnd.ms-excel',
                     'xls': 'application/vnd.ms-excel', 'csv': 'text/csv',
-                    'xml': 'application/xhtml+xml', 'json': 'application/json'}
+                    'xml': 'application/xhtml+xml', 'json': 'application/json',
+                    'ndjson': 'application/x-ndjson', 'parquet': 'application/vnd.apache.parquet'}
+    # Query timeout of the exports, instead of the query_timeout of the list
+    export_query_timeout = None
+    # Rows read from the server side cursor at once by the exports
+    export_chunk_size = 2000
+    # Bytes of the xlsx and parquet files kept in memory before they are written to disk
+    export_spool_size = 10 * 1024 * 1024
+    # Rows of the row groups of the parquet files
+    export_parquet_row_group = getattr(settings, 'XADMIN_EXPORT_PARQUET_ROW_GROUP', 50000)
+    # Processes of the parallel exports, they are off below 2. They are only
+    # forked by the xadmin_export_worker command, see the exportjob plugin
+    export_workers = getattr(settings, 'XADMIN_EXPORT_WORKERS', 0)
+    # Rows from which the exports of all the rows run in parallel
+    export_parallel_rows = getattr(settings, 'XADMIN_EXPORT_PARALLEL_ROWS', 100000)
 
     def init_request(self, *args, **kwargs):
+        self.file_type = self.request.GET.get('export_type', 'csv')
+        self._export_columns = None
+        # called with the rows exported so far and their count, by the
+        # background exports
+        self.export_progress = None
+        # set by the background exports of the worker command, which may fork
+        # the processes of a parallel export
+        self.export_fork = False
         return self.request.GET.get('_do_') == 'export'
 
-    def _format_value(self, o):
+    def get_raw_path(self, field_name):
+        """
+        Return the field of a column whose value can be read by
+        ``values_list``: a field of the model or through foreign keys, which
+        isn't a relation itself, rendered by the ``__str__`` of its objects.
+        """
+        try:
+            fields = get_fields_from_path(self.model, field_name)
+        except (FieldDoesNotExist, NotRelationField):
+            return None
+        for field in fields:
+            if field.many_to_many or field.one_to_many:
+                return None
+        if fields[-1].is_relation:
+            return None
+        return fields[-1]
+
+    def get_export_columns(self):
+        if self._export_columns is not None:
+            return self._export_columns
+        av = self.admin_view
+        headers = av.result_headers().cells
+        columns = self._export_columns = []
+        for field_name, header in zip(av.list_display, headers):
+            if not header.export:
+                continue
+            if field_name in av.list_expressions:
+                # annotated on the list queryset
+                columns.append(ExportColumn(field_name, force_text(header.text), field_name,
+                                            attr=getattr(av, field_name)))
+                continue
+            field = self.get_raw_path(field_name) if isinstance(field_name, six.string_types) else None
+            columns.append(ExportColumn(field_name, force_text(header.text), field and field_name, field))
+        return columns
+
+    def _raw_value(self, column, value, typed):
+        if column.choices is not None:
+            return force_text(column.choices.get(value, EMPTY_CHANGELIST_VALUE))
+        if typed:
+            if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+                # the spreadsheets have no time zones
+                return timezone.make_naive(value)
+            if value is None or isinstance(value, (bool, float, decimal.Decimal, datetime.date, datetime.time) +
+                                           six.integer_types + six.string_types):
+                return value
+            return force_text(value)
+        if column.boolean:
+            return '' if value is None else (_('Yes') if value else _('No'))
+        if column.field is not None:
+            return display_for_field(value, column.field)
+        return display_for_value(value)
+
+    def _item_value(self, o, typed):
+        # the value of the column rendered by the list, the exports aren't html
         if (o.field is None and getattr(o.attr, 'boolean', False)) or \
            (o.field and isinstance(o.field, (BooleanField, NullBooleanField))):
-                value = o.value
-        elif str(o.text).startswith("<span class='text-muted'>"):
-            value = escape(str(o.text)[25:-7])
-        else:
-            value = escape(str(o.text))
-        return value
-
-    def _get_objects(self, context):
-        headers = [c for c in context['result_headers'].cells if c.export]
-        rows = context['results']
-
-        return [dict([
-            (force_text(headers[i].text), self._format_value(o)) for i, o in
-            enumerate(filter(lambda c:getattr(c, 'export', False), r.cells))]) for r in rows]
-
-    def _get_datas(self, context):
-        rows = context['results']
-
-        new_rows = [[self._format_value(o) for o in
-            filter(lambda c:getattr(c, 'export', False), r.cells)] for r in rows]
-        new_rows.insert(0, [force_text(c.text) for c in context['result_headers'].cells if c.export])
-        return new_rows
-
-    def get_xlsx_export(self, context):
-        datas = self._get_datas(context)
-        output = io.BytesIO()
-        export_header = (
-            self.request.GET.get('export_xlsx_header', 'off') == 'on')
-
+            if typed:
+                return o.value
+            return '' if o.value is None else (_('Yes') if o.value else _('No'))
+        text = force_text(o.text)
+        if text.startswith("<span class='text-muted'>"):
+            return None if typed else force_text(EMPTY_CHANGELIST_VALUE)
+        return text
+
+    def get_export_queryset(self):
+        """
+        The filtered and ordered queryset of the list, without loading the
+        page of the list.
+        """
+        av = self.admin_view
+        av.base_queryset = av.queryset()
+        av.list_queryset = av.get_list_queryset()
+        av.ordering_field_columns = av.get_ordering_field_columns()
+        return av.list_queryset
+
+    def iter_export_rows(self, queryset, typed=True):
+        """
+        Yield the rows of the export as lists of values, of their python type
+        when ``typed`` or else of the text of the list. The values of the
+        fields are read by ``values_list`` in chunks, the objects of a chunk
+        are loaded only for the other columns.
+        """
+        columns = self.get_export_columns()
+        values_list = queryset.values_list('pk', *[c.path for c in columns if c.path])
+        if self.request.GET.get('all', 'off') != 'on':
+            offset = self.admin_view.list_per_page * self.admin_view.page_num
+            values_list = values_list[offset:offset + self.admin_view.list_per_page]
+        total = self.get_export_count(queryset) if self.export_progress is not None else None
+
+        chunk = []
+        done = 0
+        for values in queryset_iterator(values_list, self.export_chunk_size):
+            chunk.append(values)
+            if len(chunk) >= self.export_chunk_size:
+                for row in self._convert_chunk(queryset, columns, chunk, typed):
+                    yield row
+                done += len(chunk)
+                if self.export_progress is not None:
+                    self.export_progress(done, total)
+                chunk = []
+        for row in self._convert_chunk(queryset, columns, chunk, typed):
+            yield row
+        if self.export_progress is not None:
+            self.export_progress(done + len(chunk), total)
+
+    def _convert_chunk(self, queryset, columns, chunk, typed):
+        av = self.admin_view
+        objects = {}
+        if chunk and any(c.path is None for c in columns):
+            objects = dict((obj.pk, obj) for obj in queryset.order_by().filter(pk__in=[v[0] for v in chunk]))
+        result_row = ResultRow()
+        result_row['is_display_first'] = False
+
+        for values in chunk:
+            raw_values = iter(values[1:])
+            obj = objects.get(values[0])
+            row = []
+            for column in columns:
+                if column.path:
+                    row.append(self._raw_value(column, next(raw_values), typed))
+                elif obj is not None:
+                    row.append(self._item_value(av.result_item(obj, column.name, result_row), typed))
+                else:
+                    # deleted since the values were read
+                    row.append(None if typed else '')
+            yield row
+
+    def _get_objects(self, queryset, typed=True):
+        headers = [c.header for c in self.get_export_columns()]
+        return [dict(zip(headers, row)) for row in self.iter_export_rows(queryset, typed)]
+
+    def _column_style(self, column, value=None):
+        """
+        The number format of a column, from its field, or from the type of
+        its first value when it has no field.
+        """
+        field = column.field
+        if isinstance(field, DateTimeField) or isinstance(value, datetime.datetime):
+            return 'datetime'
+        elif isinstance(field, DateField) or isinstance(value, datetime.date):
+            return 'date'
+        elif isinstance(field, TimeField) or isinstance(value, datetime.time):
+            return 'time'
+        return 'default'
+
+    def _write_sheet(self, rows, write, styles, header_key):
+        """
+        Write the header and ``rows`` in order with ``write(row, col, value,
+        style)``, the blank cells are skipped.
+        """
+        columns = self.get_export_columns()
+        rowx = 0
+        if self.request.GET.get(header_key, 'off') == 'on':
+            for colx, column in enumerate(columns):
+                write(0, colx, column.header, styles['header'])
+            rowx = 1
+
+        column_styles = [styles[self._column_style(c)] for c in columns]
+        undecided = set(colx for colx, c in enumerate(columns) if c.field is None)
+        for rowx, row in enumerate(rows, rowx):
+            for colx, value in enumerate(row):
+                if value is None:
+                    continue
+                if colx in undecided:
+                    undecided.discard(colx)
+                    column_styles[colx] = styles[self._column_style(columns[colx], value)]
+                write(rowx, colx, value, column_styles[colx])
+
+    def get_xlsx_export(self, queryset):
+        return self._write_xlsx(self.iter_export_rows(queryset))
+
+    def _write_xlsx(self, rows):
+        """
+        Write the workbook in the constant memory mode of xlsxwriter, row by
+        row, into a temporary file which is sent by the response.
+        """
+        output = tempfile.SpooledTemporaryFile(max_size=self.export_spool_size)
         model_name = self.opts.verbose_name
-        book = xlsxwriter.Workbook(output)
+        book = xlsxwriter.Workbook(output, {'constant_memory': True})
         sheet = book.add_worksheet(
             u"%s %s" % (_(u'Sheet'), force_text(model_name)))
         styles = {'datetime': book.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'}),
                   'date': book.add_format({'num_format': 'yyyy-mm-dd'}),
                   'time': book.add_format({'num_format': 'hh:mm:ss'}),
                   'header': book.add_format({'font': 'name Times New Roman', 'color': 'red', 'bold': 'on', 'num_format': '#,##0.00'}),
-                  'default': book.add_format()}
+                  'default': None}
 
-        if not export_header:
-            datas = datas[1:]
-        for rowx, row in enumerate(datas):
-            for colx, value in enumerate(row):
-                if export_header and rowx == 0:
-                    cell_style = styles['header']
-                else:
-                    if isinstance(value, datetime.datetime):
-                        cell_style = styles['datetime']
-                    elif isinstance(value, datetime.date):
-                        cell_style = styles['date']
-                    elif isinstance(value, datetime.time):
-                        cell_style = styles['time']
-                    else:
-                        cell_style = styles['default']
-                sheet.write(rowx, colx, value, cell_style)
+        self._write_sheet(rows, sheet.write, styles, 'export_xlsx_header')
         book.close()
 
         output.seek(0)
-        return output.getvalue()
+        return output
+
+    def _arrow_type(self, column, values):
+        """
+        The arrow type of a column, from its field, or from its first values
+        when it has no field.
+        """
+        field = column.field
+        if column.choices is not None:
+            return pyarrow.string()
+        if column.boolean:
+            return pyarrow.bool_()
+        if isinstance(field, (SmallIntegerField, PositiveSmallIntegerField)):
+            return pyarrow.int16()
+        if isinstance(field, (IntegerField, BigIntegerField, AutoField)):
+            return pyarrow.int64()
+        if isinstance(field, FloatField):
+            return pyarrow.float64()
+        if isinstance(field, DecimalField):
+            if field.max_digits and field.max_digits <= 38:
+                return pyarrow.decimal128(field.max_digits, field.decimal_places)
+            return pyarrow.float64()
+        if isinstance(field, DateTimeField):
+            return pyarrow.timestamp('us')
+        if isinstance(field, DateField):
+            return pyarrow.date32()
+        if isinstance(field, TimeField):
+            return pyarrow.time64('us')
+        if isinstance(field, DurationField):
+            return pyarrow.duration('us')
+        if field is not None:
+            return pyarrow.string()
+
+        sample = [v for v in values if v is not None][:100]
+        try:
+            inferred = pyarrow.array(sample).type
+        except (pyarrow.ArrowException, TypeError, ValueError):
+            return pyarrow.string()
+        if pyarrow.types.is_decimal(inferred):
+            # the scale of the next values isn't known
+            return pyarrow.float64()
+        if pyarrow.types.is_null(inferred) or pyarrow.types.is_nested(inferred):
+            return pyarrow.string()
+        return inferred
+
+    def _arrow_array(self, values, arrow_type):
+        if pyarrow.types.is_string(arrow_type):
+            values = [None if v is None else force_text(v) for v in values]
+        elif pyarrow.types.is_floating(arrow_type):
+            values = [None if v is None else float(v) for v in values]
+        return pyarrow.array(values, type=arrow_type)
+
+    def get_parquet_export(self, queryset):
+        return self._write_parquet(self.iter_export_rows(queryset))
+
+    def _write_parquet(self, rows):
+        """
+        Write the rows to a parquet file by row groups, the values of a row
+        group are turned into typed column arrays at once.
+        """
+        output = tempfile.SpooledTemporaryFile(max_size=self.export_spool_size)
+        writer = None
+        group = []
+        for row in rows:
+            group.append(row)
+            if len(group) >= self.export_parquet_row_group:
+                writer = self._write_row_group(output, writer, group)
+                group = []
+        if group or writer is None:
+            writer = self._write_row_group(output, writer, group)
+        writer.close()
 
-    def get_xls_export(self, context):
-        datas = self._get_datas(context)
+        output.seek(0)
+        return output
+
+    def _write_row_group(self, output, writer, group):
+        columns = self.get_export_columns()
+        values = list(zip(*group)) if group else [[] for c in columns]
+        if writer is None:
+            # the columns without a field take the type of their first values
+            schema = pyarrow.schema([pyarrow.field(c.header, self._arrow_type(c, v))
+                                     for c, v in zip(columns, values)])
+            writer = pyarrow.parquet.ParquetWriter(output, schema)
+        if group:
+            writer.write_table(pyarrow.Table.from_arrays(
+                [self._arrow_array(v, f.type) for v, f in zip(values, writer.schema)], schema=writer.schema))
+        return writer
+
+    def get_xls_export(self, queryset):
         output = io.BytesIO()
-        export_header = (
-            self.request.GET.get('export_xls_header', 'off') == 'on')
 
         model_name = self.opts.verbose_name
         book = xlwt.Workbook(encoding='utf8')
@@ -141,100 +484,316 @@ class ExportPlugin(BaseAdminPlugin):
                   'header': xlwt.easyxf('font: name Times New Roman, color-index red, bold on', num_format_str='#,##0.00'),
                   'default': xlwt.Style.default_style}
 
-        if not export_header:
-            datas = datas[1:]
-        for rowx, row in enumerate(datas):
-            for colx, value in enumerate(row):
-                if export_header and rowx == 0:
-                    cell_style = styles['header']
-                else:
-                    if isinstance(value, datetime.datetime):
-                        cell_style = styles['datetime']
-                    elif isinstance(value, datetime.date):
-                        cell_style = styles['date']
-                    elif isinstance(value, datetime.time):
-                        cell_style = styles['time']
-                    else:
-                        cell_style = styles['default']
-                sheet.write(rowx, colx, value, style=cell_style)
+        self._write_sheet(self.iter_export_rows(queryset),
+                          lambda rowx, colx, value, style: sheet.write(rowx, colx, value, style=style),
+                          styles, 'export_xls_header')
         book.save(output)
 
         output.seek(0)
         return output.getvalue()
 
-    def _format_csv_text(self, t):
-        if isinstance(t, bool):
-            return _('Yes') if t else _('No')
-        t = t.replace('"', '""').replace(',', '\,')
-        cls_str = str if six.PY3 else basestring
-        if isinstance(t, cls_str):
-            t = '"%s"' % t
-        return t
-
-    def get_csv_export(self, context):
-        datas = self._get_datas(context)
-        stream = []
-
-        if self.request.GET.get('export_csv_header', 'off') != 'on':
-            datas = datas[1:]
-
-        for row in datas:
-            stream.append(','.join(map(self._format_csv_text, row)))
-
-        return '\r\n'.join(stream)
-
-    def _to_xml(self, xml, data):
-        if isinstance(data, (list, tuple)):
-            for item in data:
-                xml.startElement("row", {})
-                self._to_xml(xml, item)
-                xml.endElement("row")
-        elif isinstance(data, dict):
-            for key, value in iteritems(data):
-                key = key.replace(' ', '_')
-                xml.startElement(key, {})
-                self._to_xml(xml, value)
-                xml.endElement(key)
-        else:
-            xml.characters(smart_text(data))
-
-    def get_xml_export(self, context):
-        results = self._get_objects(context)
+    def _csv_header(self):
+        if self.request.GET.get('export_csv_header', 'off') == 'on':
+            return csv.writer(Echo()).writerow([force_str(c.header) for c in self.get_export_columns()])
+        return ''
+
+    def _csv_lines(self, queryset):
+        writer = csv.writer(Echo())
+        lines = []
+        for row in self.iter_export_rows(queryset, typed=False):
+            lines.append(writer.writerow([force_str(value) for value in row]))
+            if len(lines) >= self.export_chunk_size:
+                yield lines
+                lines = []
+        if lines:
+            yield lines
+
+    def get_csv_stream(self, queryset):
+        header = self._csv_header()
+        if header:
+            yield header
+        for lines in self._csv_lines(queryset):
+            yield ''.join(lines)
+
+    def write_csv_shard(self, queryset, output):
+        count = 0
+        for lines in self._csv_lines(queryset):
+            output.write(force_bytes(''.join(lines)))
+            count += len(lines)
+        return count
+
+    def join_csv_shards(self, paths):
+        return self._join_text_shards(paths, self._csv_header())
+
+    def _join_text_shards(self, paths, header=''):
+        output = tempfile.SpooledTemporaryFile(max_size=self.export_spool_size)
+        output.write(force_bytes(header))
+        for path in paths:
+            with open(path, 'rb') as shard:
+                shutil.copyfileobj(shard, output)
+        output.seek(0)
+        return output
+
+    def write_xlsx_shard(self, queryset, output):
+        # the typed rows, the workbook is written by the main process
+        return self._pickle_rows(queryset, output)
+
+    def write_parquet_shard(self, queryset, output):
+        return self._pickle_rows(queryset, output)
+
+    def _pickle_rows(self, queryset, output):
+        count = 0
+        rows = []
+        for row in self.iter_export_rows(queryset):
+            rows.append(row)
+            if len(rows) >= self.export_chunk_size:
+                pickle.dump(rows, output, pickle.HIGHEST_PROTOCOL)
+                count += len(rows)
+                rows = []
+        pickle.dump(rows, output, pickle.HIGHEST_PROTOCOL)
+        return count + len(rows)
+
+    def _iter_pickled_rows(self, paths):
+        for path in paths:
+            with open(path, 'rb') as shard:
+                while True:
+                    try:
+                        rows = pickle.load(shard)
+                    except EOFError:
+                        break
+                    for row in rows:
+                        yield row
+
+    def join_xlsx_shards(self, paths):
+        return self._write_xlsx(self._iter_pickled_rows(paths))
+
+    def join_parquet_shards(self, paths):
+        return self._write_parquet(self._iter_pickled_rows(paths))
+
+    def get_export_shards(self, queryset):
+        """
+        Split the rows of the export into ranges of the leading column of its
+        ordering, a non null field of the model, with about the same number
+        of rows. Returns the filters of the ranges in the order of the export
+        and the number of rows, or None when they aren't split. The rows
+        added after the split, of a greater primary key, aren't exported.
+        """
+        ordering = queryset.query.order_by
+        if not ordering or not isinstance(ordering[0], six.string_types):
+            return None
+        name = ordering[0].lstrip('-')
+        try:
+            field = self.opts.pk if name == 'pk' else self.opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if field.null or (field.is_relation and not field.primary_key):
+            return None
+
+        max_pk = queryset.order_by().aggregate(max_pk=Max('pk'))['max_pk']
+        if max_pk is None:
+            return None
+        queryset = queryset.filter(pk__lte=max_pk)
+        count = queryset.count()
+        if count < self.export_parallel_rows:
+            return None
+
+        shards = self.export_workers * 2
+        values = queryset.order_by(name).values_list(name, flat=True)
+        bounds = []
+        for i in range(1, shards):
+            value = values[count * i // shards]
+            if not bounds or value != bounds[-1]:
+                bounds.append(value)
+        edges = [None] + bounds + [None]
+        filters = []
+        for low, high in zip(edges, edges[1:]):
+            shard = {'pk__lte': max_pk}
+            if low is not None:
+                shard['%s__gte' % name] = low
+            if high is not None:
+                shard['%s__lt' % name] = high
+            filters.append(shard)
+        if ordering[0].startswith('-'):
+            filters.reverse()
+        return filters, count
+
+    def can_export_in_parallel(self):
+        """
+        Return True if the export of all the rows may run in parallel, when
+        it has ``export_parallel_rows`` rows.
+        """
+        return self.export_workers >= 2 and ProcessPoolExecutor is not None and hasattr(os, 'fork') and \
+            hasattr(self, 'write_%s_shard' % self.file_type) and self.request.GET.get('all', 'off') == 'on'
+
+    def get_parallel_export(self, queryset):
+        """
+        Export the ranges of ``get_export_shards`` in ``export_workers``
+        forked processes, each one writes the rows of a range to a file, and
+        join the files in order. Returns None when the export doesn't run in
+        parallel, the requests of the users never fork.
+        """
+        if not self.export_fork or not self.can_export_in_parallel():
+            return None
+        if connections[queryset.db].in_atomic_block:
+            # the processes can't read the rows of the transaction
+            return None
+        shards = self.get_export_shards(queryset)
+        if shards is None:
+            return None
+        filters, total = shards
+
+        self.get_export_columns()
+        # the processes open connections of their own, the worker reconnects
+        connections.close_all()
+        token = uuid.uuid4().hex
+        _parallel_exports[token] = (self, queryset)
+        folder = tempfile.mkdtemp(prefix='xadmin_export_')
+        try:
+            paths = [os.path.join(folder, str(i)) for i in range(len(filters))]
+            done = 0
+            with _process_pool(self.export_workers) as pool:
+                futures = [pool.submit(_export_shard, token, shard, path) for shard, path in zip(filters, paths)]
+                for future in as_completed(futures):
+                    done += future.result()
+                    if self.export_progress is not None:
+                        self.export_progress(done, total)
+            return getattr(self, 'join_%s_shards' % self.file_type)(paths)
+        finally:
+            del _parallel_exports[token]
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def get_xml_stream(self, queryset):
+        """
+        Write the rows to the response as they are read, the generator
+        writes to a buffer which is emptied after each chunk of rows.
+        """
         stream = io.StringIO()
-
         xml = SimplerXMLGenerator(stream, "utf-8")
-        xml.startDocument()
         xml.startElement("objects", {})
-
-        self._to_xml(xml, results)
+        tags = [c.header.replace(' ', '_') for c in self.get_export_columns()]
+
+        for i, row in enumerate(self.iter_export_rows(queryset, typed=False), 1):
+            xml.startElement("row", {})
+            for tag, value in zip(tags, row):
+                xml.startElement(tag, {})
+                xml.characters(smart_text(value))
+                xml.endElement(tag)
+            xml.endElement("row")
+            if i % self.export_chunk_size == 0:
+                yield stream.getvalue()
+                stream.seek(0)
+                stream.truncate()
 
         xml.endElement("objects")
         xml.endDocument()
-
-        return stream.getvalue().split('\n')[1]
-
-    def get_json_export(self, context):
-        results = self._get_objects(context)
-        return json.dumps({'objects': results}, ensure_ascii=False,
+        yield stream.getvalue()
+
+    def _ndjson_lines(self, queryset):
+        headers = [c.header for c in self.get_export_columns()]
+        lines = []
+        for row in self.iter_export_rows(queryset):
+            lines.append(json.dumps(OrderedDict(zip(headers, row)), ensure_ascii=False, cls=DjangoJSONEncoder))
+            lines.append('\n')
+            if len(lines) >= self.export_chunk_size * 2:
+                yield lines
+                lines = []
+        if lines:
+            yield lines
+
+    def get_ndjson_stream(self, queryset):
+        for lines in self._ndjson_lines(queryset):
+            yield ''.join(lines)
+
+    def write_ndjson_shard(self, queryset, output):
+        count = 0
+        for lines in self._ndjson_lines(queryset):
+            output.write(force_bytes(''.join(lines)))
+            count += len(lines) // 2
+        return count
+
+    def join_ndjson_shards(self, paths):
+        return self._join_text_shards(paths)
+
+    def get_json_export(self, queryset):
+        results = self._get_objects(queryset)
+        return json.dumps({'objects': results}, ensure_ascii=False, cls=DjangoJSONEncoder,
                           indent=(self.request.GET.get('export_json_format', 'off') == 'on') and 4 or None)
 
-    def get_response(self, response, context, *args, **kwargs):
-        file_type = self.request.GET.get('export_type', 'csv')
-        response = HttpResponse(
-            content_type="%s; charset=UTF-8" % self.export_mimes[file_type])
+    def get_export_compression(self):
+        compression = self.request.GET.get('export_compress')
+        if self.file_type in EXPORT_TEXT_TYPES and compression in get_export_compressions():
+            return compression
+        return None
 
-        file_name = self.opts.verbose_name.replace(' ', '_')
-        response['Content-Disposition'] = ('attachment; filename=%s.%s' % (
-            file_name, file_type)).encode('utf-8')
+    def get_export_extension(self):
+        compression = self.get_export_compression()
+        if compression is None:
+            return self.file_type
+        return '%s.%s' % (self.file_type, EXPORT_COMPRESSIONS[compression][0])
 
-        response.write(getattr(self, 'get_%s_export' % file_type)(context))
+    def get_content_disposition(self):
+        file_name = self.opts.verbose_name.replace(' ', '_')
+        return ('attachment; filename=%s.%s' % (file_name, self.get_export_extension())).encode('utf-8')
+
+    def get_export_count(self, queryset):
+        if self.request.GET.get('all', 'off') != 'on':
+            return self.admin_view.list_per_page
+        return queryset.count()
+
+    def get_export_response(self):
+        av = self.admin_view
+        queryset = self.get_export_queryset()
+        content_type = "%s; charset=UTF-8" % self.export_mimes[self.file_type]
+
+        if self.file_type == 'xls' and self.get_export_count(queryset) > XLS_MAX_ROWS - 1:
+            if has_xlsxwriter:
+                return HttpResponseRedirect(av.get_query_string({
+                    'export_type': 'xlsx',
+                    'export_xlsx_header': self.request.GET.get('export_xls_header', 'off'),
+                }, remove=['export_xls_header']))
+            av.message_user(_('There are too many rows for the xls format, narrow the list with the filters '
+                              'or the search.'), 'error')
+            return HttpResponseRedirect(av.get_query_string(remove=['_do_', 'export_', ALL_VAR]))
+
+        content = self.get_parallel_export(queryset)
+        if content is not None:
+            response = FileResponse(content, content_type=content_type)
+        elif hasattr(self, 'get_%s_stream' % self.file_type):
+            # the rows are read and written while the response is sent, they
+            # aren't limited by the query timeout
+            response = StreamingHttpResponse(getattr(self, 'get_%s_stream' % self.file_type)(queryset),
+                                             content_type=content_type)
+        else:
+            if self.export_query_timeout is not None:
+                av.query_timeout = self.export_query_timeout
+            try:
+                with av.timeout_queries():
+                    content = getattr(self, 'get_%s_export' % self.file_type)(queryset)
+            except QueryTimeout:
+                av.message_user(_('The export took too long, narrow the list with the filters or the search.'),
+                                'error')
+                return HttpResponseRedirect(av.get_query_string(remove=['_do_', 'export_', ALL_VAR]))
+            if hasattr(content, 'read'):
+                response = FileResponse(content, content_type=content_type)
+            else:
+                response = HttpResponse(content, content_type=content_type)
+
+        compression = self.get_export_compression()
+        if compression is not None:
+            # compressed while it's sent, the file is downloaded as it is
+            compressor = get_compressor(compression)
+            if response.streaming:
+                response.streaming_content = compress_chunks(response.streaming_content, compressor)
+            else:
+                response.content = b''.join(compress_chunks([response.content], compressor))
+            response['Content-Type'] = EXPORT_COMPRESSIONS[compression][1]
+        response['Content-Disposition'] = self.get_content_disposition()
         return response
 
     # View Methods
     def get_result_list(self, __):
-        if self.request.GET.get('all', 'off') == 'on':
-            self.admin_view.list_per_page = sys.maxsize
-        return __()
+        # the exports read the rows themselves, the page isn't loaded
+        return self.get_export_response()
 
     def result_header(self, item, field_name, row):
         item.export = not item.attr or field_name == '__str__' or getattr(item.attr, 'allow_export', True)
@@ -0,0 +1,316 @@
+"""
+Exports of the change list run in the background.
+
+With ``list_export_background``, or the ``XADMIN_EXPORT_BACKGROUND`` setting,
+the export dialog offers to export in the background. The export is saved as
+an ``ExportJob`` of the user with the query string of the list, so it has the
+filters, the search, the ordering and the columns of the list, and the user
+is sent to the list of their exports, or back to the list with the links of
+the job when they may not see the list of the exports.
+
+The jobs are run by ``XADMIN_EXPORT_JOB_WORKERS`` threads of the web process,
+or, when ``XADMIN_EXPORT_JOB_RUNNER`` is ``'command'``, by the
+``xadmin_export_worker`` command in processes of their own. The files are
+saved in the ``XADMIN_EXPORT_STORAGE`` storage, a private folder of the temp
+directory by default, and are deleted with their jobs after
+``XADMIN_EXPORT_JOB_EXPIRY`` seconds. The exports which run in parallel
+processes, of ``XADMIN_EXPORT_WORKERS`` and ``XADMIN_EXPORT_PARALLEL_ROWS``,
+are only forked by the command, and the exports of the lists with that many
+rows are sent to it as jobs. ``export_jobs/<id>/`` returns the
+progress of a job as json, ``export_jobs/<id>/download/`` sends its file.
+"""
+import datetime
+import logging
+import os
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, get_storage_class
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.http import FileResponse, Http404, HttpRequest, HttpResponseRedirect, QueryDict
+from django.utils import timezone
+from django.utils.encoding import force_text
+from django.utils.six.moves.urllib.parse import urlsplit
+from django.utils.translation import ugettext as _
+from django.views.decorators.cache import never_cache
+
+from xadmin.models import ExportJob
+from xadmin.plugins.export import ExportPlugin
+from xadmin.sites import site
+from xadmin.util import JobPool
+from xadmin.views import BaseAdminPlugin, BaseAdminView, ListAdminView
+from xadmin.views.list import ALL_VAR
+
+logger = logging.getLogger('xadmin.exports')
+
+EXPORT_JOB_RUNNER = getattr(settings, 'XADMIN_EXPORT_JOB_RUNNER', 'thread')
+EXPORT_JOB_WORKERS = getattr(settings, 'XADMIN_EXPORT_JOB_WORKERS', 2)
+EXPORT_JOB_EXPIRY = getattr(settings, 'XADMIN_EXPORT_JOB_EXPIRY', 7 * 24 * 3600)
+
+
+class ExportJobError(Exception):
+    pass
+
+
+def get_export_storage():
+    storage_class = getattr(settings, 'XADMIN_EXPORT_STORAGE', None)
+    if storage_class is None:
+        # not served by the web server, the files are only sent by the
+        # download view to the owners of the jobs
+        return FileSystemStorage(location=os.path.join(tempfile.gettempdir(), 'xadmin_exports'))
+    return get_storage_class(storage_class)()
+
+
+def _update_job(job, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    ExportJob.objects.filter(pk=job.pk).update(**fields)
+
+
+def export_to_file(job, admin_site=None, fork=False):
+    """
+    Export the list of ``job`` as its user, returns a temporary file with the
+    content of the export. The export may fork processes with ``fork``.
+    """
+    admin_site = admin_site or site
+    try:
+        model = apps.get_model(job.model)
+    except LookupError:
+        raise ExportJobError(_('The model %s does not exist.') % job.model)
+    if model not in admin_site._registry:
+        raise ExportJobError(_('The model %s is not registered.') % job.model)
+    view_class = admin_site.get_view_class(ListAdminView, admin_site._registry[model])
+
+    # a redirect to an export of another format is followed once, like the
+    # xls exports with too many rows
+    for attempt in range(2):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.path = request.path_info = '/'
+        request.GET = QueryDict(job.query)
+        request.META['QUERY_STRING'] = job.query
+        request.user = job.user
+        # nothing of the job is kept for the next requests of the user
+        request.session = {}
+        request._messages = CookieStorage(request)
+        # the job isn't held by the admission limits of the requests
+        request.xadmin_job = job
+
+        view = view_class(request)
+        plugins = [p for p in view.plugins if isinstance(p, ExportPlugin)]
+        if not plugins:
+            raise ExportJobError(_('The list of %s has no export.') % job.model)
+        # the rows are exported as long as it takes
+        view.query_timeout = None
+        plugins[0].export_query_timeout = None
+        plugins[0].export_progress = lambda done, total: _update_job(job, progress=done, total=total)
+        plugins[0].export_fork = fork
+
+        response = view.get(request)
+        if response.status_code == 302 and not attempt:
+            query = QueryDict(urlsplit(response['Location']).query)
+            if query.get('_do_') == 'export':
+                _update_job(job, query=query.urlencode(), file_type=query.get('export_type', 'csv'))
+                continue
+        break
+
+    if response.status_code != 200:
+        response.close()
+        raise ExportJobError(' '.join(force_text(m) for m in request._messages) or
+                             _('The export failed with the status %s.') % response.status_code)
+    # with the extension of the compression
+    _update_job(job, file_type=plugins[0].get_export_extension())
+    output = tempfile.TemporaryFile()
+    try:
+        if response.streaming:
+            for chunk in response.streaming_content:
+                output.write(chunk)
+        else:
+            output.write(response.content)
+    except Exception:
+        output.close()
+        raise
+    finally:
+        response.close()
+    output.seek(0)
+    return output
+
+
+def run_export_job(job_id, admin_site=None, fork=False):
+    """
+    Run the pending job ``job_id``, unless another worker took it first.
+    """
+    if not ExportJob.objects.filter(pk=job_id, status='pending').update(status='running',
+                                                                        started=timezone.now()):
+        return
+    job = ExportJob.objects.select_related('user').get(pk=job_id)
+    try:
+        output = export_to_file(job, admin_site, fork)
+        try:
+            name = get_export_storage().save(job.get_file_name(), File(output))
+        finally:
+            output.close()
+    except Exception as e:
+        logger.exception('The export job %s failed', job.pk)
+        _update_job(job, status='failed', error=force_text(e) or e.__class__.__name__,
+                    finished=timezone.now())
+        return
+    finished = timezone.now()
+    _update_job(job, status='done', file=name, total=job.progress, finished=finished,
+                expires=finished + datetime.timedelta(seconds=EXPORT_JOB_EXPIRY))
+
+
+def run_pending_export_jobs(admin_site=None, fork=False):
+    """
+    Run the pending jobs in turn, returns the number of jobs run.
+    """
+    count = 0
+    for job_id in ExportJob.objects.filter(status='pending').order_by('created').values_list('pk', flat=True):
+        run_export_job(job_id, admin_site, fork)
+        count += 1
+    return count
+
+
+def delete_expired_export_jobs():
+    for job in ExportJob.objects.filter(expires__lt=timezone.now()):
+        job.delete()
+
+
+def delete_export_file(sender, instance, **kwargs):
+    if instance.file:
+        try:
+            get_export_storage().delete(instance.file)
+        except (IOError, OSError):
+            logger.warning('The file %s of the export job %s could not be deleted', instance.file, instance.pk)
+
+post_delete.connect(delete_export_file, sender=ExportJob)
+
+
+def _run_export_job(job_id):
+    run_export_job(job_id)
+    delete_expired_export_jobs()
+
+_pool = None
+
+
+def submit_export_job(job):
+    """
+    Hand ``job`` to the threads of the process once it's committed, the
+    ``xadmin_export_worker`` command finds the pending jobs itself.
+    """
+    global _pool
+    if EXPORT_JOB_RUNNER != 'thread':
+        return
+    if _pool is None:
+        _pool = JobPool(EXPORT_JOB_WORKERS, _run_export_job, 'xadmin-export')
+    transaction.on_commit(lambda: _pool.submit(job.pk))
+
+
+class ExportJobPlugin(BaseAdminPlugin):
+    # Offer to run the exports of the list in the background
+    list_export_background = getattr(settings, 'XADMIN_EXPORT_BACKGROUND', False)
+
+    def init_request(self, *args, **kwargs):
+        if self.request.GET.get('_do_') != 'export' or getattr(self.request, 'xadmin_job', None) is not None:
+            return False
+        self.background = bool(self.list_export_background and self.request.GET.get('export_background') == 'on')
+        # the parallel exports are run by the worker command
+        return self.background or EXPORT_JOB_RUNNER == 'command'
+
+    def is_parallel_export(self):
+        plugins = [p for p in self.admin_view.plugins if isinstance(p, ExportPlugin)]
+        if not plugins or not plugins[0].can_export_in_parallel():
+            return False
+        export = plugins[0]
+        return export.get_export_count(export.get_export_queryset()) >= export.export_parallel_rows
+
+    def get_result_list(self, __):
+        if not self.background and not self.is_parallel_export():
+            return __()
+        query = self.request.GET.copy()
+        query.pop('export_background', None)
+        job = ExportJob.objects.create(user=self.user, model=self.opts.label_lower, query=query.urlencode(),
+                                       file_type=query.get('export_type', 'csv'))
+        submit_export_job(job)
+        if self.has_model_perm(ExportJob, 'view'):
+            self.message_user(_('The export runs in the background, download it from your exports when it is done.'),
+                              'success')
+            return HttpResponseRedirect(self.get_model_url(ExportJob, 'changelist'))
+        # the list of the exports needs its permission, the user follows the
+        # job from its own pages
+        self.message_user(_('The export runs in the background, <a href="%(download)s">download it</a> when it is '
+                            'done, or follow its <a href="%(progress)s">progress</a>.') % {
+            'download': self.get_admin_url('export_job_download', job.pk),
+            'progress': self.get_admin_url('export_job', job.pk)}, 'success')
+        return HttpResponseRedirect(self.request.path + self.admin_view.get_query_string(
+            remove=['_do_', 'export_', ALL_VAR]))
+    # before the export itself
+    get_result_list.priority = 5
+
+
+class ExportJobView(BaseAdminView):
+    """
+    The progress of an export job, as json.
+    """
+
+    def get_job(self, job_id):
+        try:
+            job = ExportJob.objects.get(pk=job_id)
+        except ExportJob.DoesNotExist:
+            raise Http404
+        if job.user_id != self.user.pk and not self.user.is_superuser:
+            raise Http404
+        return job
+
+    @never_cache
+    def get(self, request, job_id):
+        job = self.get_job(job_id)
+        percent = None
+        if job.status == 'done':
+            percent = 100
+        elif job.total:
+            percent = min(100, job.progress * 100 // job.total)
+        return self.render_response({
+            'id': job.pk,
+            'status': job.status,
+            'progress': job.progress,
+            'total': job.total,
+            'percent': percent,
+            'error': job.error,
+            'expires': job.expires,
+            'download_url': self.get_admin_url('export_job_download', job.pk) if job.status == 'done' else None,
+        })
+
+
+class ExportJobDownloadView(ExportJobView):
+
+    @never_cache
+    def get(self, request, job_id):
+        job = self.get_job(job_id)
+        if job.status != 'done' or not job.file:
+            raise Http404
+        try:
+            content = get_export_storage().open(job.file)
+        except (IOError, OSError):
+            raise Http404
+        try:
+            file_name = apps.get_model(job.model)._meta.verbose_name.replace(' ', '_')
+        except LookupError:
+            file_name = job.model
+        if job.file_type in ExportPlugin.export_mimes:
+            content_type = "%s; charset=UTF-8" % ExportPlugin.export_mimes[job.file_type]
+        else:
+            # compressed
+            content_type = 'application/octet-stream'
+        response = FileResponse(content, content_type=content_type)
+        response['Content-Disposition'] = ('attachment; filename=%s.%s' % (file_name, job.file_type)).encode('utf-8')
+        return response
+
+
+site.register_plugin(ExportJobPlugin, ListAdminView)
+site.register_view(r'^export_jobs/(\d+)/$', ExportJobView, name='export_job')
+site.register_view(r'^export_jobs/(\d+)/download/$', ExportJobDownloadView, name='export_job_download')
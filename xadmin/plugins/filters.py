@@ -4,20 +4,23 @@ from xadmin import widgets
 from xadmin.plugins.utils import get_context_dict
 
 from django.contrib.admin.utils import get_fields_from_path, lookup_needs_distinct
-from django.core.exceptions import SuspiciousOperation, ImproperlyConfigured, ValidationError
+from django.core.exceptions import SuspiciousOperation, ImproperlyConfigured, ValidationError, PermissionDenied
 from django.db import models
 from django.db.models.fields import FieldDoesNotExist
 from django.db.models.sql.query import LOOKUP_SEP, QUERY_TERMS
+from django.http import Http404
 from django.template import loader
 from django.utils import six
-from django.utils.encoding import smart_str
+from django.utils.encoding import smart_str, smart_text
 from django.utils.translation import ugettext as _
 
 from xadmin.filters import manager as filter_manager, FILTER_PREFIX, SEARCH_VAR, DateFieldListFilter, \
-    RelatedFieldSearchFilter
+    RelatedFieldSearchFilter, get_related_choices_queryset, get_related_value_attname
+from xadmin.search import construct_search, get_search_backend
 from xadmin.sites import site
-from xadmin.views import BaseAdminPlugin, ListAdminView
-from xadmin.util import is_related_field
+from xadmin.views import BaseAdminPlugin, ListAdminView, ModelAdminView
+from xadmin.views.list import PAGE_VAR, ORDER_VAR
+from xadmin.util import is_related_field, is_related_field2, pk_in_subquery
 from functools import reduce
 
 
@@ -25,21 +28,129 @@ class IncorrectLookupParameters(Exception):
     pass
 
 
+_distinct_paths = {}
+
+
+def path_needs_distinct(model, field_path):
+    """
+    Cached ``lookup_needs_distinct``, true if ``field_path`` goes through a
+    many to many or reverse foreign key relation of ``model``.
+    """
+    key = (model, field_path)
+    if key not in _distinct_paths:
+        _distinct_paths[key] = lookup_needs_distinct(model._meta, field_path)
+    return _distinct_paths[key]
+
+
+class ResolvedListFilter(object):
+    """
+    The request independent part of the ``list_filter`` option of a list view
+    class: the field and filter class of each entry and the lookups allowed
+    when ``free_query_filter`` is off.
+    """
+    # bound of the allowed lookups memo, the lookups come from the url
+    max_lookups = 1000
+
+    def __init__(self, filters, fkey_lookups):
+        # (filter class, field, field path, title prefix) of each entry
+        self.filters = filters
+        self.fkey_lookups = fkey_lookups
+        self.allowed_lookups = {}
+
+
+_resolved_list_filters = {}
+
+
+def filter_by_spec(spec, queryset):
+    """
+    Return ``queryset`` filtered by ``spec``. The filters of many to many or
+    reverse foreign key paths are applied in a ``pk__in`` subquery, so the
+    queryset needs no ``distinct()``.
+    """
+    field_path = getattr(spec, 'field_path', None)
+    if spec.is_used and field_path and path_needs_distinct(spec.model, field_path):
+        subquery = spec.do_filte(spec.model._base_manager.all())
+        if subquery is None:
+            return None
+        return queryset.filter(pk__in=subquery.values('pk'))
+    return spec.do_filte(queryset)
+
+
 class FilterPlugin(BaseAdminPlugin):
     list_filter = ()
     search_fields = ()
+    # Class or dotted path of the search backend, see xadmin.search
+    search_backend = None
     free_query_filter = True
+    # Show the number of rows of each filter choice
+    list_filter_counts = False
+
+    def resolve_list_filter(self):
+        """
+        Resolve the fields and filter classes of ``list_filter`` once per value
+        of the option, each request only binds the parameters to the filters.
+        """
+        key = (self.model, tuple(tuple(f) if isinstance(f, list) else f for f in self.list_filter))
+        try:
+            resolved = _resolved_list_filters.get(key)
+        except TypeError:
+            # an entry can't be a key, the option is resolved for each request
+            key, resolved = None, None
+        if resolved is None:
+            filters = []
+            for list_filter in self.list_filter:
+                if callable(list_filter):
+                    # This is simply a custom list filter class.
+                    filters.append((list_filter, None, None, None))
+                    continue
+                field_path = None
+                field_parts = []
+                if isinstance(list_filter, (tuple, list)):
+                    # This is a custom FieldListFilter class for a given field.
+                    field, field_list_filter_class = list_filter
+                else:
+                    # This is simply a field name, so use the default
+                    # FieldListFilter class that has been registered for
+                    # the type of the given field.
+                    field, field_list_filter_class = list_filter, None
+                if not isinstance(field, models.Field):
+                    field_path = field
+                    field_parts = get_fields_from_path(self.model, field_path)
+                    field = field_parts[-1]
+                if field_list_filter_class is None:
+                    field_list_filter_class = filter_manager.get_filter_class(
+                        field, self.request, {}, self.model, self.admin_view, field_path)
+                    if field_list_filter_class is None:
+                        continue
+                # Add related model name to title
+                title_prefix = field_parts[-2].name if len(field_parts) > 1 else None
+                filters.append((field_list_filter_class, field, field_path, title_prefix))
+
+            # Check FKey lookups that are allowed, so that popups produced by
+            # ForeignKeyRawIdWidget, on the basis of ForeignKey.limit_choices_to,
+            # are allowed to work.
+            fkey_lookups = set()
+            for l in self.model._meta.related_fkey_lookups:
+                fkey_lookups.update(widgets.url_params_from_lookup_dict(l).items())
+
+            resolved = ResolvedListFilter(filters, fkey_lookups)
+            if key is not None:
+                _resolved_list_filters[key] = resolved
+        return resolved
 
     def lookup_allowed(self, lookup, value):
-        model = self.model
-        # Check FKey lookups that are allowed, so that popups produced by
-        # ForeignKeyRawIdWidget, on the basis of ForeignKey.limit_choices_to,
-        # are allowed to work.
-        for l in model._meta.related_fkey_lookups:
-            for k, v in widgets.url_params_from_lookup_dict(l).items():
-                if k == lookup and v == value:
-                    return True
+        resolved = self.resolve_list_filter()
+        if (lookup, value) in resolved.fkey_lookups:
+            return True
+        allowed = resolved.allowed_lookups.get(lookup)
+        if allowed is None:
+            allowed = self.lookup_path_allowed(lookup)
+            if len(resolved.allowed_lookups) < resolved.max_lookups:
+                resolved.allowed_lookups[lookup] = allowed
+        return allowed
 
+    def lookup_path_allowed(self, lookup):
+        model = self.model
         parts = lookup.split(LOOKUP_SEP)
 
         # Last term in lookup is a query term (__exact, __startswith etc)
@@ -76,12 +187,12 @@ class FilterPlugin(BaseAdminPlugin):
         return clean_lookup in self.list_filter
 
     def get_list_queryset(self, queryset):
+        base_queryset = queryset
         lookup_params = dict([(smart_str(k)[len(FILTER_PREFIX):], v) for k, v in self.admin_view.params.items()
                               if smart_str(k).startswith(FILTER_PREFIX) and v != ''])
         for p_key, p_val in iteritems(lookup_params):
             if p_val == "False":
                 lookup_params[p_key] = False
-        use_distinct = False
 
         # for clean filters
         self.admin_view.has_query_param = bool(lookup_params)
@@ -96,49 +207,24 @@ class FilterPlugin(BaseAdminPlugin):
                         "Filtering by %s not allowed" % key)
 
         self.filter_specs = []
-        if self.list_filter:
-            for list_filter in self.list_filter:
-                if callable(list_filter):
-                    # This is simply a custom list filter class.
-                    spec = list_filter(self.request, lookup_params,
-                                       self.model, self)
-                else:
-                    field_path = None
-                    field_parts = []
-                    if isinstance(list_filter, (tuple, list)):
-                        # This is a custom FieldListFilter class for a given field.
-                        field, field_list_filter_class = list_filter
-                    else:
-                        # This is simply a field name, so use the default
-                        # FieldListFilter class that has been registered for
-                        # the type of the given field.
-                        field, field_list_filter_class = list_filter, filter_manager.create
-                    if not isinstance(field, models.Field):
-                        field_path = field
-                        field_parts = get_fields_from_path(
-                            self.model, field_path)
-                        field = field_parts[-1]
-                    spec = field_list_filter_class(
-                        field, self.request, lookup_params,
-                        self.model, self.admin_view, field_path=field_path)
-
-                    if len(field_parts) > 1:
-                        # Add related model name to title
-                        spec.title = "%s %s" % (field_parts[-2].name, spec.title)
-
-                    # Check if we need to use distinct()
-                    use_distinct = (use_distinct or
-                                    lookup_needs_distinct(self.opts, field_path))
-                if spec and spec.has_output():
-                    try:
-                        new_qs = spec.do_filte(queryset)
-                    except ValidationError as e:
-                        new_qs = None
-                        self.admin_view.message_user(_("<b>Filtering error:</b> %s") % e.messages[0], 'error')
-                    if new_qs is not None:
-                        queryset = new_qs
-
-                    self.filter_specs.append(spec)
+        for filter_class, field, field_path, title_prefix in self.resolve_list_filter().filters:
+            if field is None:
+                spec = filter_class(self.request, lookup_params, self.model, self)
+            else:
+                spec = filter_class(field, self.request, lookup_params,
+                                    self.model, self.admin_view, field_path=field_path)
+                if title_prefix:
+                    spec.title = "%s %s" % (title_prefix, spec.title)
+            if spec and spec.has_output():
+                try:
+                    new_qs = filter_by_spec(spec, queryset)
+                except ValidationError as e:
+                    new_qs = None
+                    self.admin_view.message_user(_("<b>Filtering error:</b> %s") % e.messages[0], 'error')
+                if new_qs is not None:
+                    queryset = new_qs
+
+                self.filter_specs.append(spec)
 
         self.has_filters = bool(self.filter_specs)
         self.admin_view.filter_specs = self.filter_specs
@@ -147,24 +233,41 @@ class FilterPlugin(BaseAdminPlugin):
             obj = list(obj)
         self.admin_view.used_filter_num = len(obj)
 
-        try:
-            for key, value in lookup_params.items():
-                use_distinct = (
-                    use_distinct or lookup_needs_distinct(self.opts, key))
-        except FieldDoesNotExist as e:
-            raise IncorrectLookupParameters(e)
+        queryset = self.filter_lookup_params(queryset, lookup_params)
+
+        query = self.request.GET.get(SEARCH_VAR, '')
 
+        # Apply keyword searches.
+        if self.search_fields and query:
+            queryset = self.filter_search(queryset, query, rank=ORDER_VAR not in self.admin_view.params)
+            if self.get_search_backend().needs_distinct():
+                queryset = queryset.distinct()
+            self.admin_view.search_query = query
+
+        # the quick filters count their choices with these too
+        self.lookup_params, self.search_query = lookup_params, query
+        if self.list_filter_counts or any(getattr(spec, 'always_count', False) for spec in self.filter_specs):
+            self.load_facet_counts(base_queryset, queryset, lookup_params, query)
+
+        return queryset
+
+    def filter_lookup_params(self, queryset, lookup_params):
         try:
             # fix a bug by david: In demo, quick filter by IDC Name() cannot be used.
             if isinstance(queryset, models.query.QuerySet) and lookup_params:
                 new_lookup_parames = dict()
-                for k, v in lookup_params.iteritems():
+                for k, v in iteritems(lookup_params):
                     list_v = v.split(',')
                     if len(list_v) > 0:
                         new_lookup_parames.update({k: list_v})
                     else:
                         new_lookup_parames.update({k: v})
-                queryset = queryset.filter(**new_lookup_parames)
+                if any(path_needs_distinct(self.model, key) for key in new_lookup_parames):
+                    queryset = queryset.filter(pk_in_subquery(self.model, **new_lookup_parames))
+                else:
+                    queryset = queryset.filter(**new_lookup_parames)
+        except FieldDoesNotExist as e:
+            raise IncorrectLookupParameters(e)
         except (SuspiciousOperation, ImproperlyConfigured):
             raise
         except Exception as e:
@@ -173,37 +276,50 @@ class FilterPlugin(BaseAdminPlugin):
             if not isinstance(queryset, models.query.QuerySet):
                 pass
 
-        query = self.request.GET.get(SEARCH_VAR, '')
+        return queryset
 
-        # Apply keyword searches.
-        def construct_search(field_name):
-            if field_name.startswith('^'):
-                return "%s__istartswith" % field_name[1:]
-            elif field_name.startswith('='):
-                return "%s__iexact" % field_name[1:]
-            elif field_name.startswith('@'):
-                return "%s__search" % field_name[1:]
-            else:
-                return "%s__icontains" % field_name
+    def get_search_backend(self):
+        return get_search_backend(self.search_backend)(self.model, self.search_fields)
 
+    def filter_search(self, queryset, query, rank=False):
         if self.search_fields and query:
-            orm_lookups = [construct_search(str(search_field))
-                           for search_field in self.search_fields]
-            for bit in query.split():
-                or_queries = [models.Q(**{orm_lookup: bit})
-                              for orm_lookup in orm_lookups]
-                queryset = queryset.filter(reduce(operator.or_, or_queries))
-            if not use_distinct:
-                for search_spec in orm_lookups:
-                    if lookup_needs_distinct(self.opts, search_spec):
-                        use_distinct = True
-                        break
-            self.admin_view.search_query = query
+            queryset = self.get_search_backend().search(queryset, query, rank)
+        return queryset
 
-        if use_distinct:
-            return queryset.distinct()
-        else:
-            return queryset
+    def get_facet_queryset(self, base_queryset, lookup_params, query, params):
+        """
+        ``base_queryset`` filtered as the list is, but without the filter
+        params ``params``: the filters and the lookup params using them are
+        left out.
+        """
+        params = set(params)
+        facet_queryset = base_queryset
+        for spec in self.filter_specs:
+            if params.intersection(spec.used_params):
+                continue
+            try:
+                new_qs = filter_by_spec(spec, facet_queryset)
+            except ValidationError:
+                new_qs = None
+            if new_qs is not None:
+                facet_queryset = new_qs
+        lookup_params = dict((k, v) for k, v in lookup_params.items() if k not in params)
+        return self.filter_search(self.filter_lookup_params(facet_queryset, lookup_params), query)
+
+    def load_facet_counts(self, base_queryset, queryset, lookup_params, query):
+        """
+        Count the rows of each filter choice with one grouped query per filter.
+        A used filter is counted as if it wasn't used, so its other choices
+        show how many rows they would list.
+        """
+        for spec in self.filter_specs:
+            if not hasattr(spec, 'load_facet_counts') or \
+                    not (self.list_filter_counts or getattr(spec, 'always_count', False)):
+                continue
+            facet_queryset = queryset
+            if spec.is_used:
+                facet_queryset = self.get_facet_queryset(base_queryset, lookup_params, query, spec.used_params)
+            spec.load_facet_counts(facet_queryset)
 
     # Media
     def get_media(self, media):
@@ -213,7 +329,8 @@ class FilterPlugin(BaseAdminPlugin):
         if bool(arr):
             media = media + self.vendor('datepicker.css', 'datepicker.js',
                                         'xadmin.widget.datetime.js')
-        arr = filter(lambda s: isinstance(s, RelatedFieldSearchFilter), self.filter_specs)
+        arr = filter(lambda s: isinstance(s, RelatedFieldSearchFilter) or getattr(s, 'search_choices', False),
+                     self.filter_specs)
         if six.PY3:
             arr = list(arr)
         if bool(arr):
@@ -242,4 +359,65 @@ class FilterPlugin(BaseAdminPlugin):
             )
 
 
+class RelatedFilterChoicesView(ModelAdminView):
+    """
+    Paginated json choices of a related field list filter, used by the search
+    box of the filters whose related table is too big to list.
+    """
+    list_filter = ()
+    choices_per_page = 20
+
+    def get_filter_field(self, field_path):
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, (tuple, list)):
+                list_filter = list_filter[0]
+            if list_filter == field_path:
+                field = get_fields_from_path(self.model, field_path)[-1]
+                if is_related_field2(field):
+                    return field
+        raise Http404
+
+    def get_search_fields(self, other_model):
+        related_admin = self.admin_site._registry.get(other_model)
+        search_fields = getattr(related_admin, 'search_fields', None)
+        if search_fields:
+            return search_fields
+        return [f.name for f in other_model._meta.fields if isinstance(f, models.CharField)]
+
+    def get(self, request, field_path):
+        if not self.has_view_permission():
+            raise PermissionDenied
+
+        field = self.get_filter_field(field_path)
+        queryset = get_related_choices_queryset(field)
+
+        query = request.GET.get(SEARCH_VAR, '')
+        if query:
+            orm_lookups = [construct_search(str(search_field))
+                           for search_field in self.get_search_fields(queryset.model)]
+            for bit in query.split():
+                or_queries = [models.Q(**{orm_lookup: bit})
+                              for orm_lookup in orm_lookups]
+                if or_queries:
+                    queryset = queryset.filter(reduce(operator.or_, or_queries))
+            queryset = queryset.distinct()
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+
+        try:
+            page = max(int(request.GET.get(PAGE_VAR, 0)), 0)
+        except ValueError:
+            page = 0
+        start = page * self.choices_per_page
+        objs = list(queryset[start:start + self.choices_per_page + 1])
+
+        attname = get_related_value_attname(field)
+        return self.render_response({
+            'objects': [{'id': getattr(obj, attname), '__str__': smart_text(obj)}
+                        for obj in objs[:self.choices_per_page]],
+            'has_more': len(objs) > self.choices_per_page,
+        })
+
+
 site.register_plugin(FilterPlugin, ListAdminView)
+site.register_modelview(r'^filter/(.+)/$', RelatedFilterChoicesView, name='%s_%s_filter_choices')
@@ -38,15 +38,49 @@ class FooAdmin(object):
 ++++++++++++++++
 More info about django-import-export please refer https://github.com/django-import-export/django-import-export
 """
+import codecs
+import csv
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import traceback
+import uuid
+from collections import OrderedDict, deque
+from copy import copy, deepcopy
 from datetime import datetime
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+import tablib
+from django.apps import apps
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Case, Model, Q, Value, When
+from django.db.models.signals import post_delete, pre_save, post_save
 from django.template import loader
+from django.utils import six, timezone
+from django.utils.six.moves import cPickle as pickle
+from xadmin.filters import bump_model_generation
+from xadmin.models import ImportJob
+from xadmin.util import JobPool, json
 from xadmin.plugins.utils import get_context_dict
 from xadmin.sites import site
-from xadmin.views import BaseAdminPlugin, ListAdminView, ModelAdminView
+from xadmin.views import BaseAdminPlugin, BaseAdminView, ListAdminView, ModelAdminView
 from xadmin.views.base import csrf_protect_m, filter_hook
 from django.db import transaction
 from import_export.admin import DEFAULT_FORMATS, SKIP_ADMIN_LOG, TMP_STORAGE_CLASS
-from import_export.resources import modelresource_factory
+from import_export import widgets
+from import_export.formats.base_formats import CSV, TSV, XLSX, TextFormat
+from import_export.instance_loaders import BaseInstanceLoader
+from import_export.resources import Diff, ModelResource, modelresource_factory
+from import_export.tmp_storages import TempFolderStorage
+from import_export.utils import atomic_if_using_transaction
 from import_export.forms import (
     ImportForm,
     ConfirmImportForm,
@@ -60,12 +94,493 @@ except ImportError:
     from django.utils.encoding import force_unicode as force_text
 from django.utils.translation import ugettext_lazy as _
 from django.template.response import TemplateResponse
+from django.views.decorators.cache import never_cache
 from django.contrib.admin.models import LogEntry, ADDITION, CHANGE, DELETION
 from django.contrib.contenttypes.models import ContentType
 from django.contrib import messages
 from django.core.urlresolvers import reverse
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import Http404, HttpRequest, HttpResponseRedirect, HttpResponse
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+
+logger = logging.getLogger('xadmin.importexport')
+
+IMPORT_JOB_RUNNER = getattr(settings, 'XADMIN_IMPORT_JOB_RUNNER', 'thread')
+IMPORT_JOB_WORKERS = getattr(settings, 'XADMIN_IMPORT_JOB_WORKERS', 1)
+
+# the resources of the checks running in processes, by token
+_import_checks = {}
+# the connections of the parent of a forked process
+_parent_connections = None
+
+
+def get_import_cache():
+    return caches[getattr(settings, 'XADMIN_IMPORT_CACHE', 'default')]
+
+
+def overrides(cls, base, names):
+    """
+    Whether ``cls`` overrides any of the methods ``names`` of ``base``.
+    """
+    unbound = six.get_unbound_function
+    return any(unbound(getattr(cls, name)) is not unbound(getattr(base, name)) for name in names)
+
+
+def iter_csv_rows(lines, delimiter=',', encoding=None):
+    for row in csv.reader(lines, delimiter=delimiter):
+        # tablib skips the empty lines too
+        if row:
+            yield [force_text(value, encoding) for value in row] if encoding else row
+
+
+def iter_ndjson_rows(lines):
+    """
+    The keys of the first object are the headers, they are the first row.
+    """
+    headers = None
+    for line in lines:
+        if not line.strip():
+            continue
+        obj = json.loads(line, object_pairs_hook=OrderedDict)
+        if headers is None:
+            headers = list(obj.keys())
+            yield headers
+        yield [obj.get(header) for header in headers]
+
+
+def iter_xlsx_rows(file):
+    # the cells of the rows are read as they are iterated
+    book = openpyxl.load_workbook(file, read_only=True)
+    try:
+        for row in book.active.iter_rows():
+            yield [cell.value for cell in row]
+    finally:
+        if hasattr(book, 'close'):
+            book.close()
+
+
+class NDJSON(TextFormat):
+    """
+    One json object by line.
+    """
+
+    def get_title(self):
+        return 'ndjson'
+
+    def get_extension(self):
+        return 'ndjson'
+
+    def get_content_type(self):
+        return 'application/x-ndjson'
+
+    def can_import(self):
+        return True
+
+    def create_dataset(self, in_stream):
+        rows = iter_ndjson_rows(in_stream.splitlines())
+        headers = next(rows, None)
+        return tablib.Dataset(*rows, headers=headers)
+
+
+def _process_pool(workers):
+    try:
+        # the processes inherit the resource, they must be forked
+        return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+    except (AttributeError, TypeError):
+        return ProcessPoolExecutor(workers)
+
+
+def _detach_connections():
+    """
+    Keep the connections inherited from the parent open and unused, the
+    process opens connections of its own when it needs them.
+    """
+    global _parent_connections
+    if _parent_connections is None:
+        _parent_connections = [conn.connection for conn in connections.all()]
+        for conn in connections.all():
+            conn.connection = None
+
+
+class PreloadedForeignKeyWidget(widgets.ForeignKeyWidget):
+    """
+    A ``ForeignKeyWidget`` which finds the keys of the related instances in
+    ``ids``, the keys read for the values of the rows of a chunk.
+    """
+
+    def __init__(self, model, field, ids):
+        super(PreloadedForeignKeyWidget, self).__init__(model, field)
+        self.ids = ids
+
+    def clean(self, value, row=None, *args, **kwargs):
+        val = widgets.Widget.clean(self, value)
+        if not val:
+            return None
+        try:
+            return self.model(pk=self.ids[val])
+        except (KeyError, TypeError):
+            raise self.model.DoesNotExist('%s matching query does not exist.' % self.model._meta.object_name)
+
+
+def _check_rows(token, rows, ids):
+    """
+    Clean the ``(line, row)`` of a chunk like the import, in a process of
+    the pool. Returns the ``(line, row, error, traceback)`` of the rows with
+    errors.
+    """
+    _detach_connections()
+    resource = copy(_import_checks[token])
+    resource.fields = OrderedDict(resource.fields)
+    for name, field_ids in ids.items():
+        field = resource.fields[name] = copy(resource.fields[name])
+        field.widget = PreloadedForeignKeyWidget(field.widget.model, field.widget.field, field_ids)
+    exclude = None
+    if getattr(resource._meta, 'clean_model_instances', False):
+        attributes = set(f.attribute for f in resource.get_import_fields())
+        # the related instances are only their keys
+        exclude = [f.name for f in resource._meta.model._meta.fields
+                   if f.primary_key or f.is_relation or f.name not in attributes]
+
+    errors = []
+    for line, row in rows:
+        try:
+            instance = resource.init_instance(row)
+            resource.import_obj(instance, row, True)
+            if exclude is not None:
+                instance.full_clean(exclude=exclude, validate_unique=False)
+        except Exception as e:
+            tb_info = traceback.format_exc()
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = Exception(force_text(e))
+            errors.append((line, row, e, tb_info))
+    return errors
+
+
+def bulk_update(model, objs, fields, batch_size=None):
+    """
+    Update the ``fields`` of ``objs`` with one query for each batch, a CASE
+    on their primary keys gives the value of each object.
+    """
+    manager = model._default_manager
+    if hasattr(manager, 'bulk_update'):
+        return manager.bulk_update(objs, [f.name for f in fields], batch_size)
+    ops = connections[manager.db].ops
+    max_size = ops.bulk_batch_size(['pk', 'pk'] + list(fields), objs)
+    batch_size = min(batch_size, max_size) if batch_size else max_size
+    for i in range(0, len(objs), batch_size):
+        batch = objs[i:i + batch_size]
+        values = {}
+        for field in fields:
+            whens = [When(pk=obj.pk, then=Value(getattr(obj, field.attname), output_field=field)) for obj in batch]
+            values[field.attname] = Case(*whens, output_field=field)
+        manager.filter(pk__in=[obj.pk for obj in batch]).update(**values)
+
+
+class BatchInstanceLoader(BaseInstanceLoader):
+    """
+    The existing instances of a batch of rows, read by one query on the
+    ``import_id_fields`` of the resource.
+    """
+
+    def __init__(self, resource, dataset=None):
+        super(BatchInstanceLoader, self).__init__(resource, dataset)
+        self.id_fields = [resource.fields[name] for name in resource.get_import_id_fields()]
+        self.instances = {}
+
+    def get_key(self, row):
+        return tuple(field.clean(row) for field in self.id_fields)
+
+    def load(self, rows):
+        keys = set()
+        for row in rows:
+            try:
+                key = self.get_key(row)
+            except Exception:
+                # the error is reported with the row
+                continue
+            if None not in key:
+                keys.add(key)
+        self.instances = {}
+        if not keys:
+            return
+        queryset = self.resource.get_queryset()
+        if len(self.id_fields) == 1:
+            queryset = queryset.filter(**{'%s__in' % self.id_fields[0].attribute: [k[0] for k in keys]})
+        else:
+            queryset = queryset.filter(reduce(or_, [
+                Q(**dict((f.attribute, v) for f, v in zip(self.id_fields, key))) for key in keys]))
+        for instance in queryset:
+            self.instances[tuple(f.get_value(instance) for f in self.id_fields)] = instance
+
+    def add(self, row, instance=None):
+        """
+        Add the new instance of ``row`` for the next rows of its key, without
+        ``instance`` it's read again when they need it.
+        """
+        key = self.get_key(row)
+        if None not in key:
+            self.instances[key] = instance
+
+    def get_instance(self, row):
+        key = self.get_key(row)
+        instance = self.instances.get(key)
+        if instance is None and key in self.instances:
+            instance = self.instances[key] = self.resource.get_queryset().filter(
+                **dict((f.attribute, v) for f, v in zip(self.id_fields, key))).first()
+        return instance
+
+
+def has_save_receivers(model):
+    """
+    Return True if the save signals of ``model`` have receivers, other than
+    the cache generation of the filters which the bulk writes bump.
+    """
+    return any(receiver is not bump_model_generation
+               for signal in (pre_save, post_save) for receiver in signal._live_receivers(model))
+
+
+class BulkImport(object):
+    """
+    Import a dataset with a resource by batches of ``batch_size`` rows. The
+    existing instances of a batch are read at once, the new ones are written
+    with ``bulk_create`` and the changed ones with ``bulk_update``, the rows
+    which didn't change aren't written.
+
+    The instances are saved one by one by the resource when it saves them
+    itself, or when the model has a ``save`` method, save signals, parents or
+    imported many to many fields. A batch whose bulk write fails is imported
+    again row by row, to report the errors of its rows.
+
+    The results of the new rows only have their keys with ``need_ids``, for
+    the admin log or the diffs of a dry run. The databases which don't return
+    them from a bulk insert save these rows one by one.
+    """
+
+    def __init__(self, resource, batch_size, need_ids=True):
+        self.resource = resource
+        self.batch_size = batch_size
+        self.need_ids = need_ids
+        self.model = resource._meta.model
+        import_fields = resource.get_import_fields()
+        attributes = set(f.attribute for f in import_fields if f.attribute)
+        self.update_fields = [f for f in self.model._meta.concrete_fields
+                              if not f.primary_key and (f.name in attributes or f.attname in attributes or
+                                                        getattr(f, 'auto_now', False))]
+        self.bulk = self.can_bulk_write(import_fields)
+
+    def can_bulk_write(self, import_fields):
+        if overrides(type(self.resource), ModelResource, ('import_row', 'save_instance', 'before_save_instance',
+                                                    'after_save_instance', 'save_m2m')):
+            return False
+        if overrides(self.model, Model, ('save',)) or self.model._meta.parents:
+            return False
+        if has_save_receivers(self.model):
+            return False
+        return not any(isinstance(f.widget, widgets.ManyToManyWidget) for f in import_fields)
+
+    def has_changed(self, instance, original):
+        return any(getattr(instance, f.attname) != getattr(original, f.attname) for f in self.update_fields)
+
+    def import_data(self, dataset, dry_run=False, raise_errors=False, use_transactions=None, rows=None,
+                    on_batch=None, **kwargs):
+        """
+        Like ``Resource.import_data``, with its hooks.
+
+        ``rows`` are the row dicts to import instead of the rows of
+        ``dataset``, read as the batches are imported. ``on_batch`` is called
+        with the results of the rows of each batch, the result then only keeps
+        the rows with errors.
+        """
+        resource = self.resource
+        if use_transactions is None:
+            use_transactions = resource.get_use_transactions()
+        supports_transactions = getattr(connections[self.model._default_manager.db].features,
+                                        'supports_transactions', False)
+        using_transactions = (use_transactions or dry_run) and supports_transactions
+
+        with atomic_if_using_transaction(using_transactions):
+            sid = transaction.savepoint() if using_transactions else None
+            result = resource.get_result_class()()
+            result.diff_headers = resource.get_diff_headers()
+            try:
+                with atomic_if_using_transaction(using_transactions):
+                    resource.before_import(dataset, using_transactions, dry_run, **kwargs)
+            except Exception as e:
+                logger.exception(e)
+                result.append_base_error(resource.get_error_result_class()(e, traceback.format_exc()))
+            result.total_rows = 0
+            # the rows passed to on_batch are replaced by a placeholder of
+            # their import type, the line numbers of the errors stay right and
+            # after_import still sees the types, to reset the sequences
+            placeholders = {}
+
+            loader = BatchInstanceLoader(resource, dataset)
+            rows = iter(dataset.dict if rows is None else rows)
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                result.total_rows += len(batch)
+                loader.load(batch)
+                if self.bulk:
+                    row_results = self.import_batch(batch, loader, using_transactions, dry_run, **kwargs)
+                else:
+                    row_results = self.import_rows(batch, loader, using_transactions, dry_run, **kwargs)
+                for row, row_result in zip(batch, row_results):
+                    result.increment_row_result_total(row_result)
+                    if row_result.errors and raise_errors:
+                        raise row_result.errors[-1].error
+                    if on_batch is not None and not row_result.errors:
+                        placeholder = placeholders.get(row_result.import_type)
+                        if placeholder is None:
+                            placeholder = placeholders[row_result.import_type] = resource.get_row_result_class()()
+                            placeholder.import_type = row_result.import_type
+                        result.append_row_result(placeholder)
+                    elif row_result.import_type != row_result.IMPORT_TYPE_SKIP or resource._meta.report_skipped:
+                        result.append_row_result(row_result)
+                if on_batch is not None:
+                    on_batch(row_results)
+
+            try:
+                with atomic_if_using_transaction(using_transactions):
+                    resource.after_import(dataset, result, using_transactions, dry_run, **kwargs)
+            except Exception as e:
+                logger.exception(e)
+                result.append_base_error(resource.get_error_result_class()(e, traceback.format_exc()))
+                if raise_errors:
+                    raise
+
+            if sid is not None:
+                if dry_run or result.has_errors():
+                    transaction.savepoint_rollback(sid)
+                else:
+                    transaction.savepoint_commit(sid)
+        return result
+
+    def import_rows(self, rows, loader, using_transactions, dry_run, **kwargs):
+        row_results = []
+        for row in rows:
+            with atomic_if_using_transaction(using_transactions):
+                row_result = self.resource.import_row(row, loader, using_transactions=using_transactions,
+                                                      dry_run=dry_run, **kwargs)
+            if row_result.import_type == row_result.IMPORT_TYPE_NEW:
+                # the next rows of its key update it
+                loader.add(row)
+            row_results.append(row_result)
+        return row_results
+
+    def import_batch(self, rows, loader, using_transactions, dry_run, **kwargs):
+        resource = self.resource
+        row_result_class = resource.get_row_result_class()
+        row_results = []
+        instances = []
+        diffs = []
+        created = set()
+        creates = []
+        updates = []
+        deletes = []
+        for row in rows:
+            row_result = row_result_class()
+            instance = diff = compared = None
+            try:
+                resource.before_import_row(row, **kwargs)
+                instance, new = resource.get_or_init_instance(loader, row)
+                resource.after_import_instance(instance, new, **kwargs)
+                row_result.import_type = row_result.IMPORT_TYPE_NEW if new else row_result.IMPORT_TYPE_UPDATE
+                row_result.new_record = new
+                original = deepcopy(instance)
+                # only the dry run shows the changes
+                diff = Diff(resource, original, new) if dry_run else None
+                if resource.for_delete(row, instance):
+                    if new:
+                        row_result.import_type = row_result.IMPORT_TYPE_SKIP
+                    else:
+                        row_result.import_type = row_result.IMPORT_TYPE_DELETE
+                        deletes.append(instance)
+                else:
+                    compared = instance
+                    resource.import_obj(instance, row, dry_run)
+                    if resource.skip_row(instance, original):
+                        row_result.import_type = row_result.IMPORT_TYPE_SKIP
+                    elif id(instance) in created:
+                        # the new instance of a previous row of the batch,
+                        # written with the changes of this row
+                        row_result.import_type = row_result.IMPORT_TYPE_UPDATE
+                        row_result.new_record = False
+                    elif new:
+                        creates.append(instance)
+                        created.add(id(instance))
+                        loader.add(row, instance)
+                    elif self.has_changed(instance, original):
+                        updates.append(instance)
+            except Exception as e:
+                row_result.import_type = row_result.IMPORT_TYPE_ERROR
+                logger.exception(e)
+                row_result.errors.append(resource.get_error_result_class()(e, traceback.format_exc(), row))
+            row_results.append(row_result)
+            instances.append(instance)
+            diffs.append((diff, compared))
+
+        if not using_transactions and dry_run:
+            # nothing is written without a transaction to roll back
+            pass
+        else:
+            try:
+                with atomic_if_using_transaction(using_transactions):
+                    self.write(creates, updates, deletes, using_transactions, dry_run)
+            except Exception as e:
+                logger.info('Bulk write of the import failed (%s), importing the rows one by one', e)
+                loader.load(rows)
+                return self.import_rows(rows, loader, using_transactions, dry_run, **kwargs)
+
+        for row, row_result, instance, (diff, compared) in zip(rows, row_results, instances, diffs):
+            if row_result.import_type == row_result.IMPORT_TYPE_ERROR:
+                continue
+            if diff is not None:
+                # with the keys of the new instances
+                diff.compare_with(resource, compared, dry_run)
+                row_result.diff = diff.as_html()
+            if row_result.import_type != row_result.IMPORT_TYPE_SKIP:
+                row_result.object_id = instance.pk
+                row_result.object_repr = force_text(instance)
+            resource.after_import_row(row, row_result, **kwargs)
+        return row_results
+
+    def write(self, creates, updates, deletes, using_transactions, dry_run):
+        manager = self.model._default_manager
+        for instance in deletes:
+            self.resource.delete_instance(instance, using_transactions, dry_run)
+        if creates:
+            features = connections[manager.db].features
+            if self.need_ids and not getattr(features, 'can_return_ids_from_bulk_insert',
+                                             getattr(features, 'can_return_rows_from_bulk_insert', False)):
+                # the keys of the instances are needed for the results
+                for instance in [i for i in creates if i.pk is None]:
+                    instance.save()
+                creates = [i for i in creates if i._state.adding]
+            manager.bulk_create(creates, batch_size=self.batch_size)
+            for instance in creates:
+                instance._state.adding = False
+        if updates:
+            for field in self.update_fields:
+                if getattr(field, 'auto_now', False):
+                    for instance in updates:
+                        field.pre_save(instance, False)
+            bulk_update(self.model, updates, self.update_fields, self.batch_size)
+        if creates or updates:
+            # they don't send the save signals
+            bump_model_generation(self.model)
 
 
 class ImportMenuPlugin(BaseAdminPlugin):
@@ -97,12 +612,23 @@ class ImportBaseView(ModelAdminView):
     import_template_name = 'xadmin/import_export/import.html'
     #: resource class
     #: available import formats
-    formats = DEFAULT_FORMATS
+    formats = DEFAULT_FORMATS + (NDJSON,)
     #: import data encoding
     from_encoding = "utf-8"
     skip_admin_log = None
     # storage class for saving temporary files
     tmp_storage_class = None
+    # rows imported, read and written at once
+    import_batch_size = getattr(settings, 'XADMIN_IMPORT_BATCH_SIZE', 500)
+    # seconds the file read by the dry run is kept for the import
+    import_cache_timeout = getattr(settings, 'XADMIN_IMPORT_CACHE_TIMEOUT', 3600)
+    # rows checked by the dry run of the files imported as they are read
+    import_preview_rows = getattr(settings, 'XADMIN_IMPORT_PREVIEW_ROWS', 1000)
+    # processes which check the rows of the import jobs run by the worker
+    # command, before they are imported
+    import_workers = getattr(settings, 'XADMIN_IMPORT_WORKERS', 0)
+    # rows of the files which are imported in the background
+    import_background_rows = getattr(settings, 'XADMIN_IMPORT_BACKGROUND_ROWS', 50000)
 
     def get_skip_admin_log(self):
         if self.skip_admin_log is None:
@@ -151,6 +677,222 @@ class ImportBaseView(ModelAdminView):
         """
         return [f for f in self.formats if f().can_import()]
 
+    def save_import_file(self, import_file, input_format, tmp_storage):
+        if isinstance(tmp_storage, TempFolderStorage):
+            with tmp_storage.open('wb') as output:
+                for chunk in import_file.chunks():
+                    output.write(chunk)
+        else:
+            tmp_storage.save(b''.join(import_file.chunks()), input_format.get_read_mode())
+
+    def can_stream_import(self, resource, input_format, tmp_storage):
+        """
+        Whether the rows of the file are imported as they are read, instead of
+        reading the whole file in a dataset first.
+        """
+        if not self.import_batch_size or not isinstance(tmp_storage, TempFolderStorage):
+            return False
+        if not isinstance(input_format, (CSV, TSV, NDJSON)) and not (isinstance(input_format, XLSX) and openpyxl):
+            return False
+        # the hooks with the whole dataset
+        return not overrides(type(resource), ModelResource, ('import_data', 'before_import', 'after_import'))
+
+    def iter_file_rows(self, input_format, tmp_storage):
+        """
+        The rows of the file, the headers first.
+        """
+        encoding = self.from_encoding or 'utf-8'
+        with open(tmp_storage.get_full_path(), 'rb') as f:
+            if isinstance(input_format, XLSX):
+                rows = iter_xlsx_rows(f)
+            elif isinstance(input_format, NDJSON):
+                rows = iter_ndjson_rows(codecs.getreader(encoding)(f))
+            elif six.PY2:
+                # the csv module reads bytes
+                rows = iter_csv_rows(f, '\t' if isinstance(input_format, TSV) else ',', encoding)
+            else:
+                rows = iter_csv_rows(io.TextIOWrapper(f, encoding=encoding, newline=''),
+                                     '\t' if isinstance(input_format, TSV) else ',')
+            for row in rows:
+                yield row
+
+    def iter_row_dicts(self, headers, rows):
+        for row in rows:
+            if len(row) != len(headers):
+                raise tablib.InvalidDimensions(_('The row %(row)s has %(count)s columns instead of %(headers)s.') % {
+                    'row': row, 'count': len(row), 'headers': len(headers)})
+            yield OrderedDict(zip(headers, row))
+
+    def read_preview_dataset(self, input_format, tmp_storage):
+        """
+        The first ``import_preview_rows`` rows of the file, and whether it has
+        more rows.
+        """
+        rows = self.iter_file_rows(input_format, tmp_storage)
+        headers = next(rows, None)
+        preview = list(islice(rows, self.import_preview_rows + 1))
+        rows.close()
+        dataset = tablib.Dataset(*preview[:self.import_preview_rows], headers=headers)
+        return dataset, len(preview) > self.import_preview_rows
+
+    def can_check_in_parallel(self, resource):
+        if self.import_workers < 2 or ProcessPoolExecutor is None or not hasattr(os, 'fork'):
+            return False
+        # the rows are cleaned without the resource
+        return not overrides(type(resource), ModelResource, ('init_instance', 'import_obj', 'import_field'))
+
+    def get_foreign_key_ids(self, resource, rows):
+        """
+        The keys of the instances related by the foreign keys of ``rows``,
+        read with one query for each field, by the values of the rows.
+        """
+        ids = {}
+        for field in resource.get_import_fields():
+            widget = field.widget
+            if not isinstance(widget, widgets.ForeignKeyWidget) or \
+                    overrides(type(widget), widgets.ForeignKeyWidget, ('clean', 'get_queryset')):
+                continue
+            opts = widget.model._meta
+            related = opts.pk if widget.field == 'pk' else opts.get_field(widget.field)
+            values = {}
+            for row in rows:
+                value = row.get(field.column_name)
+                try:
+                    if value and value not in values:
+                        values[value] = related.to_python(value)
+                except (TypeError, ValidationError):
+                    # an error of the row
+                    pass
+            keys = dict(widget.get_queryset(None, None).filter(
+                **{'%s__in' % widget.field: set(values.values())}).values_list(widget.field, 'pk'))
+            ids[field.column_name] = dict((value, keys[key]) for value, key in values.items() if key in keys)
+        return ids
+
+    def count_file_rows(self, input_format, tmp_storage):
+        rows = self.iter_file_rows(input_format, tmp_storage)
+        try:
+            return sum(1 for row in islice(rows, 1, None))
+        finally:
+            rows.close()
+
+    def check_file_rows(self, resource, input_format, tmp_storage):
+        """
+        Check the rows of the file in ``import_workers`` forked processes,
+        only out of the requests. Returns the ``(line, row, error,
+        traceback)`` of the rows with errors, in order.
+        """
+        rows = self.iter_file_rows(input_format, tmp_storage)
+        headers = next(rows, None) or []
+        try:
+            chunks = enumerate(self.iter_row_dicts(headers, rows), 2)
+            errors = []
+            token = uuid.uuid4().hex
+            _import_checks[token] = resource
+            try:
+                with _process_pool(self.import_workers) as pool:
+                    pending = deque()
+                    while True:
+                        chunk = list(islice(chunks, self.import_batch_size))
+                        if not chunk:
+                            break
+                        ids = self.get_foreign_key_ids(resource, [row for line, row in chunk])
+                        pending.append(pool.submit(_check_rows, token, chunk, ids))
+                        # the chunks waiting for a process are bounded
+                        if len(pending) >= self.import_workers * 2:
+                            errors.extend(pending.popleft().result())
+                    while pending:
+                        errors.extend(pending.popleft().result())
+            finally:
+                del _import_checks[token]
+            return errors
+        finally:
+            rows.close()
+
+    def add_check_errors(self, resource, result, errors):
+        # the other lines are placeholders, the errors keep their lines
+        checked = resource.get_row_result_class()()
+        for line, row, error, tb_info in errors:
+            while len(result.rows) < line - 1:
+                result.append_row_result(checked)
+            row_result = resource.get_row_result_class()()
+            row_result.import_type = RowResult.IMPORT_TYPE_ERROR
+            row_result.errors.append(resource.get_error_result_class()(error, tb_info, row))
+            result.increment_row_result_total(row_result)
+            result.append_row_result(row_result)
+
+    def get_import_rows_cache_key(self, tmp_storage):
+        return self.get_dataset_cache_key(tmp_storage) + '_rows'
+
+    @filter_hook
+    def import_file_rows(self, resource, input_format, tmp_storage, on_batch=None, **kwargs):
+        """
+        Import the rows of the file by batches, as they are read.
+        """
+        rows = self.iter_file_rows(input_format, tmp_storage)
+        headers = next(rows, None) or []
+        try:
+            bulk_import = BulkImport(resource, self.import_batch_size, need_ids=not self.get_skip_admin_log())
+            return bulk_import.import_data(
+                tablib.Dataset(headers=headers), rows=self.iter_row_dicts(headers, rows), dry_run=False,
+                raise_errors=False, on_batch=on_batch, **kwargs)
+        finally:
+            rows.close()
+
+    def get_import_message(self, result):
+        return str(_(u'Import finished')) + ' , ' + str(_(u'Add')) + ' : %d' % result.totals[
+            RowResult.IMPORT_TYPE_NEW] + ' , ' + str(_(u'Update')) + ' : %d' % result.totals[
+            RowResult.IMPORT_TYPE_UPDATE]
+
+    def log_import_rows(self, row_results):
+        logentry_map = {
+            RowResult.IMPORT_TYPE_NEW: ADDITION,
+            RowResult.IMPORT_TYPE_UPDATE: CHANGE,
+            RowResult.IMPORT_TYPE_DELETE: DELETION,
+        }
+        content_type_id = ContentType.objects.get_for_model(self.model).pk
+        for row in row_results:
+            if row.import_type != row.IMPORT_TYPE_ERROR and row.import_type != row.IMPORT_TYPE_SKIP:
+                LogEntry.objects.log_action(
+                    user_id=self.user.pk,
+                    content_type_id=content_type_id,
+                    object_id=row.object_id,
+                    object_repr=row.object_repr,
+                    action_flag=logentry_map[row.import_type],
+                    change_message="%s through import_export" % row.import_type,
+                )
+
+    def read_dataset(self, input_format, tmp_storage):
+        data = tmp_storage.read(input_format.get_read_mode())
+        if not input_format.is_binary() and self.from_encoding:
+            data = force_text(data, self.from_encoding)
+        return input_format.create_dataset(data)
+
+    def get_dataset_cache_key(self, tmp_storage):
+        return 'xadmin_import_%s' % hashlib.md5(
+            ('%s:%s' % (os.path.basename(tmp_storage.name), self.user.pk)).encode('utf-8')).hexdigest()
+
+    def cache_dataset(self, tmp_storage, dataset):
+        get_import_cache().set(self.get_dataset_cache_key(tmp_storage),
+                               {'headers': dataset.headers, 'rows': [tuple(row) for row in dataset]},
+                               self.import_cache_timeout)
+
+    def get_cached_dataset(self, tmp_storage):
+        cache_key = self.get_dataset_cache_key(tmp_storage)
+        cached = get_import_cache().get(cache_key)
+        if cached is None:
+            return None
+        get_import_cache().delete(cache_key)
+        return tablib.Dataset(*cached['rows'], headers=cached['headers'])
+
+    @filter_hook
+    def import_dataset(self, resource, dataset, dry_run, raise_errors, **kwargs):
+        if self.import_batch_size:
+            # the keys of the new rows are shown by the diffs of the dry run
+            need_ids = dry_run or not self.get_skip_admin_log()
+            return BulkImport(resource, self.import_batch_size, need_ids).import_data(
+                dataset, dry_run=dry_run, raise_errors=raise_errors, **kwargs)
+        return resource.import_data(dataset, dry_run=dry_run, raise_errors=raise_errors, **kwargs)
+
 
 class ImportView(ImportBaseView):
     def get_media(self):
@@ -211,32 +953,40 @@ class ImportView(ImportBaseView):
             # first always write the uploaded file to disk as it may be a
             # memory file or else based on settings upload handlers
             tmp_storage = self.get_tmp_storage_class()()
-            data = bytes()
-            for chunk in import_file.chunks():
-                data += chunk
+            self.save_import_file(import_file, input_format, tmp_storage)
 
-            tmp_storage.save(data, input_format.get_read_mode())
-
-            # then read the file, using the proper format-specific mode
-            # warning, big files may exceed memory
+            # then read the file, using the proper format-specific mode,
+            # only the first rows of the files imported as they are read
+            stream = self.can_stream_import(resource, input_format, tmp_storage)
             try:
-                data = tmp_storage.read(input_format.get_read_mode())
-                if not input_format.is_binary() and self.from_encoding:
-                    data = force_text(data, self.from_encoding)
-                dataset = input_format.create_dataset(data)
+                if stream:
+                    dataset, partial = self.read_preview_dataset(input_format, tmp_storage)
+                    # the other rows are only counted, they are checked by
+                    # their import
+                    count = self.count_file_rows(input_format, tmp_storage) if partial else len(dataset)
+                    context['preview_partial'] = partial
+                    context['import_rows'] = count
+                else:
+                    dataset = self.read_dataset(input_format, tmp_storage)
             except UnicodeDecodeError as e:
                 return HttpResponse(_(u"<h1>Imported file has a wrong encoding: %s</h1>" % e))
             except Exception as e:
                 return HttpResponse(_(u"<h1>%s encountered while trying to read file: %s</h1>" % (type(e).__name__,
                                                                                                   import_file.name)))
-            result = resource.import_data(dataset, dry_run=True,
-                                          raise_errors=False,
-                                          file_name=import_file.name,
-                                          user=request.user)
+            result = self.import_dataset(resource, dataset, dry_run=True,
+                                         raise_errors=False,
+                                         file_name=import_file.name,
+                                         user=request.user)
 
             context['result'] = result
 
             if not result.has_errors():
+                if stream:
+                    get_import_cache().set(self.get_import_rows_cache_key(tmp_storage), count,
+                                           self.import_cache_timeout)
+                else:
+                    # the import doesn't read the file again
+                    self.cache_dataset(tmp_storage, dataset)
                 context['confirm_form'] = ConfirmImportForm(initial={
                     'import_file_name': tmp_storage.name,
                     'original_file_name': import_file.name,
@@ -271,39 +1021,52 @@ class ImportProcessView(ImportBaseView):
                 int(confirm_form.cleaned_data['input_format'])
             ]()
             tmp_storage = self.get_tmp_storage_class()(name=confirm_form.cleaned_data['import_file_name'])
-            data = tmp_storage.read(input_format.get_read_mode())
-            if not input_format.is_binary() and self.from_encoding:
-                data = force_text(data, self.from_encoding)
-            dataset = input_format.create_dataset(data)
-
-            result = resource.import_data(dataset, dry_run=False,
-                                          raise_errors=True,
-                                          file_name=confirm_form.cleaned_data['original_file_name'],
-                                          user=request.user)
-
-            if not self.get_skip_admin_log():
-                # Add imported objects to LogEntry
-                logentry_map = {
-                    RowResult.IMPORT_TYPE_NEW: ADDITION,
-                    RowResult.IMPORT_TYPE_UPDATE: CHANGE,
-                    RowResult.IMPORT_TYPE_DELETE: DELETION,
-                }
-                content_type_id = ContentType.objects.get_for_model(self.model).pk
-                for row in result:
-                    if row.import_type != row.IMPORT_TYPE_ERROR and row.import_type != row.IMPORT_TYPE_SKIP:
-                        LogEntry.objects.log_action(
-                            user_id=request.user.pk,
-                            content_type_id=content_type_id,
-                            object_id=row.object_id,
-                            object_repr=row.object_repr,
-                            action_flag=logentry_map[row.import_type],
-                            change_message="%s through import_export" % row.import_type,
-                        )
-            success_message = str(_(u'Import finished')) + ' , ' + str(_(u'Add')) + ' : %d' % result.totals[
-                RowResult.IMPORT_TYPE_NEW] + ' , ' + str(_(u'Update')) + ' : %d' % result.totals[
-                RowResult.IMPORT_TYPE_UPDATE]
-
-            messages.success(request, success_message)
+            file_name = confirm_form.cleaned_data['original_file_name']
+
+            if self.can_stream_import(resource, input_format, tmp_storage):
+                count = get_import_cache().get(self.get_import_rows_cache_key(tmp_storage))
+                if self.import_background_rows and count and count > self.import_background_rows:
+                    job = ImportJob.objects.create(
+                        user=self.user, model=self.opts.label_lower, file=tmp_storage.name, file_name=file_name,
+                        input_format=confirm_form.cleaned_data['input_format'], total=count)
+                    submit_import_job(job)
+                    if self.has_model_perm(ImportJob, 'view'):
+                        self.message_user(_('The import runs in the background, follow it in your imports.'),
+                                          'success')
+                        return HttpResponseRedirect(self.get_model_url(ImportJob, 'changelist'))
+                    # the list of the imports needs its permission, the user
+                    # follows the job from its own page
+                    self.message_user(_('The import runs in the background, follow its <a href="%s">progress</a>.')
+                                      % self.get_admin_url('import_job', job.pk), 'success')
+                    return HttpResponseRedirect(self.model_admin_url('changelist'))
+
+                # the rows after the preview may not be checked yet, they are
+                # logged as their batches are imported
+                try:
+                    result = self.import_file_rows(
+                        resource, input_format, tmp_storage, file_name=file_name, user=request.user,
+                        on_batch=None if self.get_skip_admin_log() else self.log_import_rows)
+                except Exception as e:
+                    tmp_storage.remove()
+                    return HttpResponse(_(u"<h1>%s encountered while trying to read file: %s</h1>" % (
+                        type(e).__name__, file_name)))
+                if result.has_errors():
+                    tmp_storage.remove()
+                    return self.render_import_errors(resource, result)
+            else:
+                dataset = self.get_cached_dataset(tmp_storage)
+                if dataset is None:
+                    dataset = self.read_dataset(input_format, tmp_storage)
+
+                result = self.import_dataset(resource, dataset, dry_run=False,
+                                             raise_errors=True,
+                                             file_name=file_name,
+                                             user=request.user)
+
+                if not self.get_skip_admin_log():
+                    # Add imported objects to LogEntry
+                    self.log_import_rows(result)
+            messages.success(request, self.get_import_message(result))
             tmp_storage.remove()
 
             post_import.send(sender=None, model=self.model)
@@ -312,6 +1075,55 @@ class ImportProcessView(ImportBaseView):
                           current_app=self.admin_site.name)
             return HttpResponseRedirect(url)
 
+    def run_import_job(self, job, fork=False):
+        """
+        Import the file of ``job`` in one transaction, the imported rows are
+        counted in the cache. With ``fork``, the rows are first checked in
+        parallel processes when they can be. Returns the result of the import.
+        """
+        resource = self.get_import_resource_class()(**self.get_import_resource_kwargs(self.request))
+        input_format = self.get_import_formats()[int(job.input_format)]()
+        tmp_storage = self.get_tmp_storage_class()(name=job.file)
+        if fork and self.can_check_in_parallel(resource):
+            errors = self.check_file_rows(resource, input_format, tmp_storage)
+            if errors:
+                # nothing is imported
+                tmp_storage.remove()
+                result = resource.get_result_class()()
+                self.add_check_errors(resource, result, errors)
+                return result
+        cache = get_import_cache()
+        imported = [0]
+
+        def on_batch(row_results):
+            if not self.get_skip_admin_log():
+                self.log_import_rows(row_results)
+            imported[0] += len(row_results)
+            cache.set(job.get_progress_cache_key(), imported[0], self.import_cache_timeout)
+
+        try:
+            with transaction.atomic():
+                result = self.import_file_rows(resource, input_format, tmp_storage, file_name=job.file_name,
+                                               user=self.user, on_batch=on_batch)
+        finally:
+            tmp_storage.remove()
+            cache.delete(job.get_progress_cache_key())
+        if not result.has_errors():
+            post_import.send(sender=None, model=self.model)
+        return result
+
+    def render_import_errors(self, resource, result):
+        context = super(ImportProcessView, self).get_context()
+        context.update({
+            'title': _("Import") + ' ' + self.opts.verbose_name,
+            'form': ImportForm(self.get_import_formats()),
+            'opts': self.model._meta,
+            'fields': [f.column_name for f in resource.get_user_visible_fields()],
+            'result': result,
+        })
+        self.request.current_app = self.admin_site.name
+        return TemplateResponse(self.request, [self.import_template_name], context)
+
 
 class ExportMixin(object):
     #: resource class
@@ -453,8 +1265,134 @@ class ExportPlugin(ExportMixin, BaseAdminPlugin):
             return response
 
 
+class ImportJobError(Exception):
+    pass
+
+
+def _update_import_job(job, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    ImportJob.objects.filter(pk=job.pk).update(**fields)
+
+
+def import_job_file(job, admin_site=None, fork=False):
+    """
+    Import the file of ``job`` as its user with the import view of the
+    model, returns the view and the result of the import. The rows may be
+    checked in forked processes with ``fork``.
+    """
+    admin_site = admin_site or site
+    try:
+        model = apps.get_model(job.model)
+    except LookupError:
+        raise ImportJobError(_('The model %s does not exist.') % job.model)
+    if model not in admin_site._registry:
+        raise ImportJobError(_('The model %s is not registered.') % job.model)
+    request = HttpRequest()
+    request.method = 'POST'
+    request.user = job.user
+    request.session = {}
+    request._messages = CookieStorage(request)
+    request.xadmin_job = job
+    view = admin_site.get_view_class(ImportProcessView, admin_site._registry[model])(request)
+    if not (view.has_change_permission() and view.has_add_permission()):
+        raise ImportJobError(_('You may not import %s.') % job.model)
+    return view, view.run_import_job(job, fork)
+
+
+def run_import_job(job_id, admin_site=None, fork=False):
+    """
+    Run the pending job ``job_id``, unless another worker took it first.
+    """
+    if not ImportJob.objects.filter(pk=job_id, status='pending').update(status='running', started=timezone.now()):
+        return
+    job = ImportJob.objects.select_related('user').get(pk=job_id)
+    try:
+        view, result = import_job_file(job, admin_site, fork)
+        if result.has_errors():
+            errors = [force_text(e.error) for e in result.base_errors]
+            errors += ['%s %s: %s' % (_('Line number'), line, force_text(e.error))
+                       for line, row_errors in result.row_errors() for e in row_errors]
+            raise ImportJobError('\n'.join(errors[:10]))
+    except Exception as e:
+        logger.exception('The import job %s failed', job.pk)
+        _update_import_job(job, status='failed', error=force_text(e) or e.__class__.__name__,
+                           finished=timezone.now())
+        return
+    _update_import_job(job, status='done', progress=result.total_rows, result=view.get_import_message(result),
+                       finished=timezone.now())
+
+
+def run_pending_import_jobs(admin_site=None, fork=False):
+    """
+    Run the pending jobs in turn, returns the number of jobs run.
+    """
+    count = 0
+    for job_id in ImportJob.objects.filter(status='pending').order_by('created').values_list('pk', flat=True):
+        run_import_job(job_id, admin_site, fork)
+        count += 1
+    return count
+
+
+def delete_import_file(sender, instance, **kwargs):
+    # the jobs which are run remove their file
+    if instance.status == 'pending':
+        try:
+            TMP_STORAGE_CLASS(name=instance.file).remove()
+        except (IOError, OSError):
+            logger.warning('The file %s of the import job %s could not be deleted', instance.file, instance.pk)
+
+post_delete.connect(delete_import_file, sender=ImportJob)
+
+_import_pool = None
+
+
+def submit_import_job(job):
+    """
+    Hand ``job`` to the threads of the process once it's committed, the
+    ``xadmin_import_worker`` command finds the pending jobs itself.
+    """
+    global _import_pool
+    if IMPORT_JOB_RUNNER != 'thread':
+        return
+    if _import_pool is None:
+        _import_pool = JobPool(IMPORT_JOB_WORKERS, run_import_job, 'xadmin-import')
+    transaction.on_commit(lambda: _import_pool.submit(job.pk))
+
+
+class ImportJobView(BaseAdminView):
+    """
+    The progress of an import job, as json.
+    """
+
+    @never_cache
+    def get(self, request, job_id):
+        try:
+            job = ImportJob.objects.get(pk=job_id)
+        except ImportJob.DoesNotExist:
+            raise Http404
+        if job.user_id != self.user.pk and not self.user.is_superuser:
+            raise Http404
+        progress = job.get_progress()
+        percent = None
+        if job.status == 'done':
+            percent = 100
+        elif job.total:
+            percent = min(100, progress * 100 // job.total)
+        return self.render_response({
+            'id': job.pk,
+            'status': job.status,
+            'progress': progress,
+            'total': job.total,
+            'percent': percent,
+            'result': job.result,
+            'error': job.error,
+        })
+
+
 site.register_modelview(r'^import/$', ImportView, name='%s_%s_import')
 site.register_modelview(r'^process_import/$', ImportProcessView, name='%s_%s_process_import')
+site.register_view(r'^import_jobs/(\d+)/$', ImportJobView, name='import_job')
 site.register_plugin(ImportMenuPlugin, ListAdminView)
 site.register_plugin(ExportMenuPlugin, ListAdminView)
 site.register_plugin(ExportPlugin, ListAdminView)
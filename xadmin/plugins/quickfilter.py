@@ -8,6 +8,7 @@ from django.utils import six
 from django.utils.translation import ugettext_lazy as _
 from xadmin.filters import manager,MultiSelectFieldListFilter
 from xadmin.plugins.filters import *
+from xadmin.plugins.filters import FilterPlugin, filter_by_spec
 from xadmin.util import is_related_field
 
 @manager.register
@@ -26,6 +27,8 @@ class QuickFilterPlugin(BaseAdminPlugin):
     quickfilter = {} 
     search_fields = ()
     free_query_filter = True
+    # Show the number of rows of each filter choice
+    list_filter_counts = False
     
     def init_request(self, *args, **kwargs):
         menu_style_accordian = hasattr(self.admin_view,'menu_style') and self.admin_view.menu_style == 'accordion'
@@ -81,11 +84,13 @@ class QuickFilterPlugin(BaseAdminPlugin):
         return clean_lookup in self.list_quick_filter
  
     def get_list_queryset(self, queryset):
+        # the list before the filters, the list filters are applied after
+        # the quick filters
+        self.base_queryset = queryset
         lookup_params = dict([(smart_str(k)[len(FILTER_PREFIX):], v) for k, v in self.admin_view.params.items() if smart_str(k).startswith(FILTER_PREFIX) and v != ''])
         for p_key, p_val in iteritems(lookup_params):
             if p_val == "False":
                 lookup_params[p_key] = False
-        use_distinct = False
         
         if not hasattr(self.admin_view,'quickfilter'):
             self.admin_view.quickfilter = {}
@@ -133,11 +138,9 @@ class QuickFilterPlugin(BaseAdminPlugin):
                 if len(field_parts)>1:
                     spec.title = "%s %s"%(field_parts[-2].name,spec.title) 
                  
-                # Check if we need to use distinct()
-                use_distinct = True#(use_distinct orlookup_needs_distinct(self.opts, field_path))
                 if spec and spec.has_output():
                     try:
-                        new_qs = spec.do_filte(queryset)
+                        new_qs = filter_by_spec(spec, queryset)
                     except ValidationError as e:
                         new_qs = None
                         self.admin_view.message_user(_("<b>Filtering error:</b> %s") % e.messages[0], 'error')
@@ -152,12 +155,41 @@ class QuickFilterPlugin(BaseAdminPlugin):
         if six.PY3:
             obj = list(obj)
         self.admin_view.quickfilter['used_filter_num'] = len(obj)
- 
-        if use_distinct:
-            return queryset.distinct()
-        else:
-            return queryset
+
+        return queryset
     
+    def get_context(self, context):
+        if self.list_filter_counts:
+            self.load_facet_counts(self.admin_view.list_queryset)
+        return context
+
+    def load_facet_counts(self, queryset):
+        """
+        Count the rows of each choice in the list, a used filter as if it
+        wasn't used.
+        """
+        filter_plugins = [p for p in self.admin_view.plugins
+                          if isinstance(p, FilterPlugin) and hasattr(p, 'lookup_params')]
+        for spec in self.filter_specs:
+            facet_queryset = queryset
+            if spec.is_used and filter_plugins:
+                # the list filters also apply the params of the quick filters
+                plugin = filter_plugins[0]
+                facet_queryset = plugin.get_facet_queryset(self.base_queryset, plugin.lookup_params,
+                                                           plugin.search_query, spec.used_params)
+            elif spec.is_used:
+                facet_queryset = self.base_queryset
+                for other in self.filter_specs:
+                    if other is spec:
+                        continue
+                    try:
+                        new_qs = filter_by_spec(other, facet_queryset)
+                    except ValidationError:
+                        new_qs = None
+                    if new_qs is not None:
+                        facet_queryset = new_qs
+            spec.load_facet_counts(facet_queryset)
+
     def block_left_navbar(self, context, nodes):
         nodes.append(loader.render_to_string('xadmin/blocks/modal_list.left_navbar.quickfilter.html',
                                              get_context_dict(context)))
@@ -0,0 +1,287 @@
+"""
+Search backends of the ``search_fields`` option of the list view.
+
+The backend is chosen with the ``search_backend`` option of the model admin,
+or the ``XADMIN_SEARCH_BACKEND`` setting, as a class or a dotted path::
+
+    class HostAdmin(object):
+        search_fields = ('name', 'description', 'idc__name')
+        search_backend = 'xadmin.search.PostgresSearchBackend'
+
+Backends with an index are built by the ``xadmin_search_index`` command.
+"""
+from __future__ import absolute_import
+import operator
+from functools import reduce
+
+from django.conf import settings
+from django.contrib.admin.utils import lookup_needs_distinct
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+from django.utils import six
+from django.utils.module_loading import import_string
+
+from xadmin.util import pk_in_subquery
+
+
+def construct_search(field_name):
+    if field_name.startswith('^'):
+        return "%s__istartswith" % field_name[1:]
+    elif field_name.startswith('='):
+        return "%s__iexact" % field_name[1:]
+    elif field_name.startswith('@'):
+        return "%s__search" % field_name[1:]
+    else:
+        return "%s__icontains" % field_name
+
+
+class RawSubquery(RawSQL):
+    """
+    Raw sql select for the ``in`` lookup, ``RawSQL`` adds parentheses which
+    make sqlite compare with the first row only.
+    """
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def get_search_backend(backend=None):
+    backend = backend or getattr(settings, 'XADMIN_SEARCH_BACKEND', ORMSearchBackend)
+    if isinstance(backend, six.string_types):
+        backend = import_string(backend)
+    return backend
+
+
+class BaseSearchBackend(object):
+    """
+    Filters a queryset of ``model`` by the words of a search query. When asked
+    to rank, a backend annotates the rows with ``search_rank`` and orders them
+    by it.
+    """
+
+    def __init__(self, model, search_fields):
+        self.model = model
+        self.search_fields = [str(f) for f in search_fields]
+        self.field_names = [f.lstrip('^=@') for f in self.search_fields]
+
+    def get_local_fields(self):
+        """
+        Return the text fields of ``model`` in ``search_fields``, the fields
+        through a relation can't be indexed with the model table.
+        """
+        fields = []
+        for name in self.field_names:
+            if '__' in name:
+                continue
+            field = self.model._meta.get_field(name)
+            if isinstance(field, (models.CharField, models.TextField)):
+                fields.append(field)
+        return fields
+
+    def is_multi_valued(self, field_name):
+        return lookup_needs_distinct(self.model._meta, field_name)
+
+    def orm_condition(self, search_fields, bit):
+        """
+        Return a ``Q`` of the rows with ``bit`` in one of ``search_fields``.
+        The lookups of many to many or reverse foreign key paths are matched
+        in one subquery, so the rows aren't duplicated by their joins.
+        """
+        orm_lookups = [construct_search(search_field) for search_field in search_fields]
+        or_queries = [models.Q(**{orm_lookup: bit}) for orm_lookup in orm_lookups
+                      if not self.is_multi_valued(orm_lookup)]
+        multi_valued = [models.Q(**{orm_lookup: bit}) for orm_lookup in orm_lookups
+                        if self.is_multi_valued(orm_lookup)]
+        if multi_valued:
+            or_queries.append(pk_in_subquery(self.model, reduce(operator.or_, multi_valued)))
+        return reduce(operator.or_, or_queries)
+
+    def search(self, queryset, query, rank=False):
+        raise NotImplementedError
+
+    def needs_distinct(self):
+        """
+        Return True if the rows matched by ``search`` may be duplicated.
+        """
+        return False
+
+    def build_index(self, using, refresh=False):
+        """
+        Create the index of the backend, or only refresh its content. Returns
+        False when the backend doesn't use an index.
+        """
+        return False
+
+    def order_by_rank(self, queryset, descending=True):
+        return queryset.order_by('-search_rank' if descending else 'search_rank', *queryset.query.order_by)
+
+
+class ORMSearchBackend(BaseSearchBackend):
+    """
+    ``icontains`` lookups of every word on every field, the default.
+    """
+
+    def search(self, queryset, query, rank=False):
+        for bit in query.split():
+            queryset = queryset.filter(self.orm_condition(self.search_fields, bit))
+        return queryset
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    PostgreSQL full text search ranked by ``ts_rank``, local text fields also
+    match words by trigram similarity. The index is built over the local text
+    fields, the fields through a relation are matched in a subquery. Needs ``django.contrib.postgres`` in
+    ``INSTALLED_APPS``, the ``pg_trgm`` extension is created with the index.
+    """
+    config = getattr(settings, 'XADMIN_SEARCH_CONFIG', 'simple')
+    trigram = True
+
+    def get_vector(self, field_names):
+        from django.contrib.postgres.search import SearchVector
+        return SearchVector(*field_names, config=self.config)
+
+    def search(self, queryset, query, rank=False):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        # only the vector of the local fields is the expression of the index,
+        # the fields through a relation are matched in a subquery
+        local_names = [f.name for f in self.get_local_fields()]
+        related_names = [name for name in self.field_names if name not in local_names]
+        if local_names:
+            queryset = queryset.annotate(xadmin_search_vector=self.get_vector(local_names))
+
+        # every word is matched by itself, as the words may be in different fields
+        conditions = []
+        for bit in query.split():
+            bit_query = SearchQuery(bit, config=self.config)
+            condition = models.Q()
+            if local_names:
+                condition |= models.Q(xadmin_search_vector=bit_query)
+            if related_names:
+                condition |= models.Q(pk__in=self.model._base_manager.annotate(
+                    xadmin_search_vector=self.get_vector(related_names)).filter(
+                    xadmin_search_vector=bit_query).values('pk'))
+            conditions.append(condition)
+        if not conditions:
+            return queryset
+        condition = reduce(operator.and_, conditions)
+        if self.trigram:
+            for name in local_names:
+                condition |= models.Q(**{'%s__trigram_similar' % name: query})
+        queryset = queryset.filter(condition)
+        if rank and local_names:
+            queryset = self.order_by_rank(queryset.annotate(
+                search_rank=SearchRank(self.get_vector(local_names), SearchQuery(query, config=self.config))))
+        return queryset
+
+    def get_index_name(self, suffix):
+        return 'xadmin_search_%s_%s' % (self.model._meta.db_table, suffix)
+
+    def build_index(self, using, refresh=False):
+        from django.contrib.postgres.search import SearchVector
+
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        table = self.model._meta.db_table
+        fields = self.get_local_fields()
+        names = [self.get_index_name('fts')]
+        if self.trigram:
+            names.extend(self.get_index_name(f.column) for f in fields)
+
+        with connection.cursor() as cursor:
+            if refresh:
+                for name in names:
+                    cursor.execute('REINDEX INDEX %s' % qn(name))
+                return True
+
+            # the index expression is the vector of the search query, so the
+            # planner can use it
+            query = self.model._default_manager.using(using).annotate(
+                vector=SearchVector(*[f.name for f in fields], config=self.config)).query
+            sql, params = query.get_compiler(using).compile(query.annotations['vector'])
+            sql = sql.replace('%s.' % qn(table), '')
+            cursor.execute('CREATE INDEX IF NOT EXISTS %s ON %s USING GIN ((%s))' % (
+                qn(names[0]), qn(table), sql), params)
+            if self.trigram:
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+                for name, field in zip(names[1:], fields):
+                    cursor.execute('CREATE INDEX IF NOT EXISTS %s ON %s USING GIN (%s gin_trgm_ops)' % (
+                        qn(name), qn(table), qn(field.column)))
+        return True
+
+
+class SQLiteFTS5SearchBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 search ranked by ``bm25``, for local testing. The local text
+    fields are copied to a shadow table kept up to date by triggers, the fields
+    through a relation are searched with ``icontains``. Until the shadow table
+    is built by ``xadmin_search_index``, the search is the one of the ORM
+    backend.
+    """
+
+    def get_table_name(self):
+        return 'xadmin_fts_%s' % self.model._meta.db_table
+
+    def match_query(self, query):
+        # every word is a quoted prefix query
+        return ' '.join('"%s"*' % bit.replace('"', '""') for bit in query.split())
+
+    def has_index(self, using):
+        connection = connections[using]
+        with connection.cursor() as cursor:
+            return self.get_table_name() in connection.introspection.table_names(cursor)
+
+    def search(self, queryset, query, rank=False):
+        if not self.has_index(queryset.db):
+            # ``xadmin_search_index`` wasn't run for the model yet
+            return ORMSearchBackend(self.model, self.search_fields).search(queryset, query, rank)
+        qn = connections[queryset.db].ops.quote_name
+        fts_table = qn(self.get_table_name())
+        related_fields = [search_field for search_field in self.search_fields
+                          if '__' in search_field.lstrip('^=@')]
+
+        for bit in query.split():
+            condition = models.Q(pk__in=RawSubquery(
+                'SELECT rowid FROM %s WHERE %s MATCH %%s' % (fts_table, fts_table), [self.match_query(bit)]))
+            if related_fields:
+                condition |= self.orm_condition(related_fields, bit)
+            queryset = queryset.filter(condition)
+
+        if rank:
+            queryset = self.order_by_rank(queryset.annotate(search_rank=RawSQL(
+                'SELECT bm25(%s) FROM %s WHERE %s MATCH %%s AND rowid = %s.%s' % (
+                    fts_table, fts_table, fts_table, qn(self.model._meta.db_table), qn(self.model._meta.pk.column)),
+                [self.match_query(query)])), descending=False)
+        return queryset
+
+    def build_index(self, using, refresh=False):
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        fts_table = qn(self.get_table_name())
+
+        with connection.cursor() as cursor:
+            if not refresh:
+                table = qn(self.model._meta.db_table)
+                pk = qn(self.model._meta.pk.column)
+                columns = [qn(f.column) for f in self.get_local_fields()]
+                new_values = ', '.join('new.%s' % c for c in columns)
+                old_values = ', '.join('old.%s' % c for c in columns)
+                cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content=%s, content_rowid=%s)" % (
+                    fts_table, ', '.join(columns), table, pk))
+                cursor.execute("CREATE TRIGGER IF NOT EXISTS %s AFTER INSERT ON %s BEGIN "
+                               "INSERT INTO %s(rowid, %s) VALUES (new.%s, %s); END" % (
+                                   qn(self.get_table_name() + '_ai'), table,
+                                   fts_table, ', '.join(columns), pk, new_values))
+                cursor.execute("CREATE TRIGGER IF NOT EXISTS %s AFTER DELETE ON %s BEGIN "
+                               "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.%s, %s); END" % (
+                                   qn(self.get_table_name() + '_ad'), table,
+                                   fts_table, fts_table, ', '.join(columns), pk, old_values))
+                cursor.execute("CREATE TRIGGER IF NOT EXISTS %s AFTER UPDATE ON %s BEGIN "
+                               "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.%s, %s); "
+                               "INSERT INTO %s(rowid, %s) VALUES (new.%s, %s); END" % (
+                                   qn(self.get_table_name() + '_au'), table,
+                                   fts_table, fts_table, ', '.join(columns), pk, old_values,
+                                   fts_table, ', '.join(columns), pk, new_values))
+            cursor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (fts_table, fts_table))
+        return True
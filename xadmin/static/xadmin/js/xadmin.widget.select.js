@@ -6,6 +6,34 @@
         f.find('.select-search').each(function(){
             var $el = $(this);
             var preload = $el.hasClass('select-preload');
+            // the choices come a page at a time, the next page is loaded when
+            // the dropdown is scrolled to its end
+            var page = 0, has_more = false, loading = false, last_query = '';
+            var load_page = function(query, p, callback) {
+                loading = true;
+                $.ajax({
+                    url: $el.data('search-url')+$el.data('choices'),
+                    dataType: 'json',
+                    data: {
+                        '_q_' : query,
+                        '_cols': 'id.__str__',
+                        'p': p
+                    },
+                    type: 'GET',
+                    error: function() {
+                        loading = false;
+                        has_more = false;
+                        callback();
+                    },
+                    success: function(res) {
+                        loading = false;
+                        page = p;
+                        last_query = query;
+                        has_more = !!res.has_more;
+                        callback(res.objects);
+                    }
+                });
+            };
             $el.selectize({
                 valueField: 'id',
                 labelField: '__str__',
@@ -15,24 +43,23 @@
                 preload: preload,
                 load: function(query, callback) {
                     if(!preload && !query.length) return callback();
-                    $.ajax({
-                        url: $el.data('search-url')+$el.data('choices'),
-                        dataType: 'json',
-                        data: {
-                            '_q_' : query,
-                            '_cols': 'id.__str__'
-                        },
-                        type: 'GET',
-                        error: function() {
-                            callback();
-                        },
-                        success: function(res) {
-                            callback(res.objects);
-                        }
+                    load_page(query, 0, callback);
+                },
+                onInitialize: function() {
+                    var selectize = this;
+                    selectize.$dropdown_content.on('scroll', function(){
+                        var $content = $(this);
+                        if(!has_more || loading || $content.scrollTop() + $content.innerHeight() < this.scrollHeight - 20) return;
+                        load_page(last_query, page + 1, function(objects){
+                            if(!objects) return;
+                            var scroll = $content.scrollTop();
+                            selectize.addOption(objects);
+                            selectize.refreshOptions(false);
+                            $content.scrollTop(scroll);
+                        });
                     });
                 }
             });
         })
     }});
 })(jQuery)
-
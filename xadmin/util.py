@@ -1,6 +1,6 @@
 from __future__ import absolute_import
 import django
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, models
 from django.db.models.sql.query import LOOKUP_SEP
 from django.db.models.deletion import Collector
 from django.db.models.fields.related import ForeignObjectRel
@@ -10,6 +10,7 @@ from django.utils.html import escape
 from django.utils.safestring import mark_safe
 from django.utils.text import capfirst
 from django.utils.encoding import force_text, smart_text, smart_str
+from django.utils.http import urlencode
 from django.utils.translation import ungettext
 from django.core.urlresolvers import reverse
 from django.conf import settings
@@ -19,6 +20,13 @@ from django.contrib.admin.utils import label_for_field, help_text_for_field
 from django import VERSION as version
 import datetime
 import decimal
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.db import close_old_connections
+from django.utils.six.moves import queue
 
 if 'django.contrib.staticfiles' in settings.INSTALLED_APPS:
     from django.contrib.staticfiles.templatetags.staticfiles import static
@@ -477,9 +485,206 @@ def sortkeypicker(keynames):
     return getit
 
 
+def pk_in_subquery(model, *args, **kwargs):
+    """
+    Return a ``Q`` of the rows of ``model`` matching the filter arguments,
+    as a ``pk__in`` subquery. The joins of many to many or reverse foreign key
+    lookups stay in the subquery, so they don't duplicate the rows of the
+    outer query and it needs no ``distinct()``.
+    """
+    return models.Q(pk__in=model._base_manager.filter(*args, **kwargs).values('pk'))
+
+
+def queryset_iterator(queryset, chunk_size=2000):
+    """
+    Iterate a queryset without caching its results, on the databases which
+    support it the rows are read with a server side cursor.
+    """
+    if django.VERSION >= (2, 0):
+        return queryset.iterator(chunk_size=chunk_size)
+    return queryset.iterator()
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+def is_timeout_error(connection, error):
+    cause = getattr(error, '__cause__', None)
+    if connection.vendor == 'postgresql':
+        # query_canceled
+        return getattr(cause, 'pgcode', None) == '57014'
+    elif connection.vendor == 'mysql':
+        # ER_QUERY_TIMEOUT, ER_QUERY_INTERRUPTED
+        return bool(error.args) and error.args[0] in (3024, 1317)
+    elif connection.vendor == 'sqlite':
+        return 'interrupted' in str(error)
+    return False
+
+
+@contextmanager
+def query_timeout(seconds, using=DEFAULT_DB_ALIAS):
+    """
+    Cancel the queries run in the block on the ``using`` database after
+    ``seconds``, they raise ``QueryTimeout``. PostgreSQL and MySQL use their
+    statement timeout, SQLite interrupts the query from a progress handler.
+    Run the block in ``transaction.atomic()`` to go on using the connection
+    inside a transaction after a timeout.
+    """
+    if not seconds:
+        yield
+        return
+
+    connection = connections[using]
+    connection.ensure_connection()
+    restore = None
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            previous = cursor.fetchone()[0]
+            cursor.execute('SET statement_timeout = %s', [int(seconds * 1000)])
+
+        def restore_statement_timeout():
+            with connection.cursor() as cursor:
+                cursor.execute('SET statement_timeout = %s', [previous])
+        restore = restore_statement_timeout
+    elif connection.vendor == 'mysql':
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT @@SESSION.max_execution_time')
+                previous = cursor.fetchone()[0]
+                cursor.execute('SET SESSION max_execution_time = %s', [int(seconds * 1000)])
+        except DatabaseError:
+            # before MySQL 5.7.8
+            pass
+        else:
+            def restore_max_execution_time():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET SESSION max_execution_time = %s', [previous])
+            restore = restore_max_execution_time
+    elif connection.vendor == 'sqlite':
+        deadline = time.time() + seconds
+        connection.connection.set_progress_handler(lambda: time.time() > deadline, 1000)
+
+        def remove_progress_handler():
+            connection.connection.set_progress_handler(None, 1000)
+        restore = remove_progress_handler
+
+    try:
+        yield
+    except DatabaseError as e:
+        if is_timeout_error(connection, e):
+            six.raise_from(QueryTimeout(str(e)), e)
+        raise
+    finally:
+        if restore is not None:
+            try:
+                restore()
+            except DatabaseError:
+                # the transaction is aborted, its rollback resets the timeout
+                pass
+
+
+class QueryParams(object):
+    """
+    Immutable snapshot of the request GET parameters which builds derived
+    query strings. Every parameter is url encoded once, ``query_string`` only
+    encodes the keys in ``new_params`` and reuses the others.
+    """
+    __slots__ = ('_params', '_encoded', '_removed', '_strings')
+
+    def __init__(self, params):
+        self._params = OrderedDict(params)
+        self._encoded = OrderedDict((k, urlencode([(k, v)])) for k, v in self._params.items())
+        self._removed = {}
+        self._strings = {}
+
+    def _removed_keys(self, remove):
+        remove = tuple(remove or ())
+        keys = self._removed.get(remove)
+        if keys is None:
+            keys = self._removed[remove] = frozenset(
+                k for k in self._params if any(k.startswith(r) for r in remove))
+        return keys
+
+    def items(self, new_params=None, remove=None):
+        """
+        Return the ``(key, value)`` pairs with the ``remove`` prefixes dropped
+        and ``new_params`` applied, a ``None`` value removes the key.
+        """
+        removed = self._removed_keys(remove)
+        new_params = new_params or {}
+        p = OrderedDict((k, v) for k, v in self._params.items() if k not in removed)
+        for k, v in new_params.items():
+            if v is None:
+                p.pop(k, None)
+            else:
+                p[k] = v
+        return list(p.items())
+
+    def query_string(self, new_params=None, remove=None):
+        removed = self._removed_keys(remove)
+        if not new_params:
+            qs = self._strings.get(removed)
+            if qs is None:
+                qs = self._strings[removed] = '?%s' % '&'.join(
+                    e for k, e in self._encoded.items() if k not in removed)
+            return qs
+
+        parts = []
+        for k, e in self._encoded.items():
+            if k in removed:
+                continue
+            if k in new_params:
+                v = new_params[k]
+                if v is not None:
+                    parts.append(urlencode([(k, v)]))
+            else:
+                parts.append(e)
+        for k, v in new_params.items():
+            if v is not None and (k not in self._encoded or k in removed):
+                parts.append(urlencode([(k, v)]))
+        return '?%s' % '&'.join(parts)
+
+
 def is_related_field(field):
     return isinstance(field, ForeignObjectRel)
 
 
 def is_related_field2(field):
     return (hasattr(field, 'rel') and field.rel != None) or is_related_field(field)
+
+
+class JobPool(object):
+    """
+    Threads of the web process which run the submitted jobs in turn with
+    ``run``, started with the first jobs.
+    """
+
+    def __init__(self, workers, run, name='xadmin-job'):
+        self.workers = workers
+        self.run = run
+        self.name = name
+        self.queue = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def submit(self, job_id):
+        with self.lock:
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.work, name='%s-%d' % (self.name, len(self.threads)))
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+        self.queue.put(job_id)
+
+    def work(self):
+        while True:
+            job_id = self.queue.get()
+            close_old_connections()
+            try:
+                self.run(job_id)
+            except Exception:
+                logging.getLogger('xadmin.jobs').exception('The job %s of %s failed', job_id, self.name)
+            finally:
+                connections.close_all()
@@ -20,7 +20,6 @@ from django.utils import six
 from django.utils.decorators import method_decorator, classonlymethod
 from django.utils.encoding import force_text, smart_text, smart_str
 from django.utils.functional import Promise
-from django.utils.http import urlencode
 from django.utils.itercompat import is_iterable
 from django.utils.safestring import mark_safe
 from django.utils.text import capfirst
@@ -28,7 +27,7 @@ from django.utils.translation import ugettext as _
 from django.views.decorators.csrf import csrf_protect
 from django.views.generic import View
 from collections import OrderedDict
-from xadmin.util import static, json, vendor, sortkeypicker
+from xadmin.util import static, json, vendor, sortkeypicker, QueryParams
 
 from xadmin.models import Log
 
@@ -151,44 +150,24 @@ class BaseAdminObject(object):
         user = user or self.user
         return user.has_perm(self.get_model_perm(model, name)) or (name == 'view' and self.has_model_perm(model, 'change', user))
 
+    def get_query_params(self):
+        """
+        Return the ``QueryParams`` of the request, it is shared by the view
+        and its plugins and built again only if ``request.GET`` is replaced.
+        """
+        cached = getattr(self.request, '_xadmin_query_params', None)
+        if cached is None or cached[0] is not self.request.GET:
+            cached = (self.request.GET, QueryParams(self.request.GET.items()))
+            self.request._xadmin_query_params = cached
+        return cached[1]
+
     def get_query_string(self, new_params=None, remove=None):
-        if new_params is None:
-            new_params = {}
-        if remove is None:
-            remove = []
-        p = dict(self.request.GET.items()).copy()
-        arr_keys = list(p.keys())
-        for r in remove:
-            for k in arr_keys:
-                if k.startswith(r):
-                    del p[k]
-        for k, v in new_params.items():
-            if v is None:
-                if k in p:
-                    del p[k]
-            else:
-                p[k] = v
-        return '?%s' % urlencode(p)
+        return self.get_query_params().query_string(new_params, remove)
 
     def get_form_params(self, new_params=None, remove=None):
-        if new_params is None:
-            new_params = {}
-        if remove is None:
-            remove = []
-        p = dict(self.request.GET.items()).copy()
-        arr_keys = list(p.keys())
-        for r in remove:
-            for k in arr_keys:
-                if k.startswith(r):
-                    del p[k]
-        for k, v in new_params.items():
-            if v is None:
-                if k in p:
-                    del p[k]
-            else:
-                p[k] = v
         return mark_safe(''.join(
-            '<input type="hidden" name="%s" value="%s"/>' % (k, v) for k, v in p.items() if v))
+            '<input type="hidden" name="%s" value="%s"/>' % (k, v)
+            for k, v in self.get_query_params().items(new_params, remove) if v))
 
     def render_response(self, content, response_type='json'):
         if response_type == 'json':
@@ -1,19 +1,24 @@
 from __future__ import absolute_import
 from collections import OrderedDict
+from contextlib import contextmanager
+from django.conf import settings
 from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
 from django.core.paginator import InvalidPage, Paginator
 from django.core.urlresolvers import NoReverseMatch
-from django.db import models
-from django.http import HttpResponseRedirect
+from django.db import models, router, transaction
+from django.http import HttpResponseRedirect, StreamingHttpResponse
+from django.template.loader import get_template, select_template
 from django.template.response import SimpleTemplateResponse, TemplateResponse
 from django.utils import six
-from django.utils.encoding import force_text, smart_text
+from django.utils.encoding import force_bytes, force_text, smart_text
 from django.utils.html import escape, conditional_escape
 from django.utils.safestring import mark_safe
 from django.utils.text import capfirst
 from django.utils.translation import ugettext as _
 
-from xadmin.util import lookup_field, display_for_field, label_for_field, boolean_icon
+from xadmin.templatetags.xadmin_tags import view_block
+from xadmin.util import lookup_field, display_for_field, display_for_value, label_for_field, boolean_icon, \
+    queryset_iterator, query_timeout, QueryTimeout
 
 from .base import ModelAdminView, filter_hook, inclusion_tag, csrf_protect_m
 
@@ -29,6 +34,11 @@ DOT = '.'
 
 # Text to display within change-list table cells if the value is blank.
 EMPTY_CHANGELIST_VALUE = _('Null')
+# Shared default text of every result cell.
+EMPTY_CELL_TEXT = '&nbsp;'
+
+# Placeholder of the result rows in a streamed change list page.
+RESULTS_STREAM_MARKER = '<!-- xadmin-stream-results -->'
 
 
 class FakeMethodField(object):
@@ -43,45 +53,81 @@ class FakeMethodField(object):
 
 
 class ResultRow(dict):
-    pass
+    __slots__ = ('cells', 'css_class', '__dict__')
+
+    def __init__(self, *args, **kwargs):
+        super(ResultRow, self).__init__(*args, **kwargs)
+        self.cells = []
+        self.css_class = None
+
+
+def _lazy_list(name):
+    """
+    Property of a list attribute which is only created when it is first used,
+    most cells never touch their classes, wraps, btns or menus.
+    """
+    def fget(self):
+        value = getattr(self, name)
+        if value is None:
+            value = []
+            setattr(self, name, value)
+        return value
+
+    def fset(self, value):
+        setattr(self, name, value)
+    return property(fget, fset)
 
 
 class ResultItem(object):
+    """
+    A cell of the result list. It uses ``__slots__`` and shared defaults to keep
+    big lists (show all, exports) small in memory, plugins can still set their
+    own attributes on it.
+    """
+    __slots__ = ('text', 'tag', 'allow_tags', 'is_display_link', 'row', 'field_name',
+                 'field', 'attr', 'value', 'export', 'field_label',
+                 '_classes', '_wraps', '_tag_attrs', '_btns', '_menus', '__dict__')
+
+    classes = _lazy_list('_classes')
+    wraps = _lazy_list('_wraps')
+    tag_attrs = _lazy_list('_tag_attrs')
+    btns = _lazy_list('_btns')
+    menus = _lazy_list('_menus')
 
     def __init__(self, field_name, row):
-        self.classes = []
-        self.text = '&nbsp;'
-        self.wraps = []
+        self._classes = self._wraps = self._tag_attrs = self._btns = self._menus = None
+        self.text = EMPTY_CELL_TEXT
         self.tag = 'td'
-        self.tag_attrs = []
         self.allow_tags = False
-        self.btns = []
-        self.menus = []
         self.is_display_link = False
         self.row = row
         self.field_name = field_name
         self.field = None
         self.attr = None
         self.value = None
+        self.export = False
+        self.field_label = ''
 
     @property
     def label(self):
         text = mark_safe(
             self.text) if self.allow_tags else conditional_escape(self.text)
         if force_text(text) == '':
-            text = mark_safe('&nbsp;')
-        for wrap in self.wraps:
+            text = mark_safe(EMPTY_CELL_TEXT)
+        for wrap in self._wraps or ():
             text = mark_safe(wrap % text)
         return text
 
     @property
     def tagattrs(self):
         return mark_safe(
-            '%s%s' % ((self.tag_attrs and ' '.join(self.tag_attrs) or ''),
-            (self.classes and (' class="%s"' % ' '.join(self.classes)) or '')))
+            '%s%s' % ((self._tag_attrs and ' '.join(self._tag_attrs) or ''),
+            (self._classes and (' class="%s"' % ' '.join(self._classes)) or '')))
 
 
 class ResultHeader(ResultItem):
+    __slots__ = ('sortable', 'sorted', 'ascending', 'sort_priority',
+                 'url_primary', 'url_remove', 'url_toggle')
 
     def __init__(self, field_name, row):
         super(ResultHeader, self).__init__(field_name, row)
@@ -97,6 +143,44 @@ class ResultHeader(ResultItem):
         self.url_toggle = None
 
 
+def render_result_rows(results, row_block=None):
+    """
+    Render the result table rows with plain string building. The markup and
+    escaping are the same as the ``results_grid_body`` block of
+    ``views/model_list.html``, ``row_block`` returns the html put after each row.
+    """
+    out = []
+    append = out.append
+    for row in results:
+        css_class = getattr(row, 'css_class', None)
+        # like the template, the keys of the row first, set by the plugins
+        tagattrs = row.get('tagattrs') if 'tagattrs' in row else getattr(row, 'tagattrs', u'')
+        append(u'<tr class="grid-item%s" %s>' % (
+            css_class and u' ' + conditional_escape(css_class) or u'',
+            conditional_escape(tagattrs)))
+        for o in row.cells:
+            append(u'<td %s>' % o.tagattrs)
+            if o._btns:
+                append(u'<div class="btn-group pull-right">%s</div>' % u''.join(map(force_text, o._btns)))
+            if o._menus:
+                append(u'<div class="dropdown"><a class="dropdown-toggle" data-toggle="dropdown" href="#">%s</a>'
+                       u'<ul class="dropdown-menu">%s</ul></div>' % (o.label, u''.join(map(force_text, o._menus))))
+            else:
+                append(force_text(o.label))
+            append(u'</td>')
+        append(u'</tr>')
+        if row_block is not None:
+            append(row_block(row))
+    return mark_safe(u''.join(out))
+
+
+def render_result_body(results, row_block=None):
+    """
+    Render the ``<tbody>`` of the result table, see ``render_result_rows``.
+    """
+    return mark_safe(u'<tbody>%s</tbody>' % render_result_rows(results, row_block))
+
+
 class ListAdminView(ModelAdminView):
     """
     Display models objects view. this class has ordering and simple filter features.
@@ -112,6 +196,14 @@ class ListAdminView(ModelAdminView):
     paginator_class = Paginator
     ordering = None
 
+    # Render the result table body in python when the list template isn't overridden
+    list_fast_render = True
+    # Stream the page when it shows more rows than list_stream_chunk_size
+    list_streaming = False
+    list_stream_chunk_size = 200
+    # Seconds after which the count and page queries are cancelled
+    query_timeout = getattr(settings, 'XADMIN_QUERY_TIMEOUT', None)
+
     # Change list templates
     object_list_template = None
 
@@ -127,6 +219,7 @@ class ListAdminView(ModelAdminView):
         self.lookup_opts = self.opts
         self.list_display = self.get_list_display()
         self.list_display_links = self.get_list_display_links()
+        self.list_expressions = self.get_list_expressions()
 
         # Get page number parameters from the query string.
         try:
@@ -135,6 +228,7 @@ class ListAdminView(ModelAdminView):
             self.page_num = 0
 
         # Get params from request
+        self.streaming = False
         self.show_all = ALL_VAR in request.GET
         self.to_field = request.GET.get(TO_FIELD_VAR)
         self.params = dict(request.GET.items())
@@ -166,15 +260,55 @@ class ListAdminView(ModelAdminView):
             # Use only the first item in list_display as link
             return list(self.list_display)[:1]
 
+    @filter_hook
+    def get_list_expressions(self):
+        """
+        Return a dict of the list_display columns declared as ORM expressions.
+        A column is an expression column when the admin method of that name has
+        an ``expression`` attribute, eg::
+
+            def host_count(self, obj):
+                return obj.host_count
+            host_count.short_description = "Hosts"
+            host_count.expression = Count('host', distinct=True)
+
+        These columns are annotated on the list queryset, so they can be sorted,
+        filtered, exported and aggregated like model fields.
+        """
+        expressions = OrderedDict()
+        for field_name in self.list_display:
+            if not isinstance(field_name, six.string_types):
+                continue
+            expression = getattr(getattr(self, field_name, None), 'expression', None)
+            if expression is not None:
+                expressions[field_name] = expression
+        return expressions
+
     def make_result_list(self):
         # Get search parameters from the query string.
         self.base_queryset = self.queryset()
         self.list_queryset = self.get_list_queryset()
         self.ordering_field_columns = self.get_ordering_field_columns()
         self.paginator = self.get_paginator()
+        self.result_timeout = False
 
         # Get the number of objects, with admin filters applied.
-        self.result_count = self.paginator.count
+        try:
+            with self.timeout_queries():
+                self.result_count = self.paginator.count
+        except QueryTimeout:
+            # page through the rows without the total, and keep the count
+            # unknown on the paginator so that it isn't run again
+            self.result_count = self.paginator.count = None
+
+        if self.result_count is None:
+            self.can_show_all = False
+            self.multi_page = True
+            offset = self.list_per_page * self.page_num
+            rows = self.load_result_list(self.list_queryset[offset:offset + self.list_per_page + 1])
+            self.result_list = list(rows)[:self.list_per_page]
+            self.has_more = len(rows) > self.list_per_page
+            return
 
         self.can_show_all = self.result_count <= self.list_max_show_all
         self.multi_page = self.result_count > self.list_per_page
@@ -182,6 +316,7 @@ class ListAdminView(ModelAdminView):
         # Get the list of objects to display on this page.
         if (self.show_all and self.can_show_all) or not self.multi_page:
             self.result_list = self.list_queryset._clone()
+            self.has_more = False
         else:
             try:
                 self.result_list = self.paginator.page(
@@ -192,8 +327,40 @@ class ListAdminView(ModelAdminView):
                         'title': _('Database error'),
                     })
                 return HttpResponseRedirect(self.request.path + '?' + ERROR_FLAG + '=1')
-        self.has_more = self.result_count > (
-            self.list_per_page * self.page_num + len(self.result_list))
+            # Don't use len(result_list), it would load the page before it is rendered
+            self.has_more = self.result_count > self.list_per_page * (self.page_num + 1)
+        if self.query_timeout:
+            self.result_list = self.load_result_list(self.result_list)
+
+    @contextmanager
+    def timeout_queries(self):
+        """
+        Cancel the queries of the block after ``query_timeout`` seconds, they
+        raise ``QueryTimeout``.
+        """
+        if not self.query_timeout:
+            yield
+            return
+        using = router.db_for_read(self.model)
+        # the savepoint keeps the transaction usable after a timeout
+        with query_timeout(self.query_timeout, using), transaction.atomic(using=using):
+            yield
+
+    def load_result_list(self, result_list):
+        """
+        Load the rows of the page in the query timeout. When they take too
+        long the page is empty and the user is asked to narrow the list.
+        """
+        try:
+            with self.timeout_queries():
+                len(result_list)
+        except QueryTimeout:
+            self.result_timeout = True
+            self.has_more = False
+            self.message_user(_('The list took too long to load, narrow it with the filters or the search.'),
+                              'error')
+            return self.list_queryset.none()
+        return result_list
 
     @filter_hook
     def get_result_list(self):
@@ -232,6 +399,11 @@ class ListAdminView(ModelAdminView):
             else:
                 pass
 
+        # Annotate the expression columns, the database computes them once for
+        # the whole page instead of a python method call per row.
+        if self.list_expressions:
+            queryset = queryset.annotate(**self.list_expressions)
+
         # Then, set queryset ordering.
         queryset = queryset.order_by(*self.get_ordering())
 
@@ -256,6 +428,8 @@ class ListAdminView(ModelAdminView):
         callable with the 'admin_order_field' attribute. Returns None if no
         proper model field name can be matched.
         """
+        if field_name in self.list_expressions:
+            return field_name
         try:
             field = self.opts.get_field(field_name)
             return field.name
@@ -382,12 +556,79 @@ class ListAdminView(ModelAdminView):
             'brand_icon': self.get_model_icon(self.model),
             'add_url': self.model_admin_url('add'),
             'result_headers': self.result_headers(),
-            'results': self.results()
+            'results': self.streaming and self.stream_results() or self.results(),
+            'fast_render_results': self.streaming or self.use_fast_render(),
         }
         context = super(ListAdminView, self).get_context()
         context.update(new_context)
         return context
 
+    @filter_hook
+    def use_fast_render(self):
+        """
+        Return True if the result table body can be built by ``render_result_body``,
+        that is when no template overrides the default change list template.
+        """
+        if not self.list_fast_render or self.object_list_template:
+            return False
+        template_names = self.get_template_list('views/model_list.html')
+        return getattr(select_template(template_names), 'origin', None) == \
+            getattr(get_template(template_names[-1]), 'origin', None)
+
+    @filter_hook
+    def use_streaming(self):
+        """
+        Return True if the page is streamed: the header is sent first, then the
+        result rows in chunks read with a server side cursor, then the footer.
+        """
+        if not self.list_streaming or not self.use_fast_render():
+            return False
+        # With a query timeout the page is loaded in the timeout
+        if self.query_timeout:
+            return False
+        # Plugins which work on the whole result list need every row at once
+        for p in self.plugins:
+            if callable(getattr(p, 'results', None)) or callable(getattr(p, 'get_response', None)):
+                return False
+        if (self.show_all and self.can_show_all) or not self.multi_page:
+            row_count = self.result_count
+        else:
+            row_count = self.list_per_page
+        return row_count > self.list_stream_chunk_size
+
+    def stream_results(self):
+        """
+        Yield the result rows in chunks of ``list_stream_chunk_size`` rows.
+        """
+        rows = []
+        for obj in queryset_iterator(self.result_list, self.list_stream_chunk_size):
+            rows.append(self.result_row(obj))
+            if len(rows) >= self.list_stream_chunk_size:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+    def get_stream_response(self, response, context):
+        """
+        Turn the rendered page into a ``StreamingHttpResponse`` which sends the
+        result rows in place of ``RESULTS_STREAM_MARKER``.
+        """
+        head, tail = response.render().content.split(force_bytes(RESULTS_STREAM_MARKER), 1)
+        row_block = self._stream_row_block
+
+        def content():
+            yield head
+            for rows in context['results']:
+                yield force_bytes(render_result_rows(rows, row_block))
+            yield tail
+
+        stream_response = StreamingHttpResponse(content(), content_type=response['Content-Type'])
+        for key, value in response.items():
+            stream_response[key] = value
+        stream_response.cookies = response.cookies
+        return stream_response
+
     @filter_hook
     def get_response(self, context, *args, **kwargs):
         pass
@@ -402,12 +643,18 @@ class ListAdminView(ModelAdminView):
         if response:
             return response
 
+        self.streaming = self.use_streaming()
         context = self.get_context()
         context.update(kwargs or {})
 
         response = self.get_response(context, *args, **kwargs)
-        return response or TemplateResponse(request, self.object_list_template or
-                                            self.get_template_list('views/model_list.html'), context)
+        if response:
+            return response
+        response = TemplateResponse(request, self.object_list_template or
+                                    self.get_template_list('views/model_list.html'), context)
+        if self.streaming:
+            return self.get_stream_response(response, context)
+        return response
 
     @filter_hook
     def post_response(self, *args, **kwargs):
@@ -429,7 +676,8 @@ class ListAdminView(ModelAdminView):
         elif i == self.page_num:
             return mark_safe(u'<span class="this-page">%d</span> ' % (i + 1))
         else:
-            return mark_safe(u'<a href="%s"%s>%d</a> ' % (escape(self.get_query_string({PAGE_VAR: i})), (i == self.paginator.num_pages - 1 and ' class="end"' or ''), i + 1))
+            is_end = self.result_count is not None and i == self.paginator.num_pages - 1
+            return mark_safe(u'<a href="%s"%s>%d</a> ' % (escape(self.get_query_string({PAGE_VAR: i})), (is_end and ' class="end"' or ''), i + 1))
 
     # Result List methods
     @filter_hook
@@ -442,7 +690,8 @@ class ListAdminView(ModelAdminView):
                                      )
         item.text = text
         item.attr = attr
-        if attr and not getattr(attr, "admin_order_field", None):
+        if attr and not getattr(attr, "admin_order_field", None) \
+                and field_name not in self.list_expressions:
             return item
 
         # OK, it is sortable if we got this far
@@ -531,7 +780,11 @@ class ListAdminView(ModelAdminView):
         """
         item = ResultItem(field_name, row)
         try:
-            f, attr, value = lookup_field(field_name, obj, self)
+            if field_name in self.list_expressions:
+                # Value is already annotated on the object by the list queryset
+                f, attr, value = None, getattr(self, field_name), getattr(obj, field_name)
+            else:
+                f, attr, value = lookup_field(field_name, obj, self)
         except (AttributeError, ObjectDoesNotExist, NoReverseMatch):
             item.text = mark_safe("<span class='text-muted'>%s</span>" % EMPTY_CHANGELIST_VALUE)
         else:
@@ -541,6 +794,8 @@ class ListAdminView(ModelAdminView):
                 if boolean:
                     item.allow_tags = True
                     item.text = boolean_icon(value)
+                elif field_name in self.list_expressions:
+                    item.text = display_for_value(value)
                 else:
                     item.text = smart_text(value)
             else:
@@ -610,6 +865,19 @@ class ListAdminView(ModelAdminView):
         return media
 
     # Blocks
+    def block_results_body(self, context, nodes):
+        row_block = None
+        if any(callable(getattr(view, 'block_result_row', None)) for view in [self] + self.plugins):
+            if self.streaming:
+                # rows are rendered after the template, keep a copy of its context
+                context = context.flatten()
+            row_block = lambda row: view_block(context, 'result_row', row)
+        if self.streaming:
+            self._stream_row_block = row_block
+            nodes.append(u'<tbody>%s</tbody>' % RESULTS_STREAM_MARKER)
+        else:
+            nodes.append(render_result_body(context['results'], row_block))
+
     @inclusion_tag('xadmin/includes/pagination.html')
     def block_pagination(self, context, nodes, page_type='normal'):
         """
@@ -621,6 +889,13 @@ class ListAdminView(ModelAdminView):
             not self.show_all or not self.can_show_all) and self.multi_page
         if not pagination_required:
             page_range = []
+        elif self.result_count is None:
+            # Without the total, link the previous pages and the next one
+            start = max(page_num - {'normal': 5, 'small': 3}.get(page_type, 3), 0)
+            page_range = [0, DOT] if start > 1 else list(range(start))
+            page_range.extend(range(start, page_num + 1))
+            if self.has_more:
+                page_range.append(page_num + 1)
         else:
             ON_EACH_SIDE = {'normal': 5, 'small': 3}.get(page_type, 3)
             ON_ENDS = 2